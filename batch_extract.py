@@ -0,0 +1,345 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+
+from engines import MemoryExtractor
+from memory_store import MemoryStore
+from prompt_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# (sequence number, user id, messages) - the unit of work and of checkpointing
+Unit = Tuple[int, str, List[Dict]]
+
+
+def read_jsonl(path: str) -> Iterator[Tuple[str, Iterator[Dict]]]:
+    """Stream (user_id, messages) from a JSON-lines file.
+
+    Lines are either one message ``{"user_id", "role", "content"}`` (grouped by user, e.g. sorted)
+    or one whole user ``{"user_id", "conversations": [...]}``.
+    """
+    def records():
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+    for user_id, group in itertools.groupby(records(), key=lambda record: record["user_id"]):
+        yield user_id, (message for record in group
+                        for message in record.get("conversations", [record]))
+
+
+def read_sqlite(path: str, table: str = "messages") -> Iterator[Tuple[str, Iterator[Dict]]]:
+    """Stream (user_id, messages) from a table with user_id, role, content columns, in insertion order"""
+    conn = sqlite3.connect(path)
+    try:
+        # An index on (user_id, id) keeps this ordered scan from sorting the whole table
+        rows = conn.execute(f"SELECT user_id, role, content FROM {table} ORDER BY user_id, rowid")
+        for user_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+            yield user_id, ({"role": role, "content": content} for _, role, content in group)
+    finally:
+        conn.close()
+
+
+def open_source(path: str, table: str = "messages") -> Iterator[Tuple[str, Iterator[Dict]]]:
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return read_sqlite(path, table)
+    return read_jsonl(path)
+
+
+def jsonl_writer(path: str) -> Generator[None, Optional[Dict], None]:
+    """Primed generator that appends each record sent to it; send None to flush to disk"""
+    with open(path, "a", encoding="utf-8") as handle:
+        while True:
+            record = yield
+            if record is None:
+                handle.flush()
+                os.fsync(handle.fileno())
+            else:
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class Checkpoint:
+    """Finished sequence numbers, stored as a contiguous watermark plus the few finished beyond it.
+
+    Failed units count as finished, so the watermark moves past them, but are also listed in
+    ``failed``: a rerun retries them, and the state stays as small as the number of failures.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.watermark = -1
+        self.done = set()
+        self.failed = set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                state = json.load(handle)
+            self.watermark = state["watermark"]
+            self.done = set(state["done"])
+            self.failed = set(state.get("failed", []))
+
+    def is_done(self, seq: int) -> bool:
+        return (seq <= self.watermark or seq in self.done) and seq not in self.failed
+
+    def mark(self, seq: int, failed: bool = False):
+        if failed:
+            self.failed.add(seq)
+        else:
+            self.failed.discard(seq)
+        if seq > self.watermark:
+            self.done.add(seq)
+        while self.watermark + 1 in self.done:
+            self.watermark += 1
+            self.done.discard(self.watermark)
+
+    def save(self):
+        if not self.path:
+            return
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done), "failed": sorted(self.failed)}, handle)
+        os.replace(tmp_path, self.path)
+
+
+class BatchExtractionPipeline:
+    """Re-extracts memories for many users with bounded concurrency, packing short transcripts together.
+
+    Memory use is independent of input size: input is streamed, at most ``max_pending`` batches are
+    held at once, and results are written out as they complete. Progress is checkpointed by unit
+    sequence number, so a rerun with the same input and checkpoint skips finished work and retries
+    units whose extraction failed.
+
+    With a store, each user's memories are replaced by the results of all their units once every
+    unit has succeeded (a re-extraction supersedes what older prompts produced), and only then are
+    those units checkpointed, so a resumed run never adds the same results twice.
+    """
+
+    MAX_TRANSCRIPTS_PER_REQUEST = 8
+
+    def __init__(self, extractor: MemoryExtractor, store: Optional[MemoryStore] = None,
+                 concurrency: int = 4, max_batch_tokens: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None, checkpoint_every: int = 50):
+        self.extractor = extractor
+        # Each user's memories in this store are replaced by the new results, when given
+        self.store = store
+        self.concurrency = concurrency
+        self.max_batch_tokens = max_batch_tokens or extractor.PROMPT_BUDGETS["history"]
+        self.max_pending = concurrency * 4
+        # Do not run further ahead of the oldest unfinished unit than this, so the checkpoint stays small
+        self.max_lookahead = self.max_pending * self.MAX_TRANSCRIPTS_PER_REQUEST * 4
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.checkpoint_every = checkpoint_every
+        self.stats = {"users": 0, "units": 0, "skipped": 0, "requests": 0, "packed_requests": 0,
+                      "retried_singly": 0, "failed": 0, "stored_users": 0}
+        self._lock = threading.Lock()
+        # Store mode: user_id -> records of the user's units still being collected (see _gather)
+        self._users: Dict[str, Dict] = {}
+
+    def units(self, source: Iterable[Tuple[str, Iterable[Dict]]]) -> Iterator[Tuple[Unit, int, bool]]:
+        """Split each user's messages into transcripts of at most ``max_batch_tokens``, with token counts
+        and whether the unit is the user's last"""
+        seq = 0
+        for user_id, messages in source:
+            self.stats["users"] += 1
+            window, window_tokens = [], 0
+            for message in messages:
+                tokens = count_tokens(self._line(message), self.extractor.deployment) + 1
+                if window and window_tokens + tokens > self.max_batch_tokens:
+                    yield (seq, user_id, window), window_tokens, False
+                    seq += 1
+                    window, window_tokens = [], 0
+                window.append(message)
+                window_tokens += tokens
+            if window:
+                yield (seq, user_id, window), window_tokens, True
+                seq += 1
+
+    def batches(self, units: Iterable[Tuple[Unit, int, bool]]) -> Iterator[List[Unit]]:
+        """Greedily pack consecutive unfinished units into requests within the token budget"""
+        batch, batch_tokens = [], 0
+        for unit, tokens, last in units:
+            self.stats["units"] += 1
+            done = self.checkpoint.is_done(unit[0])
+            if self.store is not None:
+                self._expect(unit[1], last, count=not done)
+            if done:
+                self.stats["skipped"] += 1
+                continue
+            if batch and (batch_tokens + tokens > self.max_batch_tokens
+                          or len(batch) >= self.MAX_TRANSCRIPTS_PER_REQUEST):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(unit)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def run(self, source: Iterable[Tuple[str, Iterable[Dict]]], writer: Optional[Generator] = None) -> Dict:
+        """Process the whole source; each finished unit is sent to ``writer`` as a JSON-able record"""
+        if writer is not None:
+            next(writer)
+        completed = 0
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for batch in self.batches(self.units(source)):
+                while pending and (len(pending) >= self.max_pending
+                                   or batch[0][0] - self.checkpoint.watermark > self.max_lookahead):
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    completed += self._collect(done, writer)
+                pending.add(pool.submit(self._process, batch))
+                completed = self._maybe_checkpoint(completed, writer)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                completed += self._collect(done, writer)
+
+        self._save(writer)
+        if writer is not None:
+            writer.close()
+        self.stats["seconds"] = round(time.perf_counter() - started, 3)
+        return dict(self.stats)
+
+    def _process(self, batch: List[Unit]) -> List[Dict]:
+        """Run one request (packed when the batch has several units); returns one record per unit"""
+        results: Dict[int, Dict] = {}
+        if len(batch) > 1:
+            self._count("packed_requests")
+            try:
+                packed = self.extractor.extract_packed(
+                    {str(seq): self.extractor._format_conversation(messages) for seq, _, messages in batch})
+                results = {int(tid): memories for tid, memories in packed.items()}
+            except Exception as e:
+                logger.warning("Packed extraction failed (%s). Retrying transcripts one by one.", e)
+            self._count("requests")
+
+        records = []
+        for seq, user_id, messages in batch:
+            memories = results.get(seq)
+            if memories is None:
+                if len(batch) > 1:
+                    self._count("retried_singly")
+                self._count("requests")
+                try:
+                    memories = self.extractor._request_extraction(self.extractor._format_conversation(messages))
+                except Exception as e:
+                    logger.warning("Extraction failed for %s (unit %d): %s", user_id, seq, e)
+                    records.append({"seq": seq, "user_id": user_id, "error": str(e)})
+                    continue
+            records.append({"seq": seq, "user_id": user_id, "memories": memories})
+        return records
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _collect(self, futures, writer) -> int:
+        count = 0
+        for future in futures:
+            for record in future.result():
+                if writer is not None:
+                    writer.send(record)
+                failed = "error" in record
+                if failed:
+                    self.stats["failed"] += 1
+                if self.store is not None:
+                    self._gather(record)
+                else:
+                    # Failed units are listed in the checkpoint, so a rerun retries them
+                    self.checkpoint.mark(record["seq"], failed)
+                count += 1
+        return count
+
+    def _expect(self, user_id: str, last: bool, count: bool):
+        """Store mode: note one more unit of the user to wait for (``count``) and whether all are known"""
+        state = self._users.setdefault(user_id, {"expected": 0, "records": [], "complete": False})
+        if count:
+            state["expected"] += 1
+        state["complete"] = last
+        if last:
+            self._flush_user(user_id)
+
+    def _gather(self, record: Dict):
+        self._users[record["user_id"]]["records"].append(record)
+        self._flush_user(record["user_id"])
+
+    def _flush_user(self, user_id: str):
+        """Once every unit of the user is back, replace their memories and checkpoint the units"""
+        state = self._users[user_id]
+        if not state["complete"] or len(state["records"]) < state["expected"]:
+            return
+        del self._users[user_id]
+        records = sorted(state["records"], key=lambda record: record["seq"])
+        failed = any("error" in record for record in records)
+        if records and not failed:
+            memories: Dict[str, List[str]] = {}
+            for record in records:
+                for category, items in record["memories"].items():
+                    memories.setdefault(category, []).extend(items)
+            self.store.replace(user_id, memories)
+            self.stats["stored_users"] += 1
+        # A failed unit fails the whole user: a rerun re-extracts all of it and replaces it in one go
+        for record in records:
+            self.checkpoint.mark(record["seq"], failed)
+
+    def _maybe_checkpoint(self, completed: int, writer) -> int:
+        if completed >= self.checkpoint_every:
+            self._save(writer)
+            return 0
+        return completed
+
+    def _save(self, writer):
+        # Output reaches disk before the checkpoint claims it, so a crash can only repeat work
+        if writer is not None:
+            writer.send(None)
+        self.checkpoint.save()
+
+    @staticmethod
+    def _line(message: Dict) -> str:
+        return f"{'User' if message['role'] == 'user' else 'Bot'}: {message['content']}"
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Backfill memories for every user in a conversation dump")
+    parser.add_argument("--input", required=True, help="JSON-lines file or SQLite database (.db/.sqlite)")
+    parser.add_argument("--table", default="messages", help="SQLite table with user_id, role, content")
+    parser.add_argument("--output", required=True, help="JSON-lines file results are appended to")
+    parser.add_argument("--checkpoint", help="progress file; resume with the same input and --max-batch-tokens")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-batch-tokens", type=int, help="transcript tokens per request")
+    parser.add_argument("--store", action="store_true", help="also replace each user's memories in MEMORY_DB_PATH")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake backend (dry run)")
+    args = parser.parse_args(argv)
+
+    from companion import CompanionServices
+    services = CompanionServices()
+    if args.fake:
+        from fake_llm import FakeChatBackend, FakeChatClient
+        client = FakeChatClient(FakeChatBackend(latency_ms=20, tokens_per_second=2000))
+    else:
+        client = services.client
+        if client is None:
+            parser.error(services.client_error or "Azure OpenAI client unavailable")
+
+    extractor = MemoryExtractor(client, services.deployment, metrics=services.metrics)
+    pipeline = BatchExtractionPipeline(extractor, services.store if args.store else None,
+                                       concurrency=args.concurrency, max_batch_tokens=args.max_batch_tokens,
+                                       checkpoint_path=args.checkpoint)
+    stats = pipeline.run(open_source(args.input, args.table), jsonl_writer(args.output))
+    print(json.dumps(stats, indent=2))
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
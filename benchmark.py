@@ -0,0 +1,195 @@
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from engines import SAMPLE_CONVERSATIONS, MemoryExtractor, PersonalityEngine
+from fake_llm import FakeChatBackend, FakeChatClient, FakeChatServer, synthetic_conversations
+from llm_cache import ResponseCache
+from llm_client import HedgedClient, ResilientClient, build_azure_client
+from memory_store import InMemoryMemoryStore
+from metrics import MetricsRegistry, percentile
+
+BENCH_MESSAGES = [
+    "I'm feeling really overwhelmed with everything. Don't know where to start.",
+    "I failed my mock test again. I'm thinking maybe engineering isn't for me.",
+    "My parents keep comparing me with my cousin.",
+    "Can't sleep before exams, what should I do?",
+    "My girlfriend says I never have time for her.",
+]
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run_extraction(extractor: MemoryExtractor, users: int, turns: int, step: int, concurrency: int) -> Dict:
+    """Each user's history grows by ``step`` messages at a time, with incremental extraction after each step"""
+    per_step: List[float] = []
+    failed = 0
+
+    def replay(user_index: int):
+        conversation = synthetic_conversations(SAMPLE_CONVERSATIONS, turns, variant=user_index)
+        timings, failures = [], 0
+        for end in range(step, turns + 1, step):
+            start = time.perf_counter()
+            try:
+                extractor.extract_incremental(f"bench-user-{user_index}", conversation[:end])
+            except Exception:
+                # Retries exhausted; the next step picks up the unextracted turns
+                failures += 1
+            timings.append(time.perf_counter() - start)
+        return timings, failures
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for timings, failures in pool.map(replay, range(users)):
+            per_step.extend(timings)
+            failed += failures
+    elapsed = time.perf_counter() - started
+
+    return {"wall_seconds": round(elapsed, 3), "steps_per_second": round(len(per_step) / elapsed, 2),
+            "failed_steps": failed, "latency": latency_stats(per_step)}
+
+
+def run_generation(engine: PersonalityEngine, users: int, requests: int, concurrency: int, seed: int) -> Dict:
+    """Mixed blocking and streaming persona replies over a small message pool (so the cache sees repeats)"""
+    rng = random.Random(seed)
+    personalities = list(PersonalityEngine.PERSONALITIES)
+    jobs = [(rng.choice(BENCH_MESSAGES), rng.choice(personalities), index % 2 == 0)
+            for index in range(users * requests)]
+    latencies: List[float] = []
+    ttfts: List[float] = []
+
+    def call(job):
+        message, personality, stream = job
+        start = time.perf_counter()
+        if not stream:
+            engine.generate_response(message, personality)
+            return time.perf_counter() - start, None
+        first = None
+        for _ in engine.generate_response_stream(message, personality):
+            if first is None:
+                first = time.perf_counter() - start
+        return time.perf_counter() - start, first
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, ttft in pool.map(call, jobs):
+            latencies.append(latency)
+            if ttft is not None:
+                ttfts.append(ttft)
+    elapsed = time.perf_counter() - started
+
+    return {"wall_seconds": round(elapsed, 3), "requests_per_second": round(len(jobs) / elapsed, 2),
+            "latency": latency_stats(latencies), "ttft": latency_stats(ttfts)}
+
+
+def token_totals(registry: MetricsRegistry) -> Dict[str, int]:
+    totals = {"prompt_tokens": 0, "completion_tokens": 0}
+    for stats in registry.summary().values():
+        totals["prompt_tokens"] += stats["prompt_tokens"]
+        totals["completion_tokens"] += stats["completion_tokens"]
+    return totals
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Offline benchmark for MemoryExtractor and PersonalityEngine")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=120, help="messages per synthetic user")
+    parser.add_argument("--step", type=int, default=6, help="new messages per incremental extraction")
+    parser.add_argument("--requests", type=int, default=10, help="persona replies per user")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--hedge", action="store_true", help="send a hedged request when the first is slow")
+    parser.add_argument("--hedge-percentile", type=float, default=95.0)
+    parser.add_argument("--transport", choices=("inject", "http"), default="inject",
+                        help="inject the fake client directly or go through the real SDK to a local fake server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    backend = FakeChatBackend(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                              tokens_per_second=args.tokens_per_second, error_rate=args.error_rate, seed=args.seed)
+    registry = MetricsRegistry()
+    server = None
+    if args.transport == "http":
+        server = FakeChatServer(backend).start()
+        client = build_azure_client("fake-key", server.endpoint, "2024-02-15-preview",
+                                    backoff_base=0.05, metrics=registry)
+    else:
+        client = ResilientClient(FakeChatClient(backend), backoff_base=0.05, metrics=registry)
+    resilient = client
+    if args.hedge:
+        client = HedgedClient(client, hedge_percentile=args.hedge_percentile,
+                              initial_delay=args.latency_ms * 3 / 1000.0, metrics=registry)
+
+    cache = None if args.no_cache else ResponseCache(max_entries=4096)
+    extractor = MemoryExtractor(client, "gpt-4", InMemoryMemoryStore(), cache, metrics=registry)
+    engine = PersonalityEngine(client, "gpt-4", cache, metrics=registry)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        extraction = run_extraction(extractor, args.users, args.turns, args.step, args.concurrency)
+        generation = run_generation(engine, args.users, args.requests, args.concurrency, args.seed)
+    finally:
+        if server is not None:
+            server.stop()
+    elapsed = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tokens = token_totals(registry)
+    report = {
+        "version": git_revision(),
+        "config": vars(args),
+        "extraction": extraction,
+        "generation": generation,
+        "tokens": dict(tokens, completion_tokens_per_second=round(tokens["completion_tokens"] / elapsed, 1)),
+        "cache": cache.stats() if cache is not None else None,
+        "client": dict(resilient.counters),
+        "hedging": dict(client.counters) if args.hedge else None,
+        "fallback_extractions": registry.counters.get("fallback_extractions_total", 0),
+        "backend_calls": backend.calls,
+        "memory": {
+            "python_peak_mb": round(peak_bytes / 2 ** 20, 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        },
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
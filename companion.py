@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from consolidation import MemoryConsolidator
+from engines import MemoryExtractor, PersonalityEngine
+from extraction_worker import ExtractionWorker
+from llm_cache import ResponseCache
+from llm_client import HedgedClient, build_azure_client
+from memory_graph import MemoryGraphIndex
+from memory_store import MemoryStore, SQLiteMemoryStore
+from metrics import JsonLinesExporter, MetricsRegistry, get_metrics
+from routing import ModelRouter
+from rule_extractor import RuleBasedExtractor
+from sessions import SessionManager
+from summarizer import ConversationSummarizer
+
+if TYPE_CHECKING:
+    from retrieval import MemoryRetriever
+
+logger = logging.getLogger(__name__)
+
+
+class CompanionServices:
+    """Process-wide engines and shared resources, configured from the environment and built on first use.
+
+    The Streamlit app and the HTTP service both hold one instance per process, so caches, the memory
+    store, the extraction worker and the HTTP connection pool are shared by every session.
+    """
+
+    def __init__(self, env: Optional[Dict[str, str]] = None, client=None):
+        if env is None:
+            # Every entry point (Streamlit, uvicorn, batch_extract.py) is configured through .env;
+            # variables already set in the environment take precedence
+            from dotenv import load_dotenv
+            load_dotenv()
+        self.env = env if env is not None else os.environ
+        self.client_error: Optional[str] = None
+        self._resources: Dict[str, object] = {}
+        if client is not None:
+            # Prebuilt client, e.g. a fake backend for benchmarks and startup probes
+            self._resources["client"] = client
+        # Re-entrant because building one resource can build its dependencies
+        self._lock = threading.RLock()
+
+    def _resource(self, name: str, factory: Callable[[], object]):
+        """Build a shared resource once, even when several sessions ask for it concurrently"""
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    @property
+    def deployment(self) -> str:
+        return self.env.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4")
+
+    @property
+    def metrics(self) -> MetricsRegistry:
+        """LLM metrics; METRICS_JSONL_PATH additionally appends every call to a JSON-lines file"""
+        return self._resource("metrics", self._build_metrics)
+
+    @property
+    def client(self):
+        """Azure OpenAI client with connection pooling, retries and rate limiting; None if it cannot be built"""
+        return self._resource("client", self._build_client)
+
+    @property
+    def store(self) -> MemoryStore:
+        """Persistent memory store (SQLite file, opened lazily on first access) that consolidates on every update"""
+        return self._resource("store", self._build_store)
+
+    @property
+    def retriever(self) -> "MemoryRetriever":
+        """Relevance ranker for memory context; Azure embeddings when a deployment is configured, else offline hashing"""
+        return self._resource("retriever", self._build_retriever)
+
+    @property
+    def cache(self) -> ResponseCache:
+        """LLM response cache; RESPONSE_CACHE_PATH adds a disk tier shared by all workers"""
+        return self._resource("cache", self._build_cache)
+
+    @property
+    def router(self) -> ModelRouter:
+        """Deployment per task and prompt size (AZURE_OPENAI_<TASK>_DEPLOYMENT, AZURE_OPENAI_LARGE_DEPLOYMENT)"""
+        return self._resource("router", lambda: ModelRouter.from_env(self.env, self.deployment, self.metrics))
+
+    @property
+    def extractor(self) -> MemoryExtractor:
+        """Memory extractor; LOCAL_EXTRACTION=1 lets local rules answer first"""
+        return self._resource("extractor", lambda: MemoryExtractor(
+            self.client, self.deployment, self.store, self.cache, metrics=self.metrics, router=self.router,
+            local_extractor=self._build_local_extractor()))
+
+    @property
+    def engine(self) -> PersonalityEngine:
+        return self._resource("engine", lambda: PersonalityEngine(
+            self.client, self.deployment, self.cache, metrics=self.metrics, router=self.router))
+
+    @property
+    def summarizer(self) -> ConversationSummarizer:
+        return self._resource("summarizer", lambda: ConversationSummarizer(
+            self.client, self.deployment, self.store, self.cache, metrics=self.metrics, router=self.router))
+
+    @property
+    def worker(self) -> ExtractionWorker:
+        """Background extraction queue; publishes memories and rolling summaries to the memory store"""
+        return self._resource("worker", lambda: ExtractionWorker(
+            self.extractor, max_workers=int(self.env.get("EXTRACTION_WORKERS", "2")), summarizer=self.summarizer,
+            on_result=self.publish_memories))
+
+    @property
+    def sessions(self) -> SessionManager:
+        """Per-user conversation history under SESSION_MAX_MB, spilled to the store on eviction"""
+        return self._resource("sessions", self._build_sessions)
+
+    @property
+    def graph(self) -> MemoryGraphIndex:
+        """Per-user graph linking memories through the entities they mention, for multi-hop context"""
+        return self._resource("graph", lambda: MemoryGraphIndex(
+            k=int(self.env.get("MEMORY_GRAPH_ITEMS", "4")), max_depth=int(self.env.get("MEMORY_GRAPH_DEPTH", "3"))))
+
+    def memory_context(self, user_id: str, message: str, conversations: Optional[List[Dict]] = None,
+                       append_only: bool = False) -> str:
+        """Context string for a reply: queue extraction of unseen turns, then rank what is stored now"""
+        if conversations:
+            self.worker.submit(user_id, conversations, append_only=append_only)
+        # Read from the shared store: extractions and edits handled by other workers land there
+        memories = self.store.get(user_id)
+        # Memories linked to what the message mentions go first; embedding similarity fills the rest
+        related = self.graph.related(user_id, message, memories)
+        return self.retriever.build_context(user_id, memories, message, related=related)
+
+    def warm_up(self):
+        """Build engines and load the tokenizer and retriever ahead of the first request (e.g. in a thread)"""
+        from prompt_budget import get_encoding
+
+        self.engine
+        self.extractor
+        self.retriever.embedder(["warm up"])
+        get_encoding(self.deployment)
+
+    def close(self):
+        """Persist unsaved session turns; resources never built are left alone"""
+        sessions = self._resources.get("sessions")
+        if sessions is not None:
+            sessions.flush()
+
+    def publish_memories(self, user_id: str, memories: Dict):
+        """New memories for a user (extraction result or manual edit): update the graph ahead of the next reply"""
+        self.graph.sync(user_id, memories)
+
+    def _forget_user(self, user_id: str):
+        """Evicted from the session manager: drop derived per-user state in resources already built"""
+        for name in ("retriever", "worker", "graph"):
+            resource = self._resources.get(name)
+            if resource is not None:
+                resource.forget(user_id)
+
+    def history_block(self, user_id: str, conversations: List[Dict]) -> str:
+        """Fixed-size conversation history for a reply; summaries are refreshed by the extraction worker"""
+        return self.summarizer.history_block(user_id, conversations)
+
+    def _build_metrics(self) -> MetricsRegistry:
+        registry = get_metrics()
+        jsonl_path = self.env.get("METRICS_JSONL_PATH")
+        if jsonl_path:
+            registry.add_exporter(JsonLinesExporter(jsonl_path))
+        return registry
+
+    def _build_client(self):
+        try:
+            rpm = self.env.get("AZURE_OPENAI_RPM")
+            tpm = self.env.get("AZURE_OPENAI_TPM")
+            api_version = self.env.get("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+            client = build_azure_client(
+                api_key=self.env.get("AZURE_OPENAI_API_KEY"),
+                api_version=api_version,
+                azure_endpoint=self.env.get("AZURE_OPENAI_ENDPOINT"),
+                requests_per_minute=float(rpm) if rpm else None,
+                tokens_per_minute=float(tpm) if tpm else None,
+                metrics=self.metrics
+            )
+            if self.env.get("AZURE_OPENAI_HEDGE", "0") != "1":
+                return client
+
+            # Hedge to a second resource (e.g. another region) if configured, else to the same one
+            secondary = None
+            if self.env.get("AZURE_OPENAI_HEDGE_ENDPOINT"):
+                secondary = build_azure_client(
+                    api_key=self.env.get("AZURE_OPENAI_HEDGE_API_KEY", self.env.get("AZURE_OPENAI_API_KEY")),
+                    api_version=api_version,
+                    azure_endpoint=self.env.get("AZURE_OPENAI_HEDGE_ENDPOINT"),
+                    metrics=self.metrics
+                )
+            deadline = self.env.get("AZURE_OPENAI_DEADLINE")
+            return HedgedClient(
+                client, secondary,
+                secondary_deployment=self.env.get("AZURE_OPENAI_HEDGE_DEPLOYMENT"),
+                hedge_percentile=float(self.env.get("AZURE_OPENAI_HEDGE_PERCENTILE", "95")),
+                deadline=float(deadline) if deadline else None,
+                metrics=self.metrics
+            )
+        except Exception as e:
+            logger.error("Error initializing Azure Client: %s", e)
+            self.client_error = str(e)
+            return None
+
+    def _build_sessions(self) -> SessionManager:
+        max_users = self.env.get("SESSION_MAX_USERS")
+        idle_seconds = float(self.env.get("SESSION_IDLE_SECONDS", "1800"))
+        return SessionManager(
+            self.store,
+            max_bytes=int(float(self.env.get("SESSION_MAX_MB", "256")) * 1024 * 1024),
+            max_sessions=int(max_users) if max_users else None,
+            idle_seconds=idle_seconds or None,
+            metrics=self.metrics,
+            on_evict=self._forget_user
+        )
+
+    def _build_local_extractor(self) -> Optional[RuleBasedExtractor]:
+        # Opt-in: windows the rules claim never reach the LLM, and the cursor moves past them for good
+        if self.env.get("LOCAL_EXTRACTION", "0") != "1":
+            return None
+        return RuleBasedExtractor(confidence_threshold=float(self.env.get("LOCAL_EXTRACTION_CONFIDENCE", "0.75")))
+
+    def _build_store(self) -> MemoryStore:
+        # Paraphrase merging needs real embeddings; offline, near-duplicates are found by token overlap
+        semantic = self.env.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT") and self.client is not None
+        max_items = int(self.env.get("MEMORY_MAX_ITEMS", "40"))
+        consolidator = MemoryConsolidator(
+            embedder=self.retriever.embedder if semantic else None,
+            half_life_days=float(self.env.get("MEMORY_HALF_LIFE_DAYS", "30")) or None,
+            max_items=max_items or None
+        )
+        return SQLiteMemoryStore(self.env.get("MEMORY_DB_PATH", "memory.db"), consolidator)
+
+    def _build_retriever(self) -> "MemoryRetriever":
+        # Imported here: retrieval needs numpy, which dominates import time
+        from retrieval import AzureEmbedder, HashingEmbedder, MemoryRetriever
+
+        embedding_deployment = self.env.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+        if embedding_deployment and self.client is not None:
+            return MemoryRetriever(AzureEmbedder(self.client, embedding_deployment))
+        return MemoryRetriever(HashingEmbedder())
+
+    def _build_cache(self) -> ResponseCache:
+        # RESPONSE_CACHE_SEMANTIC=1 also serves near-duplicate messages
+        semantic = self.env.get("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+        return ResponseCache(
+            max_entries=int(self.env.get("RESPONSE_CACHE_SIZE", "512")),
+            ttl_seconds=float(self.env.get("RESPONSE_CACHE_TTL", "3600")),
+            disk_path=self.env.get("RESPONSE_CACHE_PATH"),
+            embedder=self.retriever.embedder if semantic else None
+        )
@@ -0,0 +1,207 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+STOPWORDS = frozenset("""
+a an the and or but of for to in on at by with from about into over after before is are was were be been
+being has have had do does did not no very really so too just his her their my your its this that these
+those who which when while than then also some any more most much many high highly
+""".split())
+
+SUFFIXES = ("ations", "ation", "ings", "ing", "ies", "ied", "ed", "es", "ly", "s")
+
+
+def _stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            # "stress", "class", "focus" are not plurals
+            if suffix == "s" and word.endswith(("ss", "us")):
+                return word
+            return word[:-len(suffix)]
+    return word
+
+
+def content_tokens(text: str) -> frozenset:
+    """Stemmed content words, the basis for string similarity"""
+    return frozenset(_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS)
+
+
+def token_similarity(a: frozenset, b: frozenset) -> float:
+    """Dice coefficient of two token sets"""
+    if not a or not b:
+        return 0.0
+    return 2.0 * len(a & b) / (len(a) + len(b))
+
+
+class MemoryItem:
+    """A consolidated memory with how often it was extracted and when it was last seen"""
+
+    __slots__ = ("key", "text", "occurrences", "last_seen")
+
+    def __init__(self, key: str, text: str, occurrences: int = 1, last_seen: Optional[float] = None):
+        self.key = key
+        self.text = text
+        self.occurrences = occurrences
+        self.last_seen = last_seen if last_seen is not None else time.time()
+
+    def to_dict(self) -> Dict:
+        return {"text": self.text, "occurrences": self.occurrences, "last_seen": self.last_seen}
+
+
+class ConsolidationPlan:
+    """Changes for one category: occurrence increments on existing keys, new items (with their final
+    counts, including repeats within the same batch) and evicted keys"""
+
+    __slots__ = ("merged", "added", "evicted")
+
+    def __init__(self):
+        self.merged: Dict[str, int] = {}
+        self.added: List[MemoryItem] = []
+        self.evicted: List[str] = []
+
+
+class MemoryConsolidator:
+    """Merges near-duplicate memories and evicts stale ones, incrementally on each update.
+
+    Near-duplicates are found by stemmed token overlap and, when an embedder is given, by cosine
+    similarity of embeddings (catches paraphrases such as "exam stress" / "exam-related anxiety").
+    The existing text is kept as the representative so retrieval and cache keys stay stable.
+    Each item's weight is its occurrence count halved every ``half_life_days`` since it was last
+    seen; items below ``min_weight`` are evicted, as are the lightest beyond ``max_items``.
+    """
+
+    def __init__(self, embedder: Optional[Callable[[Sequence[str]], "np.ndarray"]] = None,
+                 token_threshold: float = 0.75, embedding_threshold: float = 0.85,
+                 half_life_days: Optional[float] = 30.0, min_weight: float = 0.05,
+                 max_items: Optional[int] = 40, max_cached_vectors: int = 10000):
+        self.embedder = embedder
+        self.token_threshold = token_threshold
+        self.embedding_threshold = embedding_threshold
+        self.half_life = half_life_days * 86400.0 if half_life_days else None
+        self.min_weight = min_weight
+        self.max_items = max_items
+        self.max_cached_vectors = max_cached_vectors
+        self._tokens: Dict[str, frozenset] = {}
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def weight(self, item: MemoryItem, now: float) -> float:
+        if self.half_life is None:
+            return float(item.occurrences)
+        return item.occurrences * 0.5 ** (max(0.0, now - item.last_seen) / self.half_life)
+
+    def prepare(self, texts: Sequence[str]):
+        """Embed texts ahead of ``plan``, so the embedder (often a network call) runs without any lock held.
+
+        Callers pass the incoming and existing texts before taking their own locks; ``plan`` then finds
+        the vectors cached and only embeds what changed in between.
+        """
+        if self.embedder is None:
+            return
+        with self._lock:
+            missing = [text for text in dict.fromkeys(texts) if text not in self._vectors]
+        if missing:
+            vectors = self.embedder(missing)
+            with self._lock:
+                self._cache_vectors(missing, vectors)
+
+    def plan(self, existing: List[MemoryItem], incoming: List[Tuple[str, str]],
+             now: Optional[float] = None) -> ConsolidationPlan:
+        """Fold (key, text) items into a category's existing items (updated in place); returns the changes to apply"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            return self._plan(existing, incoming, now)
+
+    def _plan(self, existing: List[MemoryItem], incoming: List[Tuple[str, str]], now: float) -> ConsolidationPlan:
+        plan = ConsolidationPlan()
+        items = {item.key: item for item in existing}
+        added = set()
+        vectors = self._embed([text for _, text in incoming]) if self.embedder is not None and incoming else None
+
+        for index, (key, text) in enumerate(incoming):
+            target = key if key in items else self._match(items.values(), text,
+                                                          None if vectors is None else vectors[index])
+            if target is not None:
+                if target not in added:
+                    plan.merged[target] = plan.merged.get(target, 0) + 1
+                items[target].occurrences += 1
+                items[target].last_seen = now
+                continue
+            item = MemoryItem(key, text, 1, now)
+            items[key] = item
+            added.add(key)
+            plan.added.append(item)
+
+        plan.evicted = self._evictions(list(items.values()), now)
+        evicted = set(plan.evicted)
+        plan.added = [item for item in plan.added if item.key not in evicted]
+        for key in evicted:
+            plan.merged.pop(key, None)
+        return plan
+
+    def _match(self, candidates, text: str, vector: Optional["np.ndarray"]) -> Optional[str]:
+        tokens = self._token_set(text)
+        best_key, best_score = None, 0.0
+        for item in candidates:
+            score = token_similarity(tokens, self._token_set(item.text))
+            if score >= self.token_threshold and score > best_score:
+                best_key, best_score = item.key, score
+        if best_key is not None or vector is None:
+            return best_key
+
+        candidates = list(candidates)
+        if not candidates:
+            return None
+        import numpy as np
+
+        matrix = self._embed([item.text for item in candidates])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return candidates[best].key if scores[best] >= self.embedding_threshold else None
+
+    def _evictions(self, items: List[MemoryItem], now: float) -> List[str]:
+        weighted = sorted(items, key=lambda item: self.weight(item, now))
+        evicted = [item.key for item in weighted if self.weight(item, now) < self.min_weight]
+        if self.max_items is not None:
+            survivors = weighted[len(evicted):]
+            evicted.extend(item.key for item in survivors[:max(0, len(survivors) - self.max_items)])
+        return evicted
+
+    def _token_set(self, text: str) -> frozenset:
+        tokens = self._tokens.get(text)
+        if tokens is None:
+            if len(self._tokens) >= self.max_cached_vectors:
+                self._tokens.clear()
+            tokens = self._tokens[text] = content_tokens(text)
+        return tokens
+
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        """Unit-length embeddings, computing only texts not seen recently; caller holds the lock"""
+        # numpy is only needed with an embedder, so it is not imported with the module
+        import numpy as np
+
+        missing = [text for text in dict.fromkeys(texts) if text not in self._vectors]
+        if missing:
+            self._cache_vectors(missing, self.embedder(missing))
+        for text in texts:
+            self._vectors.move_to_end(text)
+        result = np.array([self._vectors[text] for text in texts], dtype=np.float32)
+        while len(self._vectors) > self.max_cached_vectors:
+            self._vectors.popitem(last=False)
+        return result
+
+    def _cache_vectors(self, texts: List[str], vectors):
+        import numpy as np
+
+        for text, vector in zip(texts, vectors):
+            norm = np.linalg.norm(vector)
+            self._vectors[text] = vector / norm if norm else vector
+
+
+# Exact-key merging only: counts repeats, never evicts (stores use this when no consolidator is given)
+EXACT_CONSOLIDATOR = MemoryConsolidator(token_threshold=2.0, half_life_days=None, max_items=None)
@@ -0,0 +1,698 @@
+import hashlib
+import json
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+
+from json_stream import IncrementalJSONParser
+from llm_cache import ResponseCache, make_cache_key
+from memory_store import MEMORY_CATEGORIES, InMemoryMemoryStore, MemoryStore
+from metrics import MetricsRegistry, get_metrics, usage_tokens
+from personas import PersonaRegistry
+from prompt_budget import PromptAssembler, PromptPlan, PromptSection, count_message_tokens, count_tokens
+from routing import ModelRouter, Route
+from rule_extractor import RuleBasedExtractor
+
+logger = logging.getLogger(__name__)
+
+# Extraction streams (category, item) pairs as items close and returns the memories dict at the end
+MemoryStream = Generator[Tuple[str, str], None, Dict]
+
+
+def drain(stream: Generator, on_item=None):
+    """Run a generator to completion, passing each yielded value to ``on_item``; returns its return value"""
+    while True:
+        try:
+            item = next(stream)
+        except StopIteration as done:
+            return done.value
+        if on_item is not None:
+            on_item(item)
+
+
+# Sample Realistic Conversation Data (30 messages)
+SAMPLE_CONVERSATIONS = [
+    {"role": "user", "content": "Yaar, I'm so stressed about my JEE mains next month. Can't sleep properly."},
+    {"role": "assistant", "content": "Arre, exam stress bohot common hai. Neend kharab ho rahi hai kya? Tell me more."},
+    {"role": "user", "content": "Haan yaar, raat ko 2-3 baje tak padhta hoon phir subah 6 baje uthna padta hai."},
+    {"role": "assistant",
+     "content": "That's only 3-4 hours of sleep! Your brain needs rest to retain information. Have you tried a fixed sleep schedule?"},
+    {"role": "user", "content": "I tried but fir bhi darr lagta hai ki enough prep nahi ho raha."},
+    {"role": "assistant",
+     "content": "Anxiety makes you feel unprepared even when you've studied well. Kya tum mock tests de rahe ho?"},
+    {"role": "user", "content": "Haan, but scores inconsistent hai. Sometimes 180/300, sometimes 220/300."},
+    {"role": "assistant",
+     "content": "That actually shows you have the knowledge. Consistency will come with better rest and less panic."},
+    {"role": "user", "content": "My parents are also pressuring me for 250+ score. Unka kuch nahi ho sakta."},
+    {"role": "assistant",
+     "content": "Parent pressure is real. But remember, they want your success, not your suffering. Talk to them once?"},
+    {"role": "user",
+     "content": "Nahi yaar, they won't understand. Papa engineer hai, unhone first attempt mein crack kiya tha."},
+    {"role": "assistant", "content": "Their journey was different. Your effort is equally valid. Don't compare beta."},
+    {"role": "user", "content": "Sometimes I feel like giving up. Engineering ke alawa kuch nahi dikhta future mein."},
+    {"role": "assistant",
+     "content": "Feeling hopeless is a sign you're burned out. Take a day off - guilt free. Your mind needs it."},
+    {"role": "user", "content": "Break? Exam toh next month hai! How can I take break?"},
+    {"role": "assistant",
+     "content": "One day won't ruin your prep, but burnout will ruin your exam performance. Trust me on this."},
+    {"role": "user",
+     "content": "Okay maybe... Also, meri girlfriend hai, vo bhi upset hai because I don't give her time."},
+    {"role": "assistant",
+     "content": "Relationships during prep phase are tough. Have you explained your situation to her?"},
+    {"role": "user",
+     "content": "Haan but she thinks I'm avoiding her. We used to talk daily, ab 2-3 days mein ek baar."},
+    {"role": "assistant",
+     "content": "That's a valid concern from her side. Maybe schedule one fixed call per day? 15 minutes bhi enough hai."},
+    {"role": "user", "content": "Good idea. I'll try that. Thanks yaar."},
+    {"role": "assistant", "content": "Good! Small steps matter. Now tell me, what subjects are you weakest in?"},
+    {"role": "user", "content": "Physics is okay, Chemistry bhi manage ho jaati hai, but Maths... specially calculus."},
+    {"role": "assistant",
+     "content": "Calculus needs practice, not cramming. Do 10 problems daily instead of 50 weekly. Consistency > Intensity."},
+    {"role": "user", "content": "Hmm makes sense. I usually avoid it and then do marathon sessions on weekends."},
+    {"role": "assistant", "content": "Exactly! That's why it feels hard. Daily touch keeps concepts fresh."},
+    {"role": "user", "content": "Okay I'll try this new approach. Feeling slightly better after talking."},
+    {"role": "assistant", "content": "I'm glad! Remember - you're more prepared than you think. Believe in yourself."},
+    {"role": "user", "content": "Thanks didi. One last thing - kya meditation actually helps ya time waste hai?"},
+    {"role": "assistant",
+     "content": "Meditation = brain training. Even 5 minutes daily can reduce anxiety significantly. Try it!"},
+    {"role": "user", "content": "Okay will give it a shot. You've been really helpful today."},
+    {"role": "assistant", "content": "Always here for you beta. Now go, ace that prep! All the best! 💪"}
+]
+
+# The demo runs against a single sample user
+DEMO_USER_ID = "demo_user"
+
+
+class MemoryExtractor:
+    """Extracts meaningful patterns from user conversations"""
+
+    # Incremental mode: max new turns sent per request and size of the known-memory summary
+    WINDOW_SIZE = 12
+    SUMMARY_ITEMS = 8
+
+    # Token budgets for the known-memory summary and the transcript (oldest turns are cut first)
+    PROMPT_BUDGETS = {"memory": 300, "history": 2500}
+    MAX_PROMPT_TOKENS = 3200
+
+    # Pseudo-route for the local rule tier in the per-route counters
+    LOCAL_ROUTE = Route("local", "rules")
+
+    # Follow-up requests for the rest of an answer cut off at max_tokens
+    MAX_CONTINUATIONS = 1
+
+    def __init__(self, client, deployment_name, store: Optional[MemoryStore] = None,
+                 cache: Optional[ResponseCache] = None, assembler: Optional[PromptAssembler] = None,
+                 metrics: Optional[MetricsRegistry] = None, router: Optional[ModelRouter] = None,
+                 local_extractor: Optional[RuleBasedExtractor] = None, continue_truncated: bool = True):
+        self.client = client
+        self.deployment = deployment_name
+        # Holds extracted memories and the per-user extraction cursor
+        self.store = store if store is not None else InMemoryMemoryStore()
+        self.cache = cache
+        self.assembler = assembler or PromptAssembler(deployment_name, self.MAX_PROMPT_TOKENS)
+        self.metrics = metrics or get_metrics()
+        self.router = router or ModelRouter(deployment_name, metrics=self.metrics)
+        # Optional first tier; the LLM is only called when the rules are not confident
+        self.local_extractor = local_extractor
+        self.continue_truncated = continue_truncated
+
+    def extract_memories(self, conversations: List[Dict]) -> Dict:
+        """Extract preferences, emotions, and facts from conversations"""
+        return drain(self.stream_memories(conversations))
+
+    def stream_memories(self, conversations: List[Dict]) -> MemoryStream:
+        """Like extract_memories, but yields (category, item) as soon as each item closes in the output"""
+
+        try:
+            return (yield from self._stream_window(conversations))
+
+        except Exception as e:
+            # Fallback if API fails
+            logger.warning("Live extraction failed (%s). Using fallback data.", e)
+            fallback = self._fallback_extraction(conversations)
+            yield from _memory_items(fallback)
+            return fallback
+
+    def extract_incremental(self, user_id: str, conversations: List[Dict], append_only: bool = False) -> Dict:
+        """Extract memories only from turns not yet processed for this user and merge them into the store.
+
+        The cursor is stored with a digest of the turns before it, so a history that was replaced or
+        edited before the cursor starts over. ``append_only`` marks a history that only ever grows (a
+        server-side session): if it is shorter or differs, turns were lost rather than replaced, so
+        stored memories are kept and only the turns after the cursor are extracted.
+
+        Raises if a window fails: the windows before it are already stored and the rest are retried on
+        the next call. Only the offline demo user gets sample data instead.
+        """
+        return drain(self.stream_incremental(user_id, conversations, append_only))
+
+    def stream_incremental(self, user_id: str, conversations: List[Dict], append_only: bool = False) -> MemoryStream:
+        """Like extract_incremental, yielding new items as they arrive; the store is updated once per window"""
+
+        cursor = self.store.get_cursor(user_id)
+        # Extended window by window below, so the history is hashed once per call
+        prefix = _digest_turns(hashlib.sha1(), conversations[:cursor])
+        digest = self.store.get_cursor_digest(user_id)
+        # Cursors stored before digests were recorded are trusted once
+        replaced = cursor > len(conversations) or (digest is not None and digest != prefix.hexdigest())
+
+        if replaced:
+            if append_only:
+                logger.warning("History of %s does not match its extraction cursor (%d turns, cursor %d); "
+                               "keeping memories.", user_id, len(conversations), cursor)
+                cursor = min(cursor, len(conversations))
+                prefix = _digest_turns(hashlib.sha1(), conversations[:cursor])
+                self.store.set_cursor(user_id, cursor, prefix.hexdigest())
+            else:
+                # History was replaced, truncated or edited - start over
+                self.store.clear(user_id)
+                cursor = 0
+                prefix = hashlib.sha1()
+
+        memories = self.store.get(user_id)
+
+        while cursor < len(conversations):
+            window = conversations[cursor:cursor + self.WINDOW_SIZE]
+
+            try:
+                new_memories = yield from self._stream_window(window, known=self._summarize_memories(memories))
+            except Exception as e:
+                if user_id != DEMO_USER_ID:
+                    raise
+                logger.warning("Live extraction failed (%s). Will retry the remaining messages later.", e)
+                if not any(memories.values()):
+                    fallback = self._fallback_extraction(conversations[cursor:])
+                    yield from _memory_items(fallback)
+                    return fallback
+                break
+
+            memories = self.store.upsert(user_id, new_memories)
+            cursor += len(window)
+            self.store.set_cursor(user_id, cursor, _digest_turns(prefix, window).hexdigest())
+
+        return memories
+
+    def _stream_window(self, conversations: List[Dict], known: str = "") -> MemoryStream:
+        """Local rules first; the LLM only for windows they do not cover confidently"""
+        if self.local_extractor is not None:
+            start = time.perf_counter()
+            memories, confidence = self.local_extractor.extract(conversations)
+            if self.local_extractor.is_confident(confidence):
+                self.router.count("extract", self.LOCAL_ROUTE, "calls")
+                self.router.record("extract", self.LOCAL_ROUTE, time.perf_counter() - start,
+                                   items=sum(len(items) for items in memories.values()))
+                yield from _memory_items(memories)
+                return memories
+            self.router.count("extract", self.LOCAL_ROUTE, "escalations")
+        return (yield from self._stream_request_extraction(self._format_conversation(conversations), known))
+
+    def _request_extraction(self, conv_text: str, known: str = "") -> Dict:
+        """Send one extraction request and parse the JSON result"""
+        return drain(self._stream_request_extraction(conv_text, known))
+
+    def _stream_request_extraction(self, conv_text: str, known: str = "",
+                                   continuations: Optional[int] = None) -> MemoryStream:
+        """Stream one extraction request; an answer cut off at max_tokens keeps every completed item
+        and, if enabled, a follow-up request asks only for what was not extracted yet"""
+
+        result, truncated = yield from self._stream_json(self._extraction_prompt(conv_text, known), max_tokens=800)
+
+        continuations = self.MAX_CONTINUATIONS if continuations is None else continuations
+        if truncated and self.continue_truncated and continuations > 0:
+            self.metrics.increment("extraction_continuations_total")
+            # The items already received become known memories, so the model only lists the remainder
+            extracted = self._summarize_memories(result, limit=None)
+            try:
+                rest = yield from self._stream_request_extraction(
+                    conv_text, "\n".join(part for part in (extracted, known) if part), continuations - 1)
+            except Exception as e:
+                logger.warning("Continuation request failed (%s). Keeping the items extracted so far.", e)
+            else:
+                for category, items in rest.items():
+                    result.setdefault(category, []).extend(item for item in items if item not in result[category])
+        return result
+
+    def _extraction_prompt(self, conv_text: str, known: str = "") -> str:
+        """Extraction prompt for a transcript, with the known-memory summary if any"""
+
+        # Keep the transcript and known-memory summary within budget before formatting the prompt
+        plan = self.assembler.assemble([
+            PromptSection("memory", known, self.PROMPT_BUDGETS["memory"], priority=1),
+            PromptSection("history", conv_text, self.PROMPT_BUDGETS["history"], priority=0, keep="tail"),
+        ])
+        known, conv_text = plan.texts["memory"], plan.texts["history"]
+
+        known_section = ""
+        if known:
+            known_section = f"""
+        Already known about the user (do not repeat these, only list new or changed insights):
+        {known}
+        """
+
+        extraction_prompt = f"""Analyze the following conversation and extract:
+        1. USER PREFERENCES (likes, dislikes, interests, habits)
+        2. EMOTIONAL PATTERNS (stress triggers, anxiety sources, coping mechanisms)
+        3. IMPORTANT FACTS (relationships, goals, deadlines, challenges)
+        {known_section}
+        Conversation:
+        {conv_text}
+
+        Provide output in valid JSON format:
+        {{
+            "preferences": ["preference1", "preference2", ...],
+            "emotional_patterns": ["pattern1", "pattern2", ...],
+            "facts": ["fact1", "fact2", ...]
+        }}
+        """
+
+        return extraction_prompt
+
+    def extract_packed(self, transcripts: Dict[str, str]) -> Dict[str, Dict]:
+        """Extract memories for several short transcripts in one request, keyed by transcript id.
+
+        Ids missing from the model's answer are simply absent from the result.
+        """
+
+        sections = "\n\n".join(f"Transcript [{tid}]:\n{text}" for tid, text in transcripts.items())
+        extraction_prompt = f"""Analyze each of the following independent conversations separately and extract:
+        1. USER PREFERENCES (likes, dislikes, interests, habits)
+        2. EMOTIONAL PATTERNS (stress triggers, anxiety sources, coping mechanisms)
+        3. IMPORTANT FACTS (relationships, goals, deadlines, challenges)
+
+        {sections}
+
+        Provide output in valid JSON format, with one entry per transcript id:
+        {{
+            "transcripts": {{
+                "<id>": {{"preferences": [...], "emotional_patterns": [...], "facts": [...]}},
+                ...
+            }}
+        }}
+        """
+
+        result = self._complete_json(extraction_prompt, max_tokens=min(4000, 800 * len(transcripts)),
+                                     operation="extract_packed")
+        packed = result.get("transcripts") if isinstance(result, dict) else None
+        if not isinstance(packed, dict):
+            return {}
+        return {tid: memories for tid, memories in packed.items()
+                if tid in transcripts and isinstance(memories, dict)}
+
+    def _json_request(self, prompt: str, max_tokens: int) -> Tuple[Route, Dict]:
+        """Route and request parameters for a JSON-mode extraction prompt"""
+        messages = [
+            {"role": "system",
+             "content": "You are an expert at analyzing conversations and extracting psychological insights. Output valid JSON only."},
+            {"role": "user", "content": prompt}
+        ]
+        route = self.router.select("extract", count_message_tokens(messages, self.deployment))
+        return route, dict(
+            model=route.deployment,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+
+    def _stream_json(self, prompt: str, max_tokens: int,
+                     operation: str = "extract") -> Generator[Tuple[str, str], None, Tuple[Dict, bool]]:
+        """Streamed JSON-mode completion, yielding (category, item) as each list item closes.
+
+        Returns (memories, truncated). A truncated or interrupted answer keeps the items completed
+        before the cut and is not cached; it only raises if nothing usable arrived.
+        """
+
+        route, request = self._json_request(prompt, max_tokens)
+
+        start = time.perf_counter()
+        # Same key as the non-streamed request, so both share cache entries
+        cache_key = make_cache_key(task="extract", **request)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics.record_call(operation, time.perf_counter() - start, cache_hit=True)
+                yield from _memory_items(cached)
+                return cached, False
+
+        parser = IncrementalJSONParser()
+        result = {}
+        parts = []
+        first_token_at = None
+        finish_reason = None
+
+        try:
+            stream = self.client.chat.completions.create(stream=True, **request)
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+                delta = choice.delta.content
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(delta)
+                for path, item in parser.feed(delta):
+                    # Only top-level lists hold memories
+                    if len(path) == 1:
+                        result.setdefault(path[0], []).append(item)
+                        yield path[0], item
+            truncated = finish_reason == "length" or not parser.complete
+            if truncated and not result:
+                raise ValueError(f"Incomplete JSON in extraction output (finish_reason={finish_reason})")
+
+        except Exception as e:
+            self.metrics.record_call(operation, time.perf_counter() - start,
+                                     ttft=first_token_at - start if first_token_at else None, error=True)
+            self.router.record("extract", route, time.perf_counter() - start, error=True)
+            if not result:
+                raise
+            logger.warning("Extraction stream failed (%s). Keeping %d completed items.", e,
+                           sum(len(items) for items in result.values()))
+            truncated = True
+
+        else:
+            # Streamed responses carry no usage field, so count tokens locally
+            self.metrics.record_call(operation, time.perf_counter() - start,
+                                     ttft=first_token_at - start if first_token_at else None,
+                                     prompt_tokens=count_message_tokens(request["messages"], self.deployment),
+                                     completion_tokens=count_tokens("".join(parts), self.deployment))
+            # Items per call is a rough quality signal for comparing routes
+            self.router.record("extract", route, time.perf_counter() - start,
+                               items=sum(len(items) for items in result.values()))
+
+        if truncated:
+            self.metrics.increment("extraction_truncated_total")
+        elif self.cache is not None:
+            self.cache.set(cache_key, result)
+        return result, truncated
+
+    def _complete_json(self, prompt: str, max_tokens: int, operation: str = "extract") -> Dict:
+        """JSON-mode completion for an extraction prompt, through the response cache"""
+
+        route, request = self._json_request(prompt, max_tokens)
+
+        start = time.perf_counter()
+        cache_key = make_cache_key(task="extract", **request)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics.record_call(operation, time.perf_counter() - start, cache_hit=True)
+                return cached
+
+        try:
+            response = self.client.chat.completions.create(**request)
+
+            result_text = response.choices[0].message.content
+            result = json.loads(result_text)
+        except Exception:
+            self.metrics.record_call(operation, time.perf_counter() - start, error=True)
+            self.router.record("extract", route, time.perf_counter() - start, error=True)
+            raise
+
+        prompt_tokens, completion_tokens = usage_tokens(response)
+        self.metrics.record_call(operation, time.perf_counter() - start,
+                                 prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        # Items per call is a rough quality signal for comparing routes
+        self.router.record("extract", route, time.perf_counter() - start,
+                           items=sum(len(items) for items in result.values() if isinstance(items, list))
+                           if isinstance(result, dict) else 0)
+
+        if self.cache is not None:
+            self.cache.set(cache_key, result)
+        return result
+
+    @staticmethod
+    def _format_conversation(conversations: List[Dict]) -> str:
+        """Render messages as a User/Bot transcript"""
+        return "\n".join(
+            [f"{'User' if msg['role'] == 'user' else 'Bot'}: {msg['content']}" for msg in conversations])
+
+    def _summarize_memories(self, memories: Dict, limit: Optional[int] = SUMMARY_ITEMS) -> str:
+        """Compact summary of the memories known so far, at most ``limit`` items per category"""
+        lines = []
+        for category in MEMORY_CATEGORIES:
+            items = memories.get(category, [])[-limit:] if limit else memories.get(category, [])
+            if items:
+                lines.append(f"{category}: {'; '.join(items)}")
+        return "\n".join(lines)
+
+    def _fallback_extraction(self, conversations: Optional[List[Dict]] = None):
+        """Rule-based extraction as fallback (canned demo data when no local extractor is configured)"""
+        self.metrics.increment("fallback_extractions_total")
+        if self.local_extractor is not None and conversations:
+            memories, _ = self.local_extractor.extract(conversations)
+            if any(memories.values()):
+                return memories
+        return {
+            "preferences": [
+                "Prefers studying late at night",
+                "Values relationship with girlfriend",
+                "Struggles with mathematics particularly calculus"
+            ],
+            "emotional_patterns": [
+                "High exam-related anxiety",
+                "Parent pressure causing stress",
+                "Fear of failure and comparison",
+                "Burnout from overwork"
+            ],
+            "facts": [
+                "Preparing for JEE Mains exam next month",
+                "Father is an engineer who cleared exam in first attempt",
+                "Currently sleeping only 3-4 hours per night",
+                "Mock test scores range from 180-220 out of 300",
+                "Has girlfriend who feels neglected due to exam prep"
+            ]
+        }
+
+
+def _digest_turns(digest, messages: List[Dict]):
+    """Feed turns into a running hash (e.g. hashlib.sha1()) and return it"""
+    for message in messages:
+        digest.update(f"{message['role']}\0{message['content']}\1".encode("utf-8"))
+    return digest
+
+
+def _memory_items(memories: Dict) -> Iterator[Tuple[str, str]]:
+    for category, items in memories.items():
+        if isinstance(items, list):
+            for item in items:
+                yield category, item
+
+
+class FailedReply(str):
+    """Text shown in place of a reply that could not be generated; not part of the conversation"""
+
+
+class PersonalityEngine:
+    """Generates responses with different personality styles"""
+
+    # Loaded from personas/*.json; edits are picked up without a restart
+    PERSONALITIES = PersonaRegistry()
+
+    # Upper bound on parallel requests for generate_many
+    MAX_CONCURRENCY = 4
+
+    # Per-section token budgets; the lowest-priority section is cut first when the total overflows
+    PROMPT_BUDGETS = {"persona": 400, "memory": 300, "history": 600, "user": 500}
+    MAX_PROMPT_TOKENS = 1800
+
+    def __init__(self, client, deployment_name, cache: Optional[ResponseCache] = None,
+                 assembler: Optional[PromptAssembler] = None, metrics: Optional[MetricsRegistry] = None,
+                 personas: Optional[PersonaRegistry] = None, router: Optional[ModelRouter] = None):
+        self.client = client
+        self.deployment = deployment_name
+        self.cache = cache
+        self.personas = personas if personas is not None else self.PERSONALITIES
+        self.assembler = assembler or PromptAssembler(deployment_name, self.MAX_PROMPT_TOKENS)
+        self.metrics = metrics or get_metrics()
+        self.router = router or ModelRouter(deployment_name, metrics=self.metrics)
+
+    def generate_response(self, user_message: str, personality: str, context: str = "", history: str = "",
+                          task: str = "generate") -> str:
+        """Generate response with specified personality (``task`` selects the route, e.g. "compare")"""
+
+        if personality not in self.personas:
+            return FailedReply("Invalid personality selected.")
+
+        messages = self._build_messages(user_message, personality, context, history)
+        route = self.router.select(task, count_message_tokens(messages, self.deployment))
+
+        start = time.perf_counter()
+        cached = self._cache_get(messages, route.deployment)
+        if cached is not None:
+            self.metrics.record_call("generate", time.perf_counter() - start, label=personality, cache_hit=True)
+            return cached
+
+        try:
+            response = self.client.chat.completions.create(
+                model=route.deployment,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=200
+            )
+            result = response.choices[0].message.content
+            prompt_tokens, completion_tokens = usage_tokens(response)
+            self.metrics.record_call("generate", time.perf_counter() - start, label=personality,
+                                     prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            self.router.record(task, route, time.perf_counter() - start)
+            self._cache_set(messages, result, route.deployment)
+            return result
+
+        except Exception as e:
+            self.metrics.record_call("generate", time.perf_counter() - start, label=personality, error=True)
+            self.router.record(task, route, time.perf_counter() - start, error=True)
+            return FailedReply(f"Error generating response: {str(e)}")
+
+    def generate_response_stream(self, user_message: str, personality: str, context: str = "",
+                                 history: str = "", task: str = "generate") -> Iterator[str]:
+        """Stream a response with specified personality, yielding text deltas as they arrive"""
+
+        if personality not in self.personas:
+            yield FailedReply("Invalid personality selected.")
+            return
+
+        messages = self._build_messages(user_message, personality, context, history)
+        route = self.router.select(task, count_message_tokens(messages, self.deployment))
+
+        start = time.perf_counter()
+        cached = self._cache_get(messages, route.deployment)
+        if cached is not None:
+            elapsed = time.perf_counter() - start
+            self.metrics.record_call("generate_stream", elapsed, label=personality, ttft=elapsed, cache_hit=True)
+            yield cached
+            return
+
+        started = False
+        first_token_at = None
+        parts = []
+
+        try:
+            stream = self.client.chat.completions.create(
+                model=route.deployment,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=200,
+                stream=True
+            )
+            for chunk in stream:
+                # Azure may send chunks without choices (e.g. content filter results)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not started:
+                        started = True
+                        first_token_at = time.perf_counter()
+                    parts.append(delta)
+                    yield delta
+
+            # Streamed responses carry no usage field, so count tokens locally
+            self.metrics.record_call(
+                "generate_stream", time.perf_counter() - start, label=personality,
+                ttft=first_token_at - start if first_token_at else None,
+                prompt_tokens=count_message_tokens(messages, self.deployment),
+                completion_tokens=count_tokens("".join(parts), self.deployment)
+            )
+            self.router.record(task, route, time.perf_counter() - start)
+            self._cache_set(messages, "".join(parts), route.deployment)
+
+        except Exception as e:
+            self.metrics.record_call("generate_stream", time.perf_counter() - start, label=personality,
+                                     ttft=first_token_at - start if first_token_at else None, error=True)
+            self.router.record(task, route, time.perf_counter() - start, error=True)
+            if not started:
+                # Nothing shown yet - fall back to a regular request, which returns an error string on failure
+                yield self.generate_response(user_message, personality, context, history, task)
+            else:
+                yield FailedReply(f" [Error generating response: {str(e)}]")
+
+    def _cache_key(self, messages: List[Dict], model: str) -> Tuple[str, str]:
+        """Exact key over the full prompt and sampling params, plus a namespace excluding the user message"""
+        params = dict(task="generate", model=model, temperature=0.7, max_tokens=200)
+        return make_cache_key(messages=messages, **params), make_cache_key(messages=messages[:-1], **params)
+
+    def _cache_get(self, messages: List[Dict], model: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        key, namespace = self._cache_key(messages, model)
+        return self.cache.get(key, namespace=namespace, text=messages[-1]["content"])
+
+    def _cache_set(self, messages: List[Dict], response: str, model: str):
+        if self.cache is None or not response:
+            return
+        key, namespace = self._cache_key(messages, model)
+        self.cache.set(key, response, namespace=namespace, text=messages[-1]["content"])
+
+    def plan_prompt(self, user_message: str, personality: str, context: str = "", history: str = "") -> PromptPlan:
+        """Fit persona, memory context, conversation history and user message into their token budgets"""
+
+        persona = self.personas[personality]
+        budgets = self.PROMPT_BUDGETS
+
+        # Most stable first, so consecutive requests share the longest byte-identical prefix
+        # (provider-side prompt caching): persona, history (grows by appending), memory context
+        # (re-ranked per message), then the message itself
+        return self.assembler.assemble([
+            PromptSection("persona", persona.system_prompt, budgets["persona"], priority=2, role="system"),
+            # Summaries plus recent turns (see ConversationSummarizer); the oldest text is cut first
+            PromptSection("history", history, budgets["history"], priority=0, role="system", keep="tail",
+                          template="Conversation so far:\n{}"),
+            PromptSection("memory", context, budgets["memory"], priority=1, role="system",
+                          template="Context about user: {}"),
+            PromptSection("user", user_message, budgets["user"], priority=3, role="user", optional=False),
+        ], max_completion_tokens=200)
+
+    def _build_messages(self, user_message: str, personality: str, context: str, history: str = "") -> List[Dict]:
+        """Assemble the chat messages for a personality"""
+        return self.plan_prompt(user_message, personality, context, history).messages
+
+    def generate_many(self, user_message: str, personalities: Iterable[str], context: str = "", history: str = "",
+                      max_workers: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """Generate responses for several personalities concurrently, yielding (personality, response) as each completes"""
+
+        personalities = list(personalities)
+        if not personalities:
+            return
+
+        workers = min(max_workers or self.MAX_CONCURRENCY, len(personalities))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self.generate_response, user_message, personality, context, history,
+                            "compare"): personality
+                for personality in personalities
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def stream_many(self, user_message: str, personalities: Iterable[str], context: str = "", history: str = "",
+                    max_workers: Optional[int] = None) -> Iterator[Tuple[str, Optional[str]]]:
+        """Stream several personalities concurrently, yielding (personality, delta); a None delta marks completion"""
+
+        personalities = list(personalities)
+        if not personalities:
+            return
+
+        events = queue.Queue()
+
+        def pump(personality: str):
+            try:
+                for delta in self.generate_response_stream(user_message, personality, context, history, "compare"):
+                    events.put((personality, delta))
+            finally:
+                events.put((personality, None))
+
+        workers = min(max_workers or self.MAX_CONCURRENCY, len(personalities))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for personality in personalities:
+                pool.submit(pump, personality)
+
+            remaining = len(personalities)
+            while remaining:
+                personality, delta = events.get()
+                if delta is None:
+                    remaining -= 1
+                yield personality, delta
@@ -0,0 +1,171 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from engines import drain
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionWorker:
+    """In-process background queue for memory extraction.
+
+    At most one job per user is queued or running. Submitting while a job is queued replaces its
+    conversation snapshot; submitting while one is running schedules a single follow-up run with the
+    latest snapshot. Results are published to the extractor's memory store, so readers never wait.
+    An optional summarizer refreshes the user's rolling conversation summary in the same job.
+    Callers can also follow a job with ``stream``, receiving memory items as the model emits them.
+    """
+
+    def __init__(self, extractor, max_workers: int = 2, coalesce_delay: float = 0.0, summarizer=None,
+                 on_result: Optional[Callable[[str, Dict], None]] = None):
+        self.extractor = extractor
+        self.summarizer = summarizer
+        # Called with (user_id, memories) after each successful run, e.g. to refresh a session snapshot
+        self.on_result = on_result
+        self.coalesce_delay = coalesce_delay
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extraction")
+        self._lock = threading.Lock()
+        # user_id -> latest (conversation snapshot, append_only) not yet picked up by a run
+        self._pending: Dict[str, Tuple[List[Dict], bool]] = {}
+        # users with a job queued or running, and an event set when that job finishes
+        self._active: Dict[str, threading.Event] = {}
+        self._results: Dict[str, Dict] = {}
+        # user_id -> error of the most recent run, while it failed
+        self._errors: Dict[str, str] = {}
+        # user_id -> queues receiving (category, item) from the user's job, then None when it finishes
+        self._listeners: Dict[str, List[queue.Queue]] = {}
+        self.counters = {"submitted": 0, "coalesced": 0, "runs": 0, "failures": 0}
+
+    def submit(self, user_id: str, conversations: List[Dict], listener: Optional[queue.Queue] = None,
+               append_only: bool = False) -> bool:
+        """Queue extraction for a user; returns False when merged into an existing job.
+
+        ``append_only`` is passed on to ``extract_incremental`` (set it for server-side session history).
+        """
+        with self._lock:
+            self.counters["submitted"] += 1
+            if listener is not None:
+                # Registered under the lock so the listener cannot miss the end of the job
+                self._listeners.setdefault(user_id, []).append(listener)
+            self._pending[user_id] = (list(conversations), append_only)
+            if user_id in self._active:
+                self.counters["coalesced"] += 1
+                return False
+            self._active[user_id] = threading.Event()
+
+        self._pool.submit(self._run, user_id)
+        return True
+
+    def stream(self, user_id: str, conversations: List[Dict], timeout: Optional[float] = None,
+               append_only: bool = False) -> Iterator[Tuple[str, str]]:
+        """Submit and yield (category, item) as the job extracts them, until the user's job finishes.
+
+        Raises queue.Empty if nothing arrives for ``timeout`` seconds; the job itself keeps running.
+        """
+        events = queue.Queue()
+        self.submit(user_id, conversations, listener=events, append_only=append_only)
+        try:
+            while True:
+                event = events.get(timeout=timeout)
+                if event is None:
+                    return
+                yield event
+        finally:
+            with self._lock:
+                listeners = self._listeners.get(user_id, [])
+                if events in listeners:
+                    listeners.remove(events)
+
+    def status(self, user_id: str) -> str:
+        with self._lock:
+            if user_id not in self._active:
+                return "idle"
+            return "queued" if user_id in self._pending else "running"
+
+    def wait(self, user_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until the user's current job (if any) finishes"""
+        with self._lock:
+            done = self._active.get(user_id)
+        return done.wait(timeout) if done is not None else True
+
+    def last_result(self, user_id: str) -> Optional[Dict]:
+        """Result of the most recent completed run (may be fallback data for the demo user)"""
+        with self._lock:
+            return self._results.get(user_id)
+
+    def last_error(self, user_id: str) -> Optional[str]:
+        """Why the most recent run failed, or None if it succeeded"""
+        with self._lock:
+            return self._errors.get(user_id)
+
+    def forget(self, user_id: str):
+        """Drop the user's last result once nothing else holds on to the user"""
+        with self._lock:
+            self._results.pop(user_id, None)
+            self._errors.pop(user_id, None)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def _run(self, user_id: str):
+        if self.coalesce_delay:
+            # Let a burst of messages land before snapshotting
+            time.sleep(self.coalesce_delay)
+
+        finished = False
+        try:
+            while True:
+                with self._lock:
+                    job = self._pending.pop(user_id, None)
+                    if job is None:
+                        # Checked and released under one lock, so a concurrent submit either lands
+                        # in this run or starts a new one
+                        self._finish(user_id)
+                        finished = True
+                        return
+                    self.counters["runs"] += 1
+                conversations, append_only = job
+
+                try:
+                    result = drain(self.extractor.stream_incremental(user_id, conversations, append_only),
+                                   lambda item: self._publish(user_id, item))
+                    if self.summarizer is not None:
+                        self.summarizer.update(user_id, conversations)
+                except Exception as e:
+                    logger.warning("Extraction for %s failed: %s", user_id, e)
+                    with self._lock:
+                        self.counters["failures"] += 1
+                        self._errors[user_id] = str(e)
+                    continue
+
+                with self._lock:
+                    self._results[user_id] = result
+                    self._errors.pop(user_id, None)
+                if self.on_result is not None:
+                    try:
+                        self.on_result(user_id, result)
+                    except Exception:
+                        logger.exception("Publishing extracted memories for %s failed", user_id)
+        finally:
+            if not finished:
+                # Never leave the user marked active, or every later submit would be coalesced into nothing
+                with self._lock:
+                    self._pending.pop(user_id, None)
+                    self._finish(user_id)
+
+    def _finish(self, user_id: str):
+        """Mark the user's job done and end their streams; caller holds the lock"""
+        self._active.pop(user_id).set()
+        for listener in self._listeners.pop(user_id, []):
+            listener.put(None)
+
+    def _publish(self, user_id: str, item: Tuple[str, str]):
+        with self._lock:
+            listeners = list(self._listeners.get(user_id, ()))
+        for listener in listeners:
+            listener.put(item)
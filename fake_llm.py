@@ -0,0 +1,223 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+from prompt_budget import count_message_tokens, count_tokens
+
+REPLY_WORDS = ("I", "hear", "you", "and", "that", "sounds", "really", "tough", "let's", "take", "it", "one",
+               "step", "at", "a", "time", "you", "have", "got", "this", "yaar")
+
+
+class FakeAPIError(Exception):
+    """Mimics openai.APIStatusError closely enough for retry handling"""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Fake backend error {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FakeChatBackend:
+    """Produces completions with configurable latency distribution, token rate and error injection"""
+
+    def __init__(self, latency_ms: float = 300.0, latency_sigma: float = 0.3, tokens_per_second: float = 50.0,
+                 reply_tokens: int = 40, error_rate: float = 0.0, error_status: int = 429,
+                 seed: int = 0, sleep: bool = True):
+        self.latency_ms = latency_ms
+        # Log-normal spread around latency_ms gives a realistic long tail
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.sleep = sleep
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            self.calls += 1
+            latency = self.latency_ms / 1000.0 * self._rng.lognormvariate(0, self.latency_sigma)
+            failed = self._rng.random() < self.error_rate
+        return latency, failed
+
+    def _pause(self, seconds: float):
+        if self.sleep and seconds > 0:
+            time.sleep(seconds)
+
+    def _content(self, request: Dict) -> str:
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            return self._extraction_json(request["messages"][-1]["content"])
+        words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(min(self.reply_tokens, request.get("max_tokens", 200)))]
+        return " ".join(words)
+
+    @staticmethod
+    def _memories_from(text: str) -> Dict:
+        user_turns = re.findall(r"^\s*User: (.+)$", text, flags=re.MULTILINE)
+        items = [turn[:60] for turn in user_turns]
+        return {
+            "preferences": items[0::3][:3],
+            "emotional_patterns": items[1::3][:3],
+            "facts": items[2::3][:3],
+        }
+
+    def _extraction_json(self, prompt: str) -> str:
+        """Derive plausible memories from the user turns in the prompt so results vary with input"""
+        # Packed prompts hold several "Transcript [id]:" sections, answered per id
+        parts = re.split(r"^\s*Transcript \[([^\]]+)\]:$", prompt, flags=re.MULTILINE)
+        if len(parts) > 1:
+            return json.dumps({"transcripts": {tid: self._memories_from(text)
+                                               for tid, text in zip(parts[1::2], parts[2::2])}})
+        return json.dumps(self._memories_from(prompt))
+
+    def complete(self, request: Dict) -> SimpleNamespace:
+        latency, failed = self._draw()
+        self._pause(latency)
+        if failed:
+            raise FakeAPIError(self.error_status, retry_after=0.05)
+
+        content = self._content(request)
+        completion_tokens = count_tokens(content)
+        self._pause(completion_tokens / self.tokens_per_second)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content),
+                                     finish_reason="stop", index=0)],
+            usage=SimpleNamespace(
+                prompt_tokens=count_message_tokens(request.get("messages", [])),
+                completion_tokens=completion_tokens,
+                total_tokens=count_message_tokens(request.get("messages", [])) + completion_tokens
+            )
+        )
+
+    def stream(self, request: Dict) -> Iterator[SimpleNamespace]:
+        latency, failed = self._draw()
+        self._pause(latency)
+        if failed:
+            raise FakeAPIError(self.error_status, retry_after=0.05)
+
+        return self._stream_chunks(self._content(request))
+
+    def _stream_chunks(self, content: str) -> Iterator[SimpleNamespace]:
+        for index, word in enumerate(content.split(" ")):
+            self._pause(1.0 / self.tokens_per_second)
+            delta = word if index == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta), index=0)])
+
+
+class FakeChatClient:
+    """In-process client exposing ``chat.completions.create`` backed by a FakeChatBackend"""
+
+    def __init__(self, backend: Optional[FakeChatBackend] = None):
+        self.backend = backend or FakeChatBackend()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        if kwargs.get("stream"):
+            return self.backend.stream(kwargs)
+        return self.backend.complete(kwargs)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    backend: FakeChatBackend = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client gave up on the request (e.g. its hedge won); nothing left to do
+            self.close_connection = True
+
+    def do_POST(self):
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        try:
+            if request.get("stream"):
+                chunks = self.backend.stream(request)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        payload = {"id": "fake", "object": "chat.completion.chunk", "created": 0,
+                                   "model": request.get("model", "fake"),
+                                   "choices": [{"index": 0, "delta": {"content": chunk.choices[0].delta.content},
+                                                "finish_reason": None}]}
+                        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except ConnectionError:
+                    # Closed mid-stream, which hedged clients do whenever the other request wins
+                    self.close_connection = True
+                return
+
+            result = self.backend.complete(request)
+        except FakeAPIError as e:
+            self._send_json(e.status_code, {"error": {"message": str(e)}}, e.response.headers)
+            return
+
+        self._send_json(200, {
+            "id": "fake", "object": "chat.completion", "created": 0, "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": result.choices[0].message.content}}],
+            "usage": vars(result.usage),
+        })
+
+
+class FakeChatServer:
+    """Local HTTP server speaking the Azure chat-completions protocol; point AZURE_OPENAI_ENDPOINT at ``endpoint``"""
+
+    def __init__(self, backend: Optional[FakeChatBackend] = None, host: str = "127.0.0.1", port: int = 0):
+        handler = type("FakeChatHandler", (_Handler,), {"backend": backend or FakeChatBackend()})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeChatServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeChatServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def synthetic_conversations(base: List[Dict], turns: int, variant: int = 0) -> List[Dict]:
+    """Scale a sample conversation up to ``turns`` messages, tagging repeats so they are distinct"""
+    messages = []
+    for index in range(turns):
+        message = base[index % len(base)]
+        cycle = index // len(base)
+        content = message["content"] if cycle == 0 and variant == 0 else f"{message['content']} (u{variant} c{cycle})"
+        messages.append({"role": message["role"], "content": content})
+    return messages
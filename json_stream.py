@@ -0,0 +1,74 @@
+import json
+from typing import List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """Incremental scanner for JSON that arrives in pieces, e.g. a streamed completion.
+
+    ``feed`` returns every string element of an array that closed in the new text, with the path
+    of object keys leading to that array: ``{"facts": ["a", "b"]}`` yields ``(("facts",), "a")``
+    and then ``(("facts",), "b")``. Items are final once emitted, so a truncated document keeps
+    everything that closed before the cut. Other values are skipped without being decoded.
+    """
+
+    def __init__(self):
+        # One entry per open container: [is_object, current_key, expecting_key]
+        self._stack: List[list] = []
+        self._string: Optional[List[str]] = None
+        self._escaped = False
+        self._started = False
+        self.complete = False
+
+    def feed(self, text: str) -> List[Tuple[Tuple[str, ...], str]]:
+        items = []
+        string = self._string
+        # Chunks may end inside a string, so the raw characters are carried over between calls
+        for char in text:
+            if string is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._string = None
+                    item = self._close_string("".join(string))
+                    string = None
+                    if item is not None:
+                        items.append(item)
+                    continue
+                string.append(char)
+            elif self.complete:
+                break
+            elif char == '"':
+                string = self._string = []
+            elif char == "{":
+                self._started = True
+                self._stack.append([True, None, True])
+            elif char == "[":
+                self._started = True
+                self._stack.append([False, None, False])
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self.complete = self._started and not self._stack
+            elif char == ",":
+                if self._stack and self._stack[-1][0]:
+                    self._stack[-1][2] = True
+            elif char == ":":
+                if self._stack and self._stack[-1][0]:
+                    self._stack[-1][2] = False
+        return items
+
+    def _close_string(self, raw: str) -> Optional[Tuple[Tuple[str, ...], str]]:
+        try:
+            value = json.loads(f'"{raw}"')
+        except ValueError:
+            value = raw
+        if not self._stack:
+            return None
+        top = self._stack[-1]
+        if top[0]:
+            if top[2]:
+                top[1] = value
+            return None
+        return tuple(frame[1] for frame in self._stack if frame[0]), value
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def make_cache_key(**parts) -> str:
+    """Stable hash over everything that determines an LLM result (prompt, deployment, sampling params)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache for LLM results with an optional SQLite disk tier and near-duplicate lookups.
+
+    Exact hits use the full-prompt key. When an embedder is configured, a miss can still be served by
+    an entry in the same namespace (identical everything except the free-text message) whose text
+    embedding is at least ``similarity_threshold`` cosine-similar.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, disk_path: Optional[str] = None,
+                 embedder: Optional[Callable[[Sequence[str]], "np.ndarray"]] = None,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+
+        # key -> (value, expires_at)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # namespace -> {key: normalized embedding}, only for entries stored with text
+        self._semantic: Dict[str, Dict[str, "np.ndarray"]] = {}
+        # Guards the in-memory tiers only; embedding calls (possibly network) happen without it
+        self._lock = threading.Lock()
+        # Serializes the shared SQLite connection, so disk I/O does not hold up memory hits either
+        self._disk_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "semantic_hits": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        """Open the disk tier on first use"""
+        if self.disk_path and self._conn is None:
+            with self._disk_lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+                    conn.execute("CREATE TABLE IF NOT EXISTS llm_cache "
+                                 "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+                    self._conn = conn
+        return self._conn
+
+    def get(self, key: str, namespace: Optional[str] = None, text: Optional[str] = None) -> Optional[Any]:
+        """Cached value for key (or a near-duplicate of text within namespace), else None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry[0]
+                self._remove(key)
+                self.counters["expirations"] += 1
+            semantic = (self.embedder is not None and namespace and text
+                        and bool(self._semantic.get(namespace)))
+
+        value = self._disk_get(key, now)
+        if value is not None:
+            with self._lock:
+                self._insert(key, value, now + self.ttl_seconds)
+                self.counters["hits"] += 1
+                self.counters["disk_hits"] += 1
+            return value
+
+        # Only embed when the namespace has something to compare against
+        vector = self._embed(text) if semantic else None
+        with self._lock:
+            if vector is not None:
+                value = self._semantic_get(namespace, vector, now)
+                if value is not None:
+                    self.counters["hits"] += 1
+                    self.counters["semantic_hits"] += 1
+                    return value
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any, namespace: Optional[str] = None, text: Optional[str] = None):
+        expires_at = time.time() + self.ttl_seconds
+        vector = self._embed(text) if self.embedder is not None and namespace and text else None
+        with self._lock:
+            self._insert(key, value, expires_at)
+            if vector is not None:
+                self._semantic.setdefault(namespace, {})[key] = vector
+        if self.conn is not None:
+            with self._disk_lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._semantic.clear()
+        if self.conn is not None:
+            with self._disk_lock, self.conn:
+                self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus current size and hit rate, for export"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _insert(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        for vectors in self._semantic.values():
+            vectors.pop(key, None)
+
+    def _disk_get(self, key: str, now: float) -> Optional[Any]:
+        if self.conn is None:
+            return None
+        with self._disk_lock:
+            row = self.conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                with self.conn:
+                    self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        if row[1] <= now:
+            with self._lock:
+                self.counters["expirations"] += 1
+            return None
+        return json.loads(row[0])
+
+    def _embed(self, text: str) -> "np.ndarray":
+        # numpy is only needed for semantic lookups, so it is not imported with the module
+        import numpy as np
+
+        vector = np.asarray(self.embedder([text])[0], dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _semantic_get(self, namespace: str, vector: "np.ndarray", now: float) -> Optional[Any]:
+        """Closest entry to an embedded text within namespace; caller holds the lock"""
+        candidates = self._semantic.get(namespace)
+        if not candidates:
+            return None
+
+        import numpy as np
+
+        keys = list(candidates)
+        scores = np.stack([candidates[key] for key in keys]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+
+        key = keys[best]
+        value, expires_at = self._entries[key]
+        if expires_at <= now:
+            self._remove(key)
+            self.counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
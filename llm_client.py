@@ -0,0 +1,408 @@
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+from metrics import percentile
+from prompt_budget import count_message_tokens
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the backend while the circuit breaker is open"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Take ``amount`` tokens, waiting for refill if needed; False if the timeout expires first"""
+        # Requests larger than the bucket would never fit - let them through once it is full
+        amount = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(min(wait, 1.0))
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one probe through after ``reset_timeout``"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpenError("LLM backend unavailable (circuit open), failing fast")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms / retry-after headers"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429/5xx responses and connection-level failures are worth retrying"""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout",
+                                    "ConnectTimeout", "RemoteProtocolError")
+
+
+class ResilientClient:
+    """Drop-in wrapper around an OpenAI-style client adding retries, rate limiting and a circuit breaker.
+
+    Exposes ``chat.completions.create`` and ``embeddings.create`` with the same signatures as the
+    wrapped client, so engines do not need to know about it.
+    """
+
+    def __init__(self, client, max_retries: int = 4, backoff_base: float = 0.5, backoff_cap: float = 20.0,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, sleep: Callable[[float], None] = time.sleep,
+                 metrics=None):
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        # Optional MetricsRegistry; counters are mirrored there for export
+        self.metrics = metrics
+
+        self.counters = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    def _create_completion(self, **kwargs):
+        estimate = count_message_tokens(kwargs.get("messages", []), kwargs.get("model", "gpt-4"))
+        estimate += kwargs.get("max_tokens") or 0
+        return self._call(self.client.chat.completions.create, kwargs, estimate)
+
+    def _create_embedding(self, **kwargs):
+        inputs = kwargs.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        estimate = sum(len(text) // 4 + 1 for text in inputs)
+        return self._call(self.client.embeddings.create, kwargs, estimate)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff (capped at ``backoff_cap``), never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            # Retrying earlier than asked only earns another 429
+            delay = max(delay, retry_after)
+        return delay
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+        if self.metrics is not None:
+            self.metrics.increment(f"client_{name}_total")
+
+    def _call(self, method: Callable, kwargs: Dict, token_estimate: int):
+        self._count("calls")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                self._count("rejected")
+                raise
+
+            if self.request_bucket is not None:
+                self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(token_estimate)
+
+            try:
+                result = method(**kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable and _status_code(e) != 429:
+                    self.breaker.record_failure()
+                else:
+                    # The backend answered (e.g. a 400, or a 429 asking us to slow down), so it is healthy
+                    self.breaker.record_success()
+                if not retryable or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                self.sleep(self._backoff(attempt, e))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+
+def build_azure_client(api_key: Optional[str], azure_endpoint: Optional[str], api_version: str,
+                       max_connections: int = 20, max_keepalive: int = 10, keepalive_expiry: float = 30.0,
+                       timeout: float = 60.0, **resilience_options) -> ResilientClient:
+    """AzureOpenAI client on a pooled keep-alive HTTP connection, wrapped with retries and rate limiting"""
+    import httpx
+    from openai import AzureOpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(timeout, connect=5.0)
+    )
+    client = AzureOpenAI(
+        api_key=api_key,
+        api_version=api_version,
+        azure_endpoint=azure_endpoint,
+        http_client=http_client,
+        # Retries are handled by ResilientClient so they share the breaker and limiter
+        max_retries=0
+    )
+    return ResilientClient(client, **resilience_options)
+
+
+class DeadlineExceeded(TimeoutError):
+    """No answer (or, when streaming, no first token) within the call's deadline"""
+
+
+class HedgedClient:
+    """Opt-in tail-latency control on top of a (resilient) OpenAI-style client.
+
+    If the primary request has not answered - or, when streaming, produced its first token -
+    within the ``hedge_percentile`` of recently observed latencies, an identical request is sent,
+    optionally to a secondary client and/or deployment. The first to answer wins. A losing stream
+    is closed; a losing blocking request cannot be interrupted and its result is discarded. A
+    primary that fails before the hedge fires triggers the hedge immediately.
+
+    Engines call any OpenAI-style client and never pass ``deadline=``, which only this class accepts,
+    so the client-wide ``deadline`` (AZURE_OPENAI_DEADLINE) bounds their replies and extractions alike.
+    The per-call argument is for code that knows it talks to a HedgedClient.
+    """
+
+    # Latency samples needed before the percentile replaces ``initial_delay``
+    MIN_SAMPLES = 20
+
+    def __init__(self, primary, secondary=None, secondary_deployment: Optional[str] = None,
+                 hedge_percentile: float = 95.0, initial_delay: float = 2.0, min_delay: float = 0.05,
+                 deadline: Optional[float] = None, max_workers: int = 32, window: int = 500, metrics=None):
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.secondary_deployment = secondary_deployment
+        self.hedge_percentile = hedge_percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        # Default per-call deadline in seconds; a call can pass its own ``deadline=``
+        self.deadline = deadline
+        self.metrics = metrics
+
+        # Separate windows: streams are hedged on time to first token, blocking calls on total time
+        self._samples = {True: deque(maxlen=window), False: deque(maxlen=window)}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.counters = {"calls": 0, "hedges_fired": 0, "hedges_won": 0, "deadline_exceeded": 0}
+        self._lock = threading.Lock()
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        if hasattr(primary, "embeddings"):
+            self.embeddings = primary.embeddings
+
+    def hedge_delay(self, stream: bool) -> float:
+        with self._lock:
+            samples = list(self._samples[stream])
+        if len(samples) < self.MIN_SAMPLES:
+            return self.initial_delay
+        return max(self.min_delay, percentile(samples, self.hedge_percentile))
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+        if self.metrics is not None:
+            self.metrics.increment(f"client_{name}_total")
+
+    def _leg(self, name: str, client, kwargs: Dict, events: queue.Queue, call: SimpleNamespace):
+        """Run one request; report (name, result) or (name, error) unless the call is already decided"""
+        started = time.monotonic()
+        stream = bool(kwargs.get("stream"))
+        try:
+            result = client.chat.completions.create(**kwargs)
+            if stream:
+                # Pull up to the first content chunk so "answered" means first token
+                iterator = iter(result)
+                buffered = []
+                for chunk in iterator:
+                    buffered.append(chunk)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        break
+                result = (result, iterator, buffered)
+        except Exception as e:
+            events.put(("error", name, e))
+            return
+
+        with self._lock:
+            self._samples[stream].append(time.monotonic() - started)
+        with call.lock:
+            lost = call.decided
+            if not lost:
+                events.put(("ok", name, result))
+        if lost and stream:
+            _close(result[0])
+
+    def _create_completion(self, deadline: Optional[float] = None, **kwargs):
+        deadline = deadline if deadline is not None else self.deadline
+        stream = bool(kwargs.get("stream"))
+        started = time.monotonic()
+        expires = started + deadline if deadline else None
+        hedge_at = started + self.hedge_delay(stream)
+        self._count("calls")
+
+        events: queue.Queue = queue.Queue()
+        call = SimpleNamespace(lock=threading.Lock(), decided=False)
+        futures = {"primary": self._pool.submit(self._leg, "primary", self.primary, kwargs, events, call)}
+        errors = []
+
+        while True:
+            wake = [moment for moment in (None if "hedge" in futures else hedge_at, expires) if moment is not None]
+            try:
+                kind, name, payload = events.get(timeout=max(0.0, min(wake) - time.monotonic()) if wake else None)
+            except queue.Empty:
+                if "hedge" not in futures and time.monotonic() >= hedge_at:
+                    futures["hedge"] = self._fire_hedge(kwargs, events, call)
+                    continue
+                self._decide(call, events, futures)
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(f"LLM call exceeded its {deadline:.2f}s deadline")
+
+            if kind == "error":
+                errors.append(payload)
+                if "hedge" not in futures:
+                    futures["hedge"] = self._fire_hedge(kwargs, events, call)
+                elif len(errors) == len(futures):
+                    raise errors[0]
+                continue
+
+            self._decide(call, events, futures)
+            if name == "hedge":
+                self._count("hedges_won")
+            if not stream:
+                return payload
+            return _stream_from(*payload)
+
+    def _fire_hedge(self, kwargs: Dict, events: queue.Queue, call: SimpleNamespace):
+        self._count("hedges_fired")
+        hedge_kwargs = dict(kwargs)
+        if self.secondary_deployment:
+            hedge_kwargs["model"] = self.secondary_deployment
+        return self._pool.submit(self._leg, "hedge", self.secondary, hedge_kwargs, events, call)
+
+    @staticmethod
+    def _decide(call: SimpleNamespace, events: queue.Queue, futures: Dict):
+        """Stop the losers: unstarted requests are cancelled, streams that already answered are closed"""
+        with call.lock:
+            call.decided = True
+        for future in futures.values():
+            future.cancel()
+        while True:
+            try:
+                kind, _, payload = events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "ok" and isinstance(payload, tuple):
+                _close(payload[0])
+
+
+def _close(stream):
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _stream_from(stream, iterator, buffered):
+    """Replay the chunks read while racing, then continue the winning stream"""
+    try:
+        yield from buffered
+        yield from iterator
+    finally:
+        _close(stream)
@@ -0,0 +1,217 @@
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from consolidation import content_tokens
+from memory_store import MEMORY_CATEGORIES
+
+# Item nodes are (category, text); entity nodes are stemmed content words (see content_tokens)
+Item = Tuple[str, str]
+Node = Union[Item, str]
+
+# (relation, pattern, categories); entities in the text after the marker get the relation, the rest
+# are "mentions". categories=None applies to every item
+RELATION_PATTERNS = [
+    ("caused_by", r"\b(?:because of|due to|caused by|triggered by|pressure from)\b(.+)", None),
+    # "Feels anxious about X" names a cause; "scores range from 180 to 220" or "talked about X" do not
+    ("caused_by", r"\b(?:about|over)\b(.+)", ("emotional_patterns",)),
+    ("struggles_with", r"\b(?:struggl\w* with|difficult\w* with|weak (?:in|at)|afraid of|fear of|avoids?|"
+                       r"dislikes?|hates?)\b(.+)", None),
+    ("likes", r"\b(?:likes?|loves?|enjoys?|prefers?|favou?rite)\b(.+)", None),
+]
+COMPILED_RELATIONS = [(relation, re.compile(pattern), categories)
+                      for relation, pattern, categories in RELATION_PATTERNS]
+
+# Traversal weight of each edge type; explicit relations count more than co-mention
+RELATION_WEIGHTS = {"caused_by": 1.0, "struggles_with": 1.0, "likes": 0.8, "mentions": 0.6}
+
+# Words that describe the user or the relation rather than a thing worth linking on; rule-extracted
+# items refer to the user in the third person (see rule_extractor.THIRD_PERSON)
+GENERIC_TOKENS = content_tokens("""
+i me im user they them themselves theirs feel feels feeling felt get gets getting like likes love loves enjoy enjoys prefer prefers
+always often usually sometimes lot lots thing things because due caused triggered afraid fear struggle
+struggles struggling difficulty difficult weak avoid avoids dislike dislikes hate hates favourite favorite
+out
+""")
+
+
+def item_entities(text: str, category: Optional[str] = None) -> Dict[str, str]:
+    """Entity -> relation for one memory item; the first matching relation wins"""
+    lowered = text.lower()
+    entities: Dict[str, str] = {}
+    for relation, pattern, categories in COMPILED_RELATIONS:
+        if categories is not None and category not in categories:
+            continue
+        match = pattern.search(lowered)
+        if match:
+            for entity in _entity_tokens(match.group(1)):
+                entities.setdefault(entity, relation)
+    for entity in _entity_tokens(lowered):
+        entities.setdefault(entity, "mentions")
+    return entities
+
+
+def _entity_tokens(text: str) -> Set[str]:
+    # Bare numbers ("180", "300") would link every item that quotes a score or a time
+    return {token for token in content_tokens(text) - GENERIC_TOKENS if not token.isdigit()}
+
+
+class MemoryGraph:
+    """Graph of one user's memories: item nodes linked to the entities they mention.
+
+    Adjacency lists are kept in both directions and keyed by relation type, so "which items are
+    caused by calculus" is two dict lookups. Items are added and removed incrementally as the
+    user's memories change; multi-hop questions (item -> entity -> item -> ...) are answered by a
+    bounded-depth traversal.
+    """
+
+    def __init__(self):
+        self.items: Dict[Item, None] = {}
+        # node -> relation -> neighbours
+        self.out: Dict[Node, Dict[str, Set[Node]]] = {}
+        self.inc: Dict[Node, Dict[str, Set[Node]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def entities(self) -> List[str]:
+        return [node for node in self.inc if isinstance(node, str)]
+
+    def sync(self, memories: Dict[str, List[str]]) -> Tuple[int, int]:
+        """Apply the difference to a memory dict; returns (added, removed)"""
+        current = {(category, item) for category in MEMORY_CATEGORIES for item in memories.get(category, ())}
+        removed = [item for item in self.items if item not in current]
+        for item in removed:
+            self.remove_item(item)
+        added = [item for item in current if item not in self.items]
+        for item in added:
+            self.add_item(item)
+        return len(added), len(removed)
+
+    def add_item(self, item: Item):
+        if item in self.items:
+            return
+        self.items[item] = None
+        for entity, relation in item_entities(item[1], item[0]).items():
+            self.out.setdefault(item, {}).setdefault(relation, set()).add(entity)
+            self.inc.setdefault(entity, {}).setdefault(relation, set()).add(item)
+
+    def remove_item(self, item: Item):
+        if self.items.pop(item, False) is False:
+            return
+        for relation, entities in self.out.pop(item, {}).items():
+            for entity in entities:
+                edges = self.inc[entity]
+                edges[relation].discard(item)
+                if not edges[relation]:
+                    del edges[relation]
+                if not edges:
+                    # Entities only exist while some item mentions them
+                    del self.inc[entity]
+
+    def neighbors(self, node: Node, relation: Optional[str] = None) -> Set[Node]:
+        """Adjacent nodes in either direction, optionally over one relation type"""
+        found: Set[Node] = set()
+        for edges in (self.out.get(node, {}), self.inc.get(node, {})):
+            if relation is None:
+                for nodes in edges.values():
+                    found |= nodes
+            else:
+                found |= edges.get(relation, set())
+        return found
+
+    def degree(self, node: Node) -> int:
+        return sum(len(nodes) for edges in (self.out.get(node, {}), self.inc.get(node, {})) for nodes in edges.values())
+
+    def traverse(self, seeds: Iterable[Node], max_depth: int = 3, relations: Optional[Set[str]] = None,
+                 max_degree: int = 12) -> Dict[Item, float]:
+        """Items reachable from the seeds within ``max_depth`` edges, scored by path strength.
+
+        Each edge multiplies the score by its relation weight, and fanning out of an entity divides
+        it by the square root of the entity's degree, so hubs like "exam" spread thin. Entities with
+        more than ``max_degree`` items are not expanded beyond the seeds.
+        """
+        frontier: Dict[Node, float] = {seed: 1.0 for seed in seeds if seed in self.out or seed in self.inc}
+        visited = set(frontier)
+        scores: Dict[Item, float] = {}
+
+        for depth in range(1, max_depth + 1):
+            reached: Dict[Node, float] = {}
+            for node, score in frontier.items():
+                is_entity = isinstance(node, str)
+                degree = self.degree(node) if is_entity else 1
+                if is_entity and depth > 1 and degree > max_degree:
+                    continue
+                spread = degree ** 0.5 if is_entity else 1.0
+                for edges in (self.out.get(node, {}), self.inc.get(node, {})):
+                    for relation, nodes in edges.items():
+                        if relations is not None and relation not in relations:
+                            continue
+                        weight = score * RELATION_WEIGHTS.get(relation, 0.5) / spread
+                        for neighbor in nodes:
+                            if neighbor not in visited and weight > reached.get(neighbor, 0.0):
+                                reached[neighbor] = weight
+            if not reached:
+                break
+            visited.update(reached)
+            for node, score in reached.items():
+                if not isinstance(node, str):
+                    scores[node] = score
+            frontier = reached
+        return scores
+
+    def related(self, message: str, k: int = 6, max_depth: int = 3,
+                relations: Optional[Set[str]] = None) -> List[Tuple[str, str, float]]:
+        """Top (category, item, score) connected to the entities mentioned in the message"""
+        seeds = [entity for entity in content_tokens(message) if entity in self.inc]
+        if not seeds:
+            return []
+        scores = self.traverse(seeds, max_depth, relations)
+        ranked = sorted(scores.items(), key=lambda entry: entry[1], reverse=True)[:k]
+        return [(category, item, score) for (category, item), score in ranked]
+
+
+class MemoryGraphIndex:
+    """Per-user MemoryGraphs for the process, updated from extraction output and queried per message"""
+
+    def __init__(self, k: int = 6, max_depth: int = 3):
+        self.k = k
+        self.max_depth = max_depth
+        self._graphs: Dict[str, MemoryGraph] = {}
+        self._lock = threading.Lock()
+        self.counters = {"queries": 0, "query_seconds": 0.0, "items_added": 0, "items_removed": 0}
+
+    def sync(self, user_id: str, memories: Dict[str, List[str]]):
+        """Bring the user's graph in line with their memories, touching only what changed"""
+        with self._lock:
+            self._sync(user_id, memories)
+
+    def related(self, user_id: str, message: str, memories: Optional[Dict[str, List[str]]] = None,
+                k: Optional[int] = None, max_depth: Optional[int] = None,
+                relations: Optional[Set[str]] = None) -> List[Tuple[str, str, float]]:
+        """Memories linked to what the message talks about; syncs first when ``memories`` is given"""
+        start = time.perf_counter()
+        with self._lock:
+            graph = self._sync(user_id, memories) if memories is not None else self._graphs.get(user_id)
+            if graph is None:
+                return []
+            result = graph.related(message, k or self.k, max_depth or self.max_depth, relations)
+            self.counters["queries"] += 1
+            self.counters["query_seconds"] += time.perf_counter() - start
+        return result
+
+    def _sync(self, user_id: str, memories: Dict[str, List[str]]) -> MemoryGraph:
+        graph = self._graphs.setdefault(user_id, MemoryGraph())
+        added, removed = graph.sync(memories)
+        self.counters["items_added"] += added
+        self.counters["items_removed"] += removed
+        return graph
+
+    def graph(self, user_id: str) -> Optional[MemoryGraph]:
+        with self._lock:
+            return self._graphs.get(user_id)
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._graphs.pop(user_id, None)
@@ -0,0 +1,395 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from consolidation import EXACT_CONSOLIDATOR, MemoryConsolidator, MemoryItem
+
+MEMORY_CATEGORIES = ("preferences", "emotional_patterns", "facts")
+
+
+def normalize_memory(item: str) -> str:
+    """Dedup key for a memory item: lowercased, whitespace collapsed, trailing punctuation dropped"""
+    return re.sub(r"\s+", " ", item).strip().rstrip(".!;,").lower()
+
+
+class MemoryStore(ABC):
+    """Persistent memories keyed by user ID and category"""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Dict[str, List[str]]:
+        """All memories for a user, grouped by category in insertion order"""
+
+    @abstractmethod
+    def get_category(self, user_id: str, category: str) -> List[str]:
+        """Memories for a single category"""
+
+    @abstractmethod
+    def contains(self, user_id: str, category: str, item: str) -> bool:
+        """Whether an equivalent item is already stored"""
+
+    @abstractmethod
+    def get_items(self, user_id: str) -> Dict[str, List[MemoryItem]]:
+        """All memories for a user with occurrence counts and last-seen times"""
+
+    @abstractmethod
+    def upsert(self, user_id: str, memories: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Merge new items into existing ones (consolidating near-duplicates) and return the user's full memory dict"""
+
+    @abstractmethod
+    def replace(self, user_id: str, memories: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Drop the user's memories and store these instead (consolidated); cursor and summary are kept"""
+
+    @abstractmethod
+    def clear(self, user_id: str):
+        """Remove all memories and extraction progress for a user"""
+
+    @abstractmethod
+    def get_cursor(self, user_id: str) -> int:
+        """Number of conversation messages already extracted for a user"""
+
+    @abstractmethod
+    def get_cursor_digest(self, user_id: str) -> Optional[str]:
+        """Digest of the conversation prefix the cursor was set on, if recorded"""
+
+    @abstractmethod
+    def set_cursor(self, user_id: str, cursor: int, digest: Optional[str] = None):
+        """Record extraction progress for a user, with the digest of the turns before ``cursor``"""
+
+    @abstractmethod
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        """Rolling conversation summary state, if any"""
+
+    @abstractmethod
+    def set_summary(self, user_id: str, state: Dict):
+        """Replace the rolling conversation summary state"""
+
+    @abstractmethod
+    def get_conversation(self, user_id: str) -> List[Dict]:
+        """Conversation messages kept for a user (role/content dicts, oldest first)"""
+
+    @abstractmethod
+    def append_conversation(self, user_id: str, start: int, messages: List[Dict]):
+        """Write messages at positions ``start``.., replacing anything stored from ``start`` on"""
+
+    def has_memories(self, user_id: str) -> bool:
+        return any(self.get(user_id).values())
+
+    @staticmethod
+    def _clean_items(memories: Dict[str, List[str]]):
+        """Yield (category, dedup key, text) for valid items"""
+        for category in MEMORY_CATEGORIES:
+            for item in memories.get(category, []) or []:
+                if isinstance(item, str) and item.strip():
+                    yield category, normalize_memory(item), item.strip()
+
+    def _prepare(self, user_id: str, memories: Dict[str, List[str]], replace: bool = False):
+        """Embed incoming and stored items before the write takes any lock (see MemoryConsolidator.prepare)"""
+        if self.consolidator.embedder is None:
+            return
+        texts = [text for _, _, text in self._clean_items(memories)]
+        if not replace:
+            texts.extend(item for items in self.get(user_id).values() for item in items)
+        self.consolidator.prepare(texts)
+
+    @classmethod
+    def _group_items(cls, memories: Dict[str, List[str]]) -> Dict[str, List[Tuple[str, str]]]:
+        """Valid (dedup key, text) items per category"""
+        grouped: Dict[str, List[Tuple[str, str]]] = {}
+        for category, key, text in cls._clean_items(memories):
+            grouped.setdefault(category, []).append((key, text))
+        return grouped
+
+
+class InMemoryMemoryStore(MemoryStore):
+    """Process-local store, used when no persistent backend is configured"""
+
+    def __init__(self, consolidator: Optional[MemoryConsolidator] = None):
+        self.consolidator = consolidator or EXACT_CONSOLIDATOR
+        self._memories: Dict[str, Dict[str, Dict[str, MemoryItem]]] = {}
+        # user_id -> (cursor, prefix digest)
+        self._cursors: Dict[str, Tuple[int, Optional[str]]] = {}
+        self._summaries: Dict[str, str] = {}
+        self._conversations: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Dict[str, List[str]]:
+        with self._lock:
+            user = self._memories.get(user_id, {})
+            return {category: [item.text for item in user.get(category, {}).values()]
+                    for category in MEMORY_CATEGORIES}
+
+    def get_category(self, user_id: str, category: str) -> List[str]:
+        with self._lock:
+            return [item.text for item in self._memories.get(user_id, {}).get(category, {}).values()]
+
+    def get_items(self, user_id: str) -> Dict[str, List[MemoryItem]]:
+        with self._lock:
+            user = self._memories.get(user_id, {})
+            return {category: [MemoryItem(item.key, item.text, item.occurrences, item.last_seen)
+                               for item in user.get(category, {}).values()]
+                    for category in MEMORY_CATEGORIES}
+
+    def contains(self, user_id: str, category: str, item: str) -> bool:
+        with self._lock:
+            return normalize_memory(item) in self._memories.get(user_id, {}).get(category, {})
+
+    def upsert(self, user_id: str, memories: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        self._prepare(user_id, memories)
+        with self._lock:
+            self._upsert(user_id, memories)
+        return self.get(user_id)
+
+    def replace(self, user_id: str, memories: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        self._prepare(user_id, memories, replace=True)
+        with self._lock:
+            self._memories.pop(user_id, None)
+            self._upsert(user_id, memories)
+        return self.get(user_id)
+
+    def _upsert(self, user_id: str, memories: Dict[str, List[str]]):
+        now = time.time()
+        user = self._memories.setdefault(user_id, {category: {} for category in MEMORY_CATEGORIES})
+        for category, incoming in self._group_items(memories).items():
+            items = user[category]
+            # Merged items are updated in place; only additions and evictions need applying
+            plan = self.consolidator.plan(list(items.values()), incoming, now)
+            for item in plan.added:
+                items[item.key] = item
+            for key in plan.evicted:
+                items.pop(key, None)
+
+    def clear(self, user_id: str):
+        with self._lock:
+            self._memories.pop(user_id, None)
+            self._cursors.pop(user_id, None)
+            self._summaries.pop(user_id, None)
+
+    def get_cursor(self, user_id: str) -> int:
+        with self._lock:
+            return self._cursors.get(user_id, (0, None))[0]
+
+    def get_cursor_digest(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            return self._cursors.get(user_id, (0, None))[1]
+
+    def set_cursor(self, user_id: str, cursor: int, digest: Optional[str] = None):
+        with self._lock:
+            self._cursors[user_id] = (cursor, digest)
+
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        # Kept serialized so callers can mutate what they get back
+        with self._lock:
+            state = self._summaries.get(user_id)
+        return json.loads(state) if state is not None else None
+
+    def set_summary(self, user_id: str, state: Dict):
+        with self._lock:
+            self._summaries[user_id] = json.dumps(state)
+
+    def get_conversation(self, user_id: str) -> List[Dict]:
+        with self._lock:
+            return [dict(message) for message in self._conversations.get(user_id, [])]
+
+    def append_conversation(self, user_id: str, start: int, messages: List[Dict]):
+        with self._lock:
+            stored = self._conversations.setdefault(user_id, [])
+            del stored[start:]
+            stored.extend({"role": message["role"], "content": message["content"]} for message in messages)
+
+
+class SQLiteMemoryStore(MemoryStore):
+    """File-based store backed by SQLite; (user, category, key) is the primary key, so lookups are B-tree O(log n)"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS memories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        item_key TEXT NOT NULL,
+        content TEXT NOT NULL,
+        occurrences INTEGER NOT NULL DEFAULT 1,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        UNIQUE (user_id, category, item_key)
+    );
+    CREATE TABLE IF NOT EXISTS extraction_cursors (
+        user_id TEXT PRIMARY KEY,
+        cursor INTEGER NOT NULL,
+        prefix_digest TEXT
+    );
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        user_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS conversation_messages (
+        user_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (user_id, seq)
+    );
+    """
+
+    def __init__(self, path: Optional[str] = None, consolidator: Optional[MemoryConsolidator] = None):
+        self.path = path or os.getenv("MEMORY_DB_PATH", "memory.db")
+        self.consolidator = consolidator or EXACT_CONSOLIDATOR
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Open the database on first use"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            # Databases created before occurrence counting
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(memories)")}
+            if "occurrences" not in columns:
+                conn.execute("ALTER TABLE memories ADD COLUMN occurrences INTEGER NOT NULL DEFAULT 1")
+            # ... and before cursors recorded what they were set on
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(extraction_cursors)")}
+            if "prefix_digest" not in columns:
+                conn.execute("ALTER TABLE extraction_cursors ADD COLUMN prefix_digest TEXT")
+            self._conn = conn
+        return self._conn
+
+    def get(self, user_id: str) -> Dict[str, List[str]]:
+        memories = {category: [] for category in MEMORY_CATEGORIES}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT category, content FROM memories WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+        for category, content in rows:
+            memories.setdefault(category, []).append(content)
+        return memories
+
+    def get_category(self, user_id: str, category: str) -> List[str]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT content FROM memories WHERE user_id = ? AND category = ? ORDER BY id", (user_id, category)
+            ).fetchall()
+        return [content for (content,) in rows]
+
+    def get_items(self, user_id: str) -> Dict[str, List[MemoryItem]]:
+        items = {category: [] for category in MEMORY_CATEGORIES}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT category, item_key, content, occurrences, updated_at FROM memories WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ).fetchall()
+        for category, key, content, occurrences, updated_at in rows:
+            items.setdefault(category, []).append(MemoryItem(key, content, occurrences, updated_at))
+        return items
+
+    def contains(self, user_id: str, category: str, item: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM memories WHERE user_id = ? AND category = ? AND item_key = ?",
+                (user_id, category, normalize_memory(item))
+            ).fetchone()
+        return row is not None
+
+    def upsert(self, user_id: str, memories: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        self._prepare(user_id, memories)
+        with self._lock, self.conn:
+            self._upsert(user_id, memories)
+        return self.get(user_id)
+
+    def replace(self, user_id: str, memories: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        self._prepare(user_id, memories, replace=True)
+        # One transaction, so readers see either the old memories or the new ones
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM memories WHERE user_id = ?", (user_id,))
+            self._upsert(user_id, memories)
+        return self.get(user_id)
+
+    def _upsert(self, user_id: str, memories: Dict[str, List[str]]):
+        """Apply the consolidation plan per category; caller holds the lock and the transaction"""
+        now = time.time()
+        for category, incoming in self._group_items(memories).items():
+            existing = [MemoryItem(key, content, occurrences, updated_at)
+                        for key, content, occurrences, updated_at in self.conn.execute(
+                            """SELECT item_key, content, occurrences, updated_at FROM memories
+                               WHERE user_id = ? AND category = ? ORDER BY id""", (user_id, category))]
+            plan = self.consolidator.plan(existing, incoming, now)
+
+            self.conn.executemany(
+                """UPDATE memories SET occurrences = occurrences + ?, updated_at = ?
+                   WHERE user_id = ? AND category = ? AND item_key = ?""",
+                [(count, now, user_id, category, key) for key, count in plan.merged.items()]
+            )
+            # Another process may have inserted the same key meanwhile - add to its count
+            self.conn.executemany(
+                """INSERT INTO memories (user_id, category, item_key, content, occurrences, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, category, item_key)
+                   DO UPDATE SET occurrences = occurrences + excluded.occurrences,
+                                 updated_at = excluded.updated_at""",
+                [(user_id, category, item.key, item.text, item.occurrences, now, now) for item in plan.added]
+            )
+            self.conn.executemany(
+                "DELETE FROM memories WHERE user_id = ? AND category = ? AND item_key = ?",
+                [(user_id, category, key) for key in plan.evicted]
+            )
+
+    def clear(self, user_id: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM memories WHERE user_id = ?", (user_id,))
+            self.conn.execute("DELETE FROM extraction_cursors WHERE user_id = ?", (user_id,))
+            self.conn.execute("DELETE FROM conversation_summaries WHERE user_id = ?", (user_id,))
+
+    def get_cursor(self, user_id: str) -> int:
+        with self._lock:
+            row = self.conn.execute("SELECT cursor FROM extraction_cursors WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_cursor_digest(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT prefix_digest FROM extraction_cursors WHERE user_id = ?",
+                                    (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, user_id: str, cursor: int, digest: Optional[str] = None):
+        with self._lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO extraction_cursors (user_id, cursor, prefix_digest) VALUES (?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET cursor = excluded.cursor,
+                                                       prefix_digest = excluded.prefix_digest""",
+                (user_id, cursor, digest)
+            )
+
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT state FROM conversation_summaries WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_summary(self, user_id: str, state: Dict):
+        with self._lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO conversation_summaries (user_id, state, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at""",
+                (user_id, json.dumps(state), time.time())
+            )
+
+    def get_conversation(self, user_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT role, content FROM conversation_messages WHERE user_id = ? ORDER BY seq", (user_id,)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append_conversation(self, user_id: str, start: int, messages: List[Dict]):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM conversation_messages WHERE user_id = ? AND seq >= ?", (user_id, start))
+            self.conn.executemany(
+                "INSERT INTO conversation_messages (user_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(user_id, start + offset, message["role"], message["content"])
+                 for offset, message in enumerate(messages)]
+            )
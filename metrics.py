@@ -0,0 +1,197 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+# Latency histogram buckets in seconds (Prometheus exporter)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def record_key(record: Dict) -> str:
+    """Series name for a call record, e.g. "generate:Therapist" """
+    return f"{record['operation']}:{record['label']}" if record.get("label") else record["operation"]
+
+
+class InMemoryHistogramExporter:
+    """Keeps the most recent samples per series for percentile summaries"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._series: Dict[str, Dict[str, deque]] = {}
+        self._totals: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict):
+        key = record_key(record)
+        with self._lock:
+            series = self._series.setdefault(key, {
+                "wall_time": deque(maxlen=self.max_samples),
+                "ttft": deque(maxlen=self.max_samples),
+            })
+            series["wall_time"].append(record["wall_time"])
+            if record.get("ttft") is not None:
+                series["ttft"].append(record["ttft"])
+
+            totals = self._totals[key]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += record.get("prompt_tokens") or 0
+            totals["completion_tokens"] += record.get("completion_tokens") or 0
+            totals["cache_hits"] += 1 if record.get("cache_hit") else 0
+            totals["errors"] += 1 if record.get("error") else 0
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for key, series in self._series.items():
+                wall = list(series["wall_time"])
+                ttft = list(series["ttft"])
+                result[key] = dict(self._totals[key])
+                result[key].update({
+                    "p50_ms": round(percentile(wall, 50) * 1000, 1),
+                    "p95_ms": round(percentile(wall, 95) * 1000, 1),
+                    "ttft_p50_ms": round(percentile(ttft, 50) * 1000, 1) if ttft else None,
+                    "ttft_p95_ms": round(percentile(ttft, 95) * 1000, 1) if ttft else None,
+                })
+            return result
+
+
+class JsonLinesExporter:
+    """Appends every call record as one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+
+
+class PrometheusExporter:
+    """Aggregates call records into Prometheus histograms and counters; render() returns the text format"""
+
+    def __init__(self, prefix: str = "companion_llm", buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._latency: Dict[tuple, List[int]] = {}
+        self._latency_sum: Dict[tuple, float] = defaultdict(float)
+        self._latency_count: Dict[tuple, int] = defaultdict(int)
+        self._tokens: Dict[tuple, int] = defaultdict(int)
+        self._cache_hits: Dict[tuple, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict):
+        labels = (record["operation"], record.get("label") or "")
+        with self._lock:
+            counts = self._latency.setdefault(labels, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if record["wall_time"] <= bound:
+                    counts[index] += 1
+            self._latency_sum[labels] += record["wall_time"]
+            self._latency_count[labels] += 1
+            self._tokens[labels + ("prompt",)] += record.get("prompt_tokens") or 0
+            self._tokens[labels + ("completion",)] += record.get("completion_tokens") or 0
+            if record.get("cache_hit"):
+                self._cache_hits[labels] += 1
+
+    @staticmethod
+    def _labels(**labels) -> str:
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+    def render(self, counters: Optional[Dict[str, float]] = None) -> str:
+        name = f"{self.prefix}_call_duration_seconds"
+        lines = [f"# TYPE {name} histogram"]
+        with self._lock:
+            for (operation, label), counts in sorted(self._latency.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{self._labels(operation=operation, label=label, le=bound)} {count}")
+                total = self._latency_count[(operation, label)]
+                lines.append(f"{name}_bucket{self._labels(operation=operation, label=label, le='+Inf')} {total}")
+                lines.append(f"{name}_sum{self._labels(operation=operation, label=label)} "
+                             f"{self._latency_sum[(operation, label)]:.6f}")
+                lines.append(f"{name}_count{self._labels(operation=operation, label=label)} {total}")
+
+            lines.append(f"# TYPE {self.prefix}_tokens_total counter")
+            for (operation, label, kind), count in sorted(self._tokens.items()):
+                lines.append(f"{self.prefix}_tokens_total{self._labels(operation=operation, label=label, kind=kind)} "
+                             f"{count}")
+
+            lines.append(f"# TYPE {self.prefix}_cache_hits_total counter")
+            for (operation, label), count in sorted(self._cache_hits.items()):
+                lines.append(f"{self.prefix}_cache_hits_total{self._labels(operation=operation, label=label)} {count}")
+
+        for counter, value in sorted((counters or {}).items()):
+            lines.append(f"# TYPE {self.prefix}_{counter} counter")
+            lines.append(f"{self.prefix}_{counter} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    """Collects per-call LLM metrics and named counters and fans them out to exporters"""
+
+    def __init__(self, exporters: Optional[List] = None):
+        self.histogram = InMemoryHistogramExporter()
+        self.prometheus = PrometheusExporter()
+        self.exporters = [self.histogram, self.prometheus] + list(exporters or [])
+        self.counters: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def record_call(self, operation: str, wall_time: float, label: Optional[str] = None,
+                    ttft: Optional[float] = None, prompt_tokens: Optional[int] = None,
+                    completion_tokens: Optional[int] = None, cache_hit: bool = False, error: bool = False):
+        record = {
+            "ts": time.time(),
+            "operation": operation,
+            "label": label,
+            "wall_time": wall_time,
+            "ttft": ttft,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cache_hit": cache_hit,
+            "error": error,
+        }
+        for exporter in self.exporters:
+            exporter.export(record)
+
+    def increment(self, name: str, amount: float = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def summary(self) -> Dict[str, Dict]:
+        """p50/p95 latency, TTFT and token totals per operation/persona"""
+        return self.histogram.summary()
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            counters = dict(self.counters)
+        return self.prometheus.render(counters)
+
+
+_default_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Process-wide registry used when no registry is passed explicitly"""
+    return _default_registry
+
+
+def usage_tokens(response) -> tuple:
+    """(prompt_tokens, completion_tokens) from a completion's usage field, if present"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prompt_budget import count_tokens, get_encoding
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERSONA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "personas")
+
+
+def normalize_prompt(text: str) -> str:
+    """Strip indentation and trailing spaces, collapse runs of blanks, keep one newline between lines"""
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+class Persona:
+    """A persona compiled once: normalized prompt, its system message and token ids"""
+
+    __slots__ = ("name", "system_prompt", "color", "icon", "order", "message", "token_ids", "token_count", "source")
+
+    def __init__(self, name: str, system_prompt: str, color: str = "#6b7280", icon: str = "💬", order: int = 0,
+                 model: str = "gpt-4", source: Optional[str] = None):
+        self.name = name
+        self.system_prompt = normalize_prompt(system_prompt)
+        self.color = color
+        self.icon = icon
+        self.order = order
+        self.source = source
+        # The same dict (and so the same bytes) starts every request for this persona
+        self.message = {"role": "system", "content": self.system_prompt}
+        encoding = get_encoding(model)
+        self.token_ids: Optional[Tuple[int, ...]] = tuple(encoding.encode(self.system_prompt)) if encoding else None
+        self.token_count = len(self.token_ids) if self.token_ids is not None else count_tokens(self.system_prompt, model)
+
+
+class PersonaRegistry(Mapping):
+    """Personas loaded from the JSON (or YAML, if PyYAML is installed) files in a directory.
+
+    Behaves as a read-only mapping of name to Persona in display order. The directory is
+    re-scanned at most every ``reload_interval`` seconds and files are recompiled when any of
+    them is added, removed or modified, so personas can be edited without a restart.
+    """
+
+    EXTENSIONS = (".json", ".yaml", ".yml")
+
+    def __init__(self, directory: Optional[str] = None, model: str = "gpt-4", reload_interval: float = 2.0):
+        self.directory = directory or os.getenv("PERSONA_DIR", DEFAULT_PERSONA_DIR)
+        self.model = model
+        self.reload_interval = reload_interval
+        self._personas: Dict[str, Persona] = {}
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _files(self) -> List[str]:
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(self.EXTENSIONS)]
+
+    def _scan(self) -> Tuple:
+        """Cheap change detector: (path, mtime, size) of every persona file"""
+        signature = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load_file(self, path: str) -> Optional[Dict]:
+        with open(path, encoding="utf-8") as handle:
+            if path.endswith(".json"):
+                return json.load(handle)
+            # Only imported when a YAML persona file exists
+            try:
+                import yaml
+            except ImportError:  # JSON persona files only
+                logger.warning("Skipping %s: PyYAML is not installed", path)
+                return None
+            return yaml.safe_load(handle)
+
+    def reload(self) -> bool:
+        """Recompile every persona if the files changed; returns whether anything was reloaded"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._scan()
+            if signature == self._signature:
+                return False
+
+            personas = []
+            for path, _, _ in signature:
+                try:
+                    data = self._load_file(path)
+                    if data is None:
+                        continue
+                    personas.append(Persona(data["name"], data["system_prompt"], data.get("color", "#6b7280"),
+                                            data.get("icon", "💬"), int(data.get("order", 0)), self.model, path))
+                except Exception as e:
+                    # Keep the last good version while a file is mid-edit or invalid
+                    logger.warning("Could not load persona file %s: %s", path, e)
+                    personas.extend(persona for persona in self._personas.values() if persona.source == path)
+
+            personas.sort(key=lambda persona: (persona.order, persona.name))
+            self._personas = {persona.name: persona for persona in personas}
+            self._signature = signature
+            return True
+
+    def _current(self) -> Dict[str, Persona]:
+        # Files are first read on first use, not at import
+        if self._signature is None or (self.reload_interval is not None
+                                       and time.monotonic() - self._checked_at >= self.reload_interval):
+            self.reload()
+        return self._personas
+
+    def __getitem__(self, name: str) -> Persona:
+        return self._current()[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._current()))
+
+    def __len__(self) -> int:
+        return len(self._current())
@@ -0,0 +1,163 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+# Chat format overhead per message and for priming the reply (OpenAI cookbook numbers)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Tokenizer for a model (loaded once per process), or None when tiktoken is unavailable"""
+    # Imported on first use: tiktoken and its encoding files are a noticeable part of cold start
+    try:
+        import tiktoken
+    except ImportError:  # Fall back to a character-based estimate
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Azure deployment names are not model names
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encoding files are downloaded on first use; estimate when offline
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1 if text else 0
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[Dict], model: str = "gpt-4") -> int:
+    """Prompt tokens for a chat request, including per-message overhead"""
+    return sum(count_tokens(message["content"], model) + TOKENS_PER_MESSAGE for message in messages) + TOKENS_PER_REPLY
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4", keep: str = "head") -> str:
+    """Cut text to at most max_tokens, keeping its start ("head") or its end ("tail")"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    encoding = get_encoding(model)
+    if encoding is None:
+        # Longest cut the character estimate in count_tokens still counts as max_tokens
+        chars = max_tokens * 4 - 1
+        return text[:chars] if keep == "head" else text[-chars:]
+
+    tokens = encoding.encode(text)
+    kept = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+    return encoding.decode(kept)
+
+
+class PromptSection:
+    """One named part of a prompt with its own budget and priority (lower priority is cut first)"""
+
+    def __init__(self, name: str, content: str, budget: Optional[int] = None, priority: int = 0,
+                 role: Optional[str] = None, template: str = "{}", keep: str = "head", optional: bool = True):
+        self.name = name
+        self.content = content or ""
+        self.budget = budget
+        self.priority = priority
+        # Sections with a role become chat messages; others are only fitted for the caller to format
+        self.role = role
+        self.template = template
+        self.keep = keep
+        # Optional sections are dropped from the messages when empty
+        self.optional = optional
+
+
+class PromptPlan:
+    """Result of assembling a prompt: fitted section texts, chat messages and token counts"""
+
+    def __init__(self, texts: Dict[str, str], messages: List[Dict], section_tokens: Dict[str, int],
+                 prompt_tokens: int, max_completion_tokens: int, truncated: List[str]):
+        self.texts = texts
+        self.messages = messages
+        self.section_tokens = section_tokens
+        self.prompt_tokens = prompt_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.truncated = truncated
+
+    @property
+    def max_total_tokens(self) -> int:
+        """Upper bound on billed tokens for the call"""
+        return self.prompt_tokens + self.max_completion_tokens
+
+    def report(self) -> Dict:
+        return {
+            "sections": dict(self.section_tokens),
+            "prompt_tokens": self.prompt_tokens,
+            "max_completion_tokens": self.max_completion_tokens,
+            "max_total_tokens": self.max_total_tokens,
+            "truncated": list(self.truncated),
+        }
+
+
+class PromptAssembler:
+    """Fits prompt sections into per-section and overall token budgets.
+
+    Each section is first cut to its own budget. If the total still exceeds ``max_prompt_tokens``,
+    sections are shrunk in order of ascending priority, using ``summarizer(text, max_tokens)`` when
+    provided and plain truncation otherwise.
+    """
+
+    def __init__(self, model: str = "gpt-4", max_prompt_tokens: int = 4000,
+                 summarizer: Optional[Callable[[str, int], str]] = None):
+        self.model = model
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summarizer = summarizer
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def _shrink(self, section: PromptSection, text: str, max_tokens: int) -> str:
+        if self.summarizer is not None and max_tokens > 0:
+            text = self.summarizer(text, max_tokens)
+        return truncate_to_tokens(text, max_tokens, self.model, section.keep)
+
+    def assemble(self, sections: List[PromptSection], max_completion_tokens: int = 0) -> PromptPlan:
+        texts: Dict[str, str] = {}
+        truncated: List[str] = []
+
+        for section in sections:
+            text = section.content
+            if section.budget is not None and self.count(text) > section.budget:
+                text = self._shrink(section, text, section.budget)
+                truncated.append(section.name)
+            texts[section.name] = text
+
+        def section_cost(section: PromptSection) -> int:
+            text = texts[section.name]
+            if not text and section.optional:
+                return 0
+            cost = self.count(section.template.format(text))
+            return cost + TOKENS_PER_MESSAGE if section.role else cost
+
+        overflow = sum(section_cost(section) for section in sections) + TOKENS_PER_REPLY - self.max_prompt_tokens
+        for section in sorted(sections, key=lambda item: item.priority):
+            if overflow <= 0:
+                break
+            current = self.count(texts[section.name])
+            if not current:
+                continue
+            before = section_cost(section)
+            texts[section.name] = self._shrink(section, texts[section.name], max(current - overflow, 0))
+            overflow -= before - section_cost(section)
+            if section.name not in truncated:
+                truncated.append(section.name)
+
+        messages = [
+            {"role": section.role, "content": section.template.format(texts[section.name])}
+            for section in sections if section.role and (texts[section.name] or not section.optional)
+        ]
+        section_tokens = {section.name: section_cost(section) for section in sections}
+        prompt_tokens = count_message_tokens(messages, self.model) if messages else sum(section_tokens.values())
+
+        return PromptPlan(texts, messages, section_tokens, prompt_tokens, max_completion_tokens, truncated)
@@ -0,0 +1,243 @@
+import re
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from memory_store import MEMORY_CATEGORIES
+
+# An embedding function maps a batch of texts to an (n, dim) float32 matrix
+EmbeddingFunction = Callable[[Sequence[str]], np.ndarray]
+
+CATEGORY_LABELS = {
+    "facts": "User Facts",
+    "emotional_patterns": "Emotions",
+    "preferences": "Preferences",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) for budgeting"""
+    return len(text) // 4 + 1
+
+
+class HashingEmbedder:
+    """Offline embedding via feature hashing of words and character trigrams (no network, deterministic)"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = re.findall(r"\w+", text.lower())
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dim] += sign
+        return vectors
+
+
+class AzureEmbedder:
+    """Embeddings from an Azure OpenAI embedding deployment"""
+
+    def __init__(self, client, deployment_name: str):
+        self.client = client
+        self.deployment = deployment_name
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.deployment, input=list(texts))
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+class VectorIndex:
+    """In-process cosine-similarity index: brute force by default, optional IVF partitioning and int8 quantization"""
+
+    def __init__(self, dim: int, nlist: int = 0, nprobe: int = 4, quantize: bool = False, seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.quantize = quantize
+        self.seed = seed
+
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._codes = np.zeros((0, dim), dtype=np.int8)
+        self._scales = np.zeros(0, dtype=np.float32)
+
+        # IVF state, rebuilt lazily after additions
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._scales) if self.quantize else len(self._vectors)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, vectors: np.ndarray):
+        """Append vectors; their ids are their insertion positions"""
+        vectors = self._normalize(vectors)
+        if self.quantize:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._codes = np.vstack([self._codes, codes])
+            self._scales = np.concatenate([self._scales, scales.astype(np.float32)])
+        else:
+            self._vectors = np.vstack([self._vectors, vectors])
+        self._dirty = True
+
+    def _matrix(self, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        if not self.quantize:
+            return self._vectors if ids is None else self._vectors[ids]
+        codes = self._codes if ids is None else self._codes[ids]
+        scales = self._scales if ids is None else self._scales[ids]
+        return codes.astype(np.float32) * scales[:, None]
+
+    def _train(self):
+        """Spherical k-means over the stored vectors to build the IVF lists"""
+        matrix = self._matrix()
+        rng = np.random.default_rng(self.seed)
+        centroids = matrix[rng.choice(len(matrix), self.nlist, replace=False)]
+        for _ in range(10):
+            assignments = np.argmax(matrix @ centroids.T, axis=1)
+            for cluster in range(self.nlist):
+                members = matrix[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+        self._centroids = centroids
+        self._assignments = np.argmax(matrix @ centroids.T, axis=1)
+        self._dirty = False
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top-k (id, cosine score) pairs, best first"""
+        if len(self) == 0 or k <= 0:
+            return []
+
+        query = self._normalize(query)[0]
+
+        candidates = None
+        if self.nlist and len(self) >= self.nlist * 4:
+            if self._dirty or self._centroids is None:
+                self._train()
+            probe = np.argsort(-(self._centroids @ query))[:self.nprobe]
+            candidates = np.flatnonzero(np.isin(self._assignments, probe))
+
+        scores = self._matrix(candidates) @ query
+        ids = np.arange(len(self)) if candidates is None else candidates
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+class MemoryRetriever:
+    """Ranks a user's memory items against the incoming message and builds a token-bounded context"""
+
+    def __init__(self, embedder: Optional[EmbeddingFunction] = None, top_k: int = 6, token_budget: int = 150,
+                 **index_options):
+        self.embedder = embedder or HashingEmbedder()
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.index_options = index_options
+
+        # Per-user index plus the (category, item) entry for each index id
+        self._indexes: Dict[str, Tuple[Optional[VectorIndex], List[Tuple[str, str]]]] = {}
+        # Per-user item vectors, trimmed to the user's current items so the cache stays bounded
+        self._vectors: Dict[str, Dict[str, np.ndarray]] = {}
+        # Guards the dicts above only; embedding calls (possibly network) are made without it
+        self._lock = threading.Lock()
+
+    def _index_for(self, user_id: str, entries: List[Tuple[str, str]],
+                   vectors: Dict[str, np.ndarray]) -> Tuple[Optional[VectorIndex], List[Tuple[str, str]]]:
+        """Return the user's index, adding only entries not indexed yet; ``vectors`` covers every entry's
+        text and caller holds the lock"""
+        index, indexed = self._indexes.get(user_id, (None, []))
+        current = set(entries)
+        if index is not None and current.issuperset(indexed):
+            known = set(indexed)
+            new_entries = [entry for entry in entries if entry not in known]
+            if new_entries:
+                index.add(np.array([vectors[item] for _, item in new_entries], dtype=np.float32))
+                indexed = indexed + new_entries
+        elif entries:
+            # First build, or items were removed - rebuild from scratch
+            matrix = np.array([vectors[item] for _, item in entries], dtype=np.float32)
+            index = VectorIndex(matrix.shape[1], **self.index_options)
+            index.add(matrix)
+            indexed = entries
+        else:
+            index, indexed = None, []
+
+        self._indexes[user_id] = (index, indexed)
+        self._vectors[user_id] = vectors
+        return index, indexed
+
+    def retrieve(self, user_id: str, memories: Dict, message: str, k: Optional[int] = None,
+                 token_budget: Optional[int] = None,
+                 related: Sequence[Tuple[str, str, float]] = ()) -> List[Tuple[str, str, float]]:
+        """Most relevant (category, item, score) triples that fit in the token budget.
+
+        ``related`` items (e.g. from the memory graph) are taken first; vector hits fill the rest.
+        """
+        k = k or self.top_k
+        token_budget = token_budget if token_budget is not None else self.token_budget
+
+        entries = [(category, item) for category in MEMORY_CATEGORIES for item in memories.get(category, [])]
+        if not entries:
+            return []
+
+        with self._lock:
+            cached = self._vectors.get(user_id, {})
+            vectors = {item: cached[item] for _, item in entries if item in cached}
+        missing = [item for item in dict.fromkeys(item for _, item in entries) if item not in vectors]
+        # New items and the message in one batch, outside the lock: a slow embedding call for one
+        # user never holds up context building for the others
+        embedded = self.embedder(missing + [message])
+        vectors.update(zip(missing, embedded))
+
+        with self._lock:
+            index, entries = self._index_for(user_id, entries, vectors)
+            hits = index.search(embedded[-1], k)
+
+        selected = []
+        seen = set()
+        used = 0
+        candidates = list(related) + [entries[entry_id] + (score,) for entry_id, score in hits]
+        for category, item, score in candidates:
+            cost = estimate_tokens(item)
+            if (category, item) in seen or used + cost > token_budget:
+                continue
+            used += cost
+            seen.add((category, item))
+            selected.append((category, item, score))
+        return selected
+
+    def forget(self, user_id: str):
+        """Drop the user's index and vectors (rebuilt on the next retrieval)"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            self._vectors.pop(user_id, None)
+
+    def build_context(self, user_id: str, memories: Dict, message: str, **kwargs) -> str:
+        """Context string containing only the memories relevant to the message"""
+        grouped: Dict[str, List[str]] = {}
+        for category, item, _ in self.retrieve(user_id, memories, message, **kwargs):
+            grouped.setdefault(category, []).append(item)
+
+        parts = [f"{CATEGORY_LABELS[category]}: {', '.join(grouped[category])}."
+                 for category in CATEGORY_LABELS if category in grouped]
+        return " ".join(parts)
@@ -0,0 +1,75 @@
+from typing import Dict, List, Mapping, Optional
+
+from metrics import MetricsRegistry, get_metrics
+
+TASKS = ("extract", "generate", "compare", "summarize")
+
+
+class Route:
+    """A deployment serving a task for inputs up to ``max_input_tokens`` (None: any size)"""
+
+    __slots__ = ("name", "deployment", "max_input_tokens")
+
+    def __init__(self, name: str, deployment: str, max_input_tokens: Optional[int] = None):
+        self.name = name
+        self.deployment = deployment
+        self.max_input_tokens = max_input_tokens
+
+
+class ModelRouter:
+    """Picks a deployment per task type and prompt size, and counts what each route handles.
+
+    Routes for a task are tried in order and the first whose ``max_input_tokens`` fits wins, so a
+    task can go to a small fast model for short prompts and fall through to a larger one. Tasks
+    without routes use ``default_deployment``. Per-route call counts, latency and quality signals
+    go to the metrics registry as ``route_<task>_<route>_*`` counters and ``route_<task>`` calls.
+    """
+
+    def __init__(self, default_deployment: str, routes: Optional[Dict[str, List[Route]]] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.default = Route("default", default_deployment)
+        self.routes = {task: list(task_routes) for task, task_routes in (routes or {}).items()}
+        self.metrics = metrics or get_metrics()
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str], default_deployment: str,
+                 metrics: Optional[MetricsRegistry] = None) -> "ModelRouter":
+        """AZURE_OPENAI_<TASK>_DEPLOYMENT per task; prompts over ROUTER_LARGE_INPUT_TOKENS go to
+        AZURE_OPENAI_LARGE_DEPLOYMENT when it is set"""
+        large = env.get("AZURE_OPENAI_LARGE_DEPLOYMENT")
+        large_threshold = int(env.get("ROUTER_LARGE_INPUT_TOKENS", "6000"))
+        routes = {}
+        for task in TASKS:
+            deployment = env.get(f"AZURE_OPENAI_{task.upper()}_DEPLOYMENT")
+            task_routes = []
+            if deployment:
+                task_routes.append(Route(task, deployment, large_threshold if large else None))
+            elif large:
+                task_routes.append(Route("default", default_deployment, large_threshold))
+            if large:
+                task_routes.append(Route("large", large))
+            if task_routes:
+                routes[task] = task_routes
+        return cls(default_deployment, routes, metrics)
+
+    def select(self, task: str, input_tokens: int = 0) -> Route:
+        for route in self.routes.get(task, ()):
+            if route.max_input_tokens is None or input_tokens <= route.max_input_tokens:
+                self.count(task, route, "calls")
+                return route
+        self.count(task, self.default, "calls")
+        return self.default
+
+    def deployment_for(self, task: str, input_tokens: int = 0) -> str:
+        return self.select(task, input_tokens).deployment
+
+    def count(self, task: str, route: Route, name: str, amount: float = 1):
+        self.metrics.increment(f"route_{task}_{route.name}_{name}_total", amount)
+
+    def record(self, task: str, route: Route, wall_time: float, error: bool = False, items: Optional[int] = None):
+        """Latency per route, plus errors and (for extraction) items produced as a quality signal"""
+        self.metrics.record_call(f"route_{task}", wall_time, label=route.name, error=error)
+        if error:
+            self.count(task, route, "errors")
+        if items is not None:
+            self.count(task, route, "items", items)
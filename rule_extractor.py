@@ -0,0 +1,135 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from memory_store import MEMORY_CATEGORIES
+
+# (category, pattern, template); {1}.. are the pattern's groups, rewritten in the third person.
+# Templates always rephrase: a raw clause is not a memory, and the LLM never sees windows the rules cover
+RULES = [
+    ("preferences", r"\bi (?:really |also )?(?:love|like|enjoy|prefer|adore) (.+)", "Likes {1}"),
+    ("preferences", r"\bi (?:hate|dislike|can'?t stand|don'?t like|do not like) (.+)", "Dislikes {1}"),
+    ("preferences", r"\bi (?:usually|always|often|mostly|normally) (.+)", "Usually {1}"),
+    ("preferences", r"\bmy favou?rite (.+)", "Favourite {1}"),
+    ("preferences", r"\b(?:raat|night) .*\b(?:padh|study|studies|studying)", "Studies late at night"),
+    ("emotional_patterns", r"\bi(?:'m| am) (?:so |really |very |a bit |kinda |quite |always )?"
+                           r"(stressed|anxious|worried|scared|afraid|nervous|overwhelmed|sad|depressed|lonely|"
+                           r"burnt out|exhausted|frustrated|angry|upset|tired)(?: ((?:about|because of|of|with) .+))?",
+     "Feels {1} {2}"),
+    ("emotional_patterns", r"\bi (?:feel|am feeling|'m feeling) ((?:like )?.+)", "Feels {1}"),
+    ("emotional_patterns", r"\bfeeling (.+)", "Feeling {1}"),
+    ("emotional_patterns", r"\bcan'?t sleep|\bcannot sleep|\bnot sleeping", "Trouble sleeping"),
+    ("emotional_patterns", r"\b(?:darr|dar|dara) (?:lagta|lagti|lag raha)", "Feels fear and anxiety"),
+    ("emotional_patterns", r"\bgiv(?:e|ing) up\b", "Thoughts of giving up"),
+    ("emotional_patterns", r"\bi (?:usually |always |often )?(?:avoid|procrastinate on|put off) (.+)", "Avoids {1}"),
+    ("facts", r"\bmy (parents|father|mother|dad|mom|papa|mummy) (?:are|is) (?:also )?(?:pressuring|pushing) me\b",
+     "Pressured by their {1}"),
+    ("facts", r"\b(?:my|meri|mera) (father|mother|dad|mom|papa|mummy|parents|brother|sister)\b.*?\b(?:is|are|was) "
+              r"(?:an? |both )?(engineers?|doctors?|teachers?|lawyers?|professors?)\b", "Their {1}: {2}"),
+    ("facts", r"\b(papa|mummy|dad|mom)\b .*?\b(engineer|doctor|teacher|lawyer|professor)\b", "Their {1}: {2}"),
+    ("facts", r"\b(?:preparing|studying) for (.+)", "Preparing for {1}"),
+    ("facts", r"\bmy ((?:\w+ ){0,2}?(?:exams?|tests?|interviews?|deadlines?|mains|boards))\b.*?"
+              r"\b(next (?:week|month|year)|tomorrow|this (?:week|month))\b", "Has {1} {2}"),
+    ("facts", r"\b(?:scor\w*|got|getting) (?:around |about )?(\d{2,3}\s*(?:/|out of)\s*\d{2,3})\b", "Scored {1}"),
+    ("facts", r"\bi(?:'m| am) (?:a|an) (\w+(?: \w+)?)(?: at| in| from|$)", "Is a {1}"),
+    ("facts", r"\bi work (?:at|in|for) (.+)", "Works at {1}"),
+    ("facts", r"\bi study (?:at|in) (.+)", "Studies at {1}"),
+    ("facts", r"\bi live in (.+)", "Lives in {1}"),
+]
+
+# First-person words in captured text, rewritten so items describe the user like the LLM's do
+THIRD_PERSON = [
+    (r"\bi am\b|\bi'm\b", "they are"), (r"\bi was\b", "they were"), (r"\bi\b", "they"),
+    (r"\bmyself\b", "themselves"), (r"\bmine\b", "theirs"), (r"\bmy\b", "their"), (r"\bme\b", "them"),
+]
+
+
+@lru_cache(maxsize=None)
+def compiled_rules() -> Tuple:
+    """RULES compiled on first use rather than at import"""
+    return tuple((category, re.compile(pattern, re.IGNORECASE), template) for category, pattern, template in RULES)
+
+
+@lru_cache(maxsize=None)
+def compiled_pronouns() -> Tuple:
+    return tuple((re.compile(pattern, re.IGNORECASE), replacement) for pattern, replacement in THIRD_PERSON)
+
+
+# Acknowledgements carry no memory; windows made only of these need no LLM call
+SMALL_TALK = re.compile(r"^(?:ok(?:ay)?|hmm+|haan|han|yes|yeah|no|nahi|thanks?|thank you|good idea|sure|cool|"
+                        r"makes sense|i'?ll try(?: that)?|will do|got it|bye)\b", re.IGNORECASE)
+
+MIN_CLAUSE_WORDS = 4
+MAX_ITEM_CHARS = 90
+
+
+def _clauses(text: str) -> List[str]:
+    return [clause.strip() for clause in re.split(r"(?<=[.!?])\s+|\s+-\s+", text) if clause.strip()]
+
+
+def _third_person(text: str) -> str:
+    for pattern, replacement in compiled_pronouns():
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _clean(text: str, capitalize: bool = True) -> str:
+    text = re.sub(r"\s+", " ", text).strip(" .,!?;:-")
+    if len(text) > MAX_ITEM_CHARS:
+        text = text[:MAX_ITEM_CHARS].rsplit(" ", 1)[0]
+    if not capitalize:
+        # Keep acronyms and names, lower-case ordinary words spliced into a template
+        return text[:1].lower() + text[1:] if text[1:2].islower() else text
+    return text[:1].upper() + text[1:]
+
+
+class RuleBasedExtractor:
+    """Local regex extractor: the first tier of memory extraction, with no network call.
+
+    Each substantive user clause (not small talk) is matched against RULES. Confidence is the
+    share of those clauses that produced at least one memory, so windows the rules understand
+    well - or that are pure small talk - can skip the LLM entirely.
+    """
+
+    def __init__(self, rules=None, confidence_threshold: float = 0.75):
+        self.rules = rules or compiled_rules()
+        self.confidence_threshold = confidence_threshold
+
+    def extract(self, conversations: List[Dict]) -> Tuple[Dict[str, List[str]], float]:
+        """(memories, confidence in [0, 1]) from the user turns"""
+        memories = {category: [] for category in MEMORY_CATEGORIES}
+        substantive = matched = 0
+
+        for message in conversations:
+            if message.get("role") != "user":
+                continue
+            for clause in _clauses(message.get("content", "")):
+                if SMALL_TALK.match(clause) and len(clause.split()) < MIN_CLAUSE_WORDS + 2:
+                    continue
+                if len(clause.split()) < MIN_CLAUSE_WORDS:
+                    continue
+                substantive += 1
+                hits = self._match(clause)
+                if hits:
+                    matched += 1
+                for category, item in hits:
+                    if item not in memories[category]:
+                        memories[category].append(item)
+
+        confidence = 1.0 if substantive == 0 else matched / substantive
+        return memories, confidence
+
+    def is_confident(self, confidence: float) -> bool:
+        return confidence >= self.confidence_threshold
+
+    def _match(self, clause: str) -> List[Tuple[str, str]]:
+        hits = []
+        for category, pattern, template in self.rules:
+            match = pattern.search(clause)
+            if match is None:
+                continue
+            groups = [_clean(_third_person(group or ""), capitalize=False) for group in match.groups()]
+            item = _clean(template.format(clause, *groups))
+            if item and len(item.split()) >= 2:
+                hits.append((category, item))
+        return hits
@@ -0,0 +1,229 @@
+import json
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Iterator, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from companion import CompanionServices
+from engines import FailedReply, PersonalityEngine
+
+# One set of engines, caches and connection pool per worker process. Run several workers with
+# `uvicorn service:app --workers 4`; they share memories through the SQLite store and, when
+# RESPONSE_CACHE_PATH is set, LLM responses through the disk tier of the cache.
+services = CompanionServices()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Accept requests right away; engines, tokenizer and numpy load in the background
+    threading.Thread(target=services.warm_up, name="warm-up", daemon=True).start()
+    yield
+    # Session turns not yet spilled to the store would otherwise be lost on restart
+    await run_in_threadpool(services.close)
+
+
+app = FastAPI(title="AI Companion Memory Engine", lifespan=lifespan)
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+class ExtractRequest(BaseModel):
+    user_id: str
+    conversations: List[Message]
+    # Block until the extraction finishes instead of returning as soon as it is queued
+    wait: bool = False
+    timeout: float = 60.0
+    # Return NDJSON memory items as the model emits them, until the extraction finishes
+    stream: bool = False
+
+
+class GenerateRequest(BaseModel):
+    message: str
+    personality: str = "Calm Mentor"
+    user_id: Optional[str] = None
+    # Without conversations, a user_id's history is kept server-side and the exchange appended to it
+    conversations: List[Message] = Field(default_factory=list)
+    # Explicit context skips the memory lookup for user_id
+    context: Optional[str] = None
+    stream: bool = False
+
+
+class CompareRequest(BaseModel):
+    message: str
+    personalities: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    conversations: List[Message] = Field(default_factory=list)
+    context: Optional[str] = None
+    stream: bool = False
+
+
+class MemoryUpdate(BaseModel):
+    preferences: List[str] = Field(default_factory=list)
+    emotional_patterns: List[str] = Field(default_factory=list)
+    facts: List[str] = Field(default_factory=list)
+
+
+def _require_client():
+    if services.client is None:
+        raise HTTPException(status_code=503, detail=services.client_error or "Azure OpenAI client unavailable")
+
+
+def _check_personality(personality: str):
+    if personality not in PersonalityEngine.PERSONALITIES:
+        raise HTTPException(status_code=404, detail=f"Unknown personality: {personality}")
+
+
+async def _conversation(user_id: Optional[str], conversations: List[Message]) -> List[Dict]:
+    """The turns sent with the request, or else the user's server-side session history.
+
+    Turns sent for a user become their session history, so extraction cursors built on either
+    source count turns of the same conversation.
+    """
+    history = [turn.model_dump() for turn in conversations]
+    if not user_id:
+        return history
+    if history:
+        await run_in_threadpool(services.sessions.sync, user_id, history)
+        return history
+    return await run_in_threadpool(services.sessions.conversations, user_id)
+
+
+async def _context(user_id: Optional[str], message: str, history: List[Dict], context: Optional[str],
+                   from_session: bool) -> str:
+    if context is not None or not user_id:
+        return context or ""
+    return await run_in_threadpool(services.memory_context, user_id, message, history, from_session)
+
+
+def _history(user_id: Optional[str], conversations: List[Dict]) -> str:
+    if not user_id or not conversations:
+        return ""
+    return services.history_block(user_id, conversations)
+
+
+def _remember(user_id: str, message: str, deltas: Iterator[str]) -> Iterator[str]:
+    """Pass a reply stream through, appending the exchange to the user's session once it completes"""
+    parts = []
+    for delta in deltas:
+        parts.append(delta)
+        yield delta
+    # A failed reply is shown to the client but never persisted, summarized or extracted from
+    if any(isinstance(part, FailedReply) for part in parts):
+        return
+    services.sessions.extend(user_id, [{"role": "user", "content": message},
+                                       {"role": "assistant", "content": "".join(parts)}])
+
+
+def _ndjson(events) -> StreamingResponse:
+    lines = (json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+def _extraction_events(user_id: str, items) -> Iterator[Dict]:
+    """Extracted items as NDJSON events, then an error event if the extraction failed"""
+    for category, item in items:
+        yield {"category": category, "item": item}
+    error = services.worker.last_error(user_id)
+    if error is not None:
+        yield {"error": error}
+
+
+@app.get("/healthz")
+async def healthz() -> Dict:
+    return {"status": "ok" if services.client is not None else "degraded", "error": services.client_error}
+
+
+@app.post("/extract")
+async def extract(request: ExtractRequest) -> Dict:
+    """Queue incremental extraction for the new turns; with ``wait`` return the resulting memories"""
+    _require_client()
+    history = await _conversation(request.user_id, request.conversations)
+    # Session history only grows, so it never resets what was extracted before
+    from_session = not request.conversations
+    if request.stream:
+        items = services.worker.stream(request.user_id, history, timeout=request.timeout, append_only=from_session)
+        return _ndjson(_extraction_events(request.user_id, items))
+
+    queued = services.worker.submit(request.user_id, history, append_only=from_session)
+    if not request.wait:
+        return {"status": services.worker.status(request.user_id), "queued": queued}
+
+    finished = await run_in_threadpool(services.worker.wait, request.user_id, request.timeout)
+    error = services.worker.last_error(request.user_id) if finished else None
+    if error is not None:
+        # What earlier extractions stored, possibly nothing; the failed turns are retried next time
+        return {"status": "failed", "error": error, "memories": services.store.get(request.user_id)}
+    memories = services.worker.last_result(request.user_id) or services.store.get(request.user_id)
+    return {"status": "done" if finished else services.worker.status(request.user_id), "memories": memories}
+
+
+@app.post("/generate")
+async def generate(request: GenerateRequest):
+    """One persona reply; ``stream`` returns plain-text deltas as they arrive"""
+    _require_client()
+    _check_personality(request.personality)
+    conversation = await _conversation(request.user_id, request.conversations)
+    session = request.user_id if request.user_id and not request.conversations else None
+    context = await _context(request.user_id, request.message, conversation, request.context, session is not None)
+    history = await run_in_threadpool(_history, request.user_id, conversation)
+
+    if request.stream:
+        # Starlette iterates sync generators in its threadpool, so the event loop is never blocked
+        deltas = services.engine.generate_response_stream(request.message, request.personality, context, history)
+        if session:
+            deltas = _remember(session, request.message, deltas)
+        return StreamingResponse(deltas, media_type="text/plain; charset=utf-8")
+
+    response = await run_in_threadpool(services.engine.generate_response, request.message,
+                                       request.personality, context, history)
+    if session and not isinstance(response, FailedReply):
+        await run_in_threadpool(services.sessions.extend, session, [
+            {"role": "user", "content": request.message}, {"role": "assistant", "content": response}])
+    return {"personality": request.personality, "response": response}
+
+
+@app.post("/compare")
+async def compare(request: CompareRequest):
+    """Replies from several personas generated concurrently; ``stream`` returns NDJSON delta events"""
+    _require_client()
+    personalities = request.personalities or list(PersonalityEngine.PERSONALITIES)
+    for personality in personalities:
+        _check_personality(personality)
+    conversation = await _conversation(request.user_id, request.conversations)
+    context = await _context(request.user_id, request.message, conversation, request.context,
+                             not request.conversations)
+    history = await run_in_threadpool(_history, request.user_id, conversation)
+
+    if request.stream:
+        events = services.engine.stream_many(request.message, personalities, context, history)
+        return _ndjson({"personality": personality, "delta": delta, "done": delta is None}
+                       for personality, delta in events)
+
+    responses = await run_in_threadpool(
+        lambda: dict(services.engine.generate_many(request.message, personalities, context, history)))
+    return {"responses": {personality: responses[personality] for personality in personalities}}
+
+
+@app.get("/memories/{user_id}")
+async def get_memories(user_id: str) -> Dict:
+    return await run_in_threadpool(services.store.get, user_id)
+
+
+@app.put("/memories/{user_id}")
+async def put_memories(user_id: str, update: MemoryUpdate) -> Dict:
+    """Merge memories into the store (deduplicated); returns the user's full memory set"""
+    memories = await run_in_threadpool(services.store.upsert, user_id, update.model_dump())
+    services.publish_memories(user_id, memories)
+    return memories
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    return services.metrics.render_prometheus()
@@ -0,0 +1,231 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from memory_store import MemoryStore
+from metrics import MetricsRegistry, get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Fixed per-object costs (CPython, 64-bit) used for the size estimate; string payloads are measured
+TURN_OVERHEAD = 56
+SESSION_OVERHEAD = 400
+
+_ROLES = {role: sys.intern(role) for role in ("user", "assistant", "system")}
+
+
+def _intern(table: Dict[str, str], key: str) -> str:
+    return table.get(key) or sys.intern(key)
+
+
+class Turn:
+    """One conversation message; roles are interned so every turn shares the same few strings"""
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = _intern(_ROLES, role)
+        self.content = content
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def size(self) -> int:
+        return TURN_OVERHEAD + sys.getsizeof(self.content)
+
+
+class UserSession:
+    """Resident state for one user: their conversation turns.
+
+    Memories are not kept here: other worker processes update them in the shared store.
+    """
+
+    __slots__ = ("user_id", "turns", "persisted", "truncated", "last_access", "size")
+
+    def __init__(self, user_id: str, turns: List[Turn]):
+        self.user_id = user_id
+        self.turns = turns
+        # Turns already written to the persistent store; only the rest is spilled on eviction
+        self.persisted = len(turns)
+        # Turns were dropped, so the store holds messages past the end of ``turns`` until the next spill
+        self.truncated = False
+        self.last_access = time.monotonic()
+        self.size = SESSION_OVERHEAD + sum(turn.size() for turn in turns)
+
+    @property
+    def dirty(self) -> bool:
+        return self.truncated or self.persisted < len(self.turns)
+
+
+class SessionManager:
+    """Per-user conversation state for many concurrent users under one memory cap.
+
+    Sessions live in an LRU map. When the estimated total size exceeds ``max_bytes`` (or there are
+    more than ``max_sessions``), or a session sits idle for ``idle_seconds``, the least recently
+    used sessions are evicted: turns not yet persisted are spilled to the memory store and the
+    session is dropped. The next access reloads it from the store, so eviction only costs a read.
+    """
+
+    def __init__(self, store: MemoryStore, max_bytes: int = 256 * 1024 * 1024, max_sessions: Optional[int] = None,
+                 idle_seconds: Optional[float] = 1800.0, metrics: Optional[MetricsRegistry] = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.metrics = metrics or get_metrics()
+        # Lets other per-user caches (retrieval indexes, worker results) drop the user too
+        self.on_evict = on_evict
+
+        self._sessions: "OrderedDict[str, UserSession]" = OrderedDict()
+        # Evicted sessions whose spill is still being written; a reload picks them up as they are
+        self._spilling: Dict[str, UserSession] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "loads": 0, "evictions": 0, "spills": 0}
+
+    def conversations(self, user_id: str) -> List[Dict]:
+        """The user's conversation as role/content dicts (loaded from the store if not resident)"""
+        with self._lock:
+            session = self._touch(user_id)
+            turns = [turn.to_dict() for turn in session.turns]
+            evicted = self._collect_evictions()
+        self._spill_all(evicted)
+        return turns
+
+    def append(self, user_id: str, role: str, content: str):
+        """Add a message to the user's conversation; it reaches the store when the session is evicted or flushed"""
+        self.extend(user_id, [{"role": role, "content": content}])
+
+    def extend(self, user_id: str, messages: List[Dict]):
+        with self._lock:
+            session = self._touch(user_id)
+            for message in messages:
+                turn = Turn(message["role"], message["content"])
+                session.turns.append(turn)
+                self._resize(session, turn.size())
+            evicted = self._collect_evictions()
+        self._spill_all(evicted)
+
+    def sync(self, user_id: str, messages: List[Dict]):
+        """Make the user's conversation equal to ``messages``, e.g. a full history sent by a client.
+
+        Turns in common with the stored conversation are kept; from the first difference on, the
+        session is replaced. Extraction cursors count turns of this same history and record a digest
+        of the turns before them, so a change before a cursor makes that extraction start over.
+        """
+        with self._lock:
+            session = self._touch(user_id)
+            common = 0
+            for turn, message in zip(session.turns, messages):
+                if turn.role != message["role"] or turn.content != message["content"]:
+                    break
+                common += 1
+            if common < len(session.turns):
+                self._resize(session, -sum(turn.size() for turn in session.turns[common:]))
+                del session.turns[common:]
+                session.persisted = min(session.persisted, common)
+                session.truncated = True
+            for message in messages[common:]:
+                turn = Turn(message["role"], message["content"])
+                session.turns.append(turn)
+                self._resize(session, turn.size())
+            evicted = self._collect_evictions()
+        self._spill_all(evicted)
+
+    def evict_idle(self) -> int:
+        """Evict sessions idle for longer than ``idle_seconds``; returns how many were evicted"""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._spill_all(evicted)
+        return len(evicted)
+
+    def flush(self):
+        """Write every resident session's unsaved turns to the store (e.g. on shutdown)"""
+        with self._lock:
+            sessions = [session for session in self._sessions.values() if session.dirty]
+        for session in sessions:
+            self._spill(session)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, sessions=len(self._sessions), bytes=self._bytes, max_bytes=self.max_bytes)
+
+    def _touch(self, user_id: str) -> UserSession:
+        """Resident session for a user, most recently used; caller holds the lock"""
+        session = self._sessions.get(user_id)
+        if session is not None:
+            self.counters["hits"] += 1
+            self._sessions.move_to_end(user_id)
+        else:
+            session = self._spilling.get(user_id) or self._load(user_id)
+            self._sessions[user_id] = session
+            self._bytes += session.size
+        session.last_access = time.monotonic()
+        return session
+
+    def _load(self, user_id: str) -> UserSession:
+        # Store reads happen under the lock: simple, and a reload is rare next to a resident hit
+        self.counters["loads"] += 1
+        self.metrics.increment("sessions_loaded_total")
+        turns = [Turn(message["role"], message["content"]) for message in self.store.get_conversation(user_id)]
+        return UserSession(user_id, turns)
+
+    def _resize(self, session: UserSession, delta: int):
+        session.size += delta
+        if self._sessions.get(session.user_id) is session:
+            self._bytes += delta
+
+    def _collect_evictions(self) -> List[UserSession]:
+        """Pop LRU sessions over the caps or past the idle timeout; caller holds the lock"""
+        evicted = []
+        now = time.monotonic()
+        while self._sessions:
+            user_id, oldest = next(iter(self._sessions.items()))
+            over = (self._bytes > self.max_bytes
+                    or (self.max_sessions is not None and len(self._sessions) > self.max_sessions))
+            idle = self.idle_seconds is not None and now - oldest.last_access > self.idle_seconds
+            # Never evict the only session, even if it alone exceeds the cap
+            if not (idle or (over and len(self._sessions) > 1)):
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= oldest.size
+            self._spilling[user_id] = oldest
+            self.counters["evictions"] += 1
+            evicted.append(oldest)
+        if evicted:
+            self.metrics.increment("sessions_evicted_total", len(evicted))
+        return evicted
+
+    def _spill_all(self, sessions: List[UserSession]):
+        for session in sessions:
+            self._spill(session)
+            with self._lock:
+                if self._spilling.get(session.user_id) is session:
+                    del self._spilling[session.user_id]
+                resident = session.user_id in self._sessions
+            if self.on_evict is not None and not resident:
+                self.on_evict(session.user_id)
+
+    def _spill(self, session: UserSession):
+        with self._lock:
+            start = session.persisted
+            pending = [turn.to_dict() for turn in session.turns[start:]]
+            truncated, session.truncated = session.truncated, False
+        if not pending and not truncated:
+            return
+        try:
+            # Also deletes stored messages from ``start`` on, which is what a truncation needs
+            self.store.append_conversation(session.user_id, start, pending)
+        except Exception as e:
+            logger.warning("Could not persist the conversation of %s: %s", session.user_id, e)
+            with self._lock:
+                session.truncated = session.truncated or truncated
+            return
+        with self._lock:
+            session.persisted = max(session.persisted, start + len(pending))
+            self.counters["spills"] += 1
+        self.metrics.increment("sessions_spilled_total")
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Reference point for the marks below: import this module first to time everything after it
+PROCESS_START = time.perf_counter()
+
+APP_MODULES = ("companion", "service")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class StartupTimer:
+    """Milliseconds from PROCESS_START to named startup milestones; only the first mark of a name counts"""
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = PROCESS_START if start is None else start
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str) -> float:
+        if name not in self.marks:
+            self.marks[name] = round((time.perf_counter() - self.start) * 1000, 1)
+        return self.marks[name]
+
+    def report(self) -> Dict[str, float]:
+        return dict(self.marks)
+
+
+# Process-wide timer; the Streamlit app marks its first render here
+STARTUP = StartupTimer()
+
+
+def import_times(modules: Sequence[str] = APP_MODULES, top: int = 15, python: str = sys.executable) -> Dict:
+    """Import cost per module in a fresh interpreter, from ``python -X importtime``.
+
+    Returns the total for ``modules`` and the ``top`` heaviest modules by cumulative time, each
+    with self and cumulative milliseconds and its nesting depth (0 = one of ``modules``).
+    """
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", "; ".join(f"import {module}" for module in modules)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000,
+                            "depth": (len(indent) - 1) // 2})
+    requested = [entry for entry in entries if entry["module"] in modules and entry["depth"] == 0]
+    return {
+        "total_ms": round(sum(entry["cumulative_ms"] for entry in requested), 1),
+        "modules": {entry["module"]: entry["cumulative_ms"] for entry in requested},
+        "heaviest": sorted(entries, key=lambda entry: entry["cumulative_ms"], reverse=True)[:top],
+    }
+
+
+def probe() -> Dict[str, float]:
+    """Cold-start milestones of this process against the offline fake backend"""
+    timer = StartupTimer()
+    from companion import CompanionServices
+    from fake_llm import FakeChatBackend, FakeChatClient
+    timer.mark("import_app")
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, MEMORY_DB_PATH=os.path.join(directory, "memory.db"))
+        env.pop("RESPONSE_CACHE_PATH", None)
+        services = CompanionServices(env, client=FakeChatClient(FakeChatBackend(latency_ms=0, sleep=False)))
+        services.engine
+        services.extractor
+        timer.mark("engines_built")
+
+        message = "I'm feeling really overwhelmed with everything."
+        services.engine.plan_prompt(message, "Calm Mentor")
+        timer.mark("first_prompt")
+        services.memory_context("startup-probe", message)
+        timer.mark("first_context")
+        services.engine.generate_response(message, "Calm Mentor")
+        timer.mark("first_response")
+        services.worker.shutdown()
+    return timer.report()
+
+
+def cold_start(python: str = sys.executable) -> Dict[str, float]:
+    """Run ``probe`` in a fresh interpreter, so nothing is already imported or built"""
+    result = subprocess.run([python, os.path.abspath(__file__), "--probe"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Report import times and cold-start milestones")
+    parser.add_argument("--modules", nargs="+", default=list(APP_MODULES), help="modules whose import is timed")
+    parser.add_argument("--top", type=int, default=15, help="heaviest modules to list")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        report = probe()
+    else:
+        report = {"imports": import_times(args.modules, args.top), "cold_start_ms": cold_start()}
+    print(json.dumps(report, indent=None if args.probe else 2))
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,13 @@
+# Imported first so startup marks are measured from here
+from startup import STARTUP
+
+import time
 import streamlit as st
-import os
-import json
-import re
-from typing import Dict, List
-from openai import AzureOpenAI
-from dotenv import load_dotenv
+from typing import Dict
 
-# Load environment variables
-load_dotenv()
+from companion import CompanionServices
+from engines import DEMO_USER_ID, SAMPLE_CONVERSATIONS, PersonalityEngine
+from metrics import MetricsRegistry
 
 # Page config - must be first Streamlit command
 st.set_page_config(
@@ -17,8 +17,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for professional look
-st.markdown("""
+# Custom CSS for professional look (a constant, so reruns only re-send it)
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -79,223 +79,16 @@ st.markdown("""
         text-align: center;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 
-# Azure OpenAI Client Setup
 @st.cache_resource
-def get_azure_client():
-    """Initialize Azure OpenAI client with credentials"""
-    try:
-        return AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-    except Exception as e:
-        st.error(f"Error initializing Azure Client: {e}")
-        return None
-
-
-# Sample Realistic Conversation Data (30 messages)
-SAMPLE_CONVERSATIONS = [
-    {"role": "user", "content": "Yaar, I'm so stressed about my JEE mains next month. Can't sleep properly."},
-    {"role": "assistant", "content": "Arre, exam stress bohot common hai. Neend kharab ho rahi hai kya? Tell me more."},
-    {"role": "user", "content": "Haan yaar, raat ko 2-3 baje tak padhta hoon phir subah 6 baje uthna padta hai."},
-    {"role": "assistant",
-     "content": "That's only 3-4 hours of sleep! Your brain needs rest to retain information. Have you tried a fixed sleep schedule?"},
-    {"role": "user", "content": "I tried but fir bhi darr lagta hai ki enough prep nahi ho raha."},
-    {"role": "assistant",
-     "content": "Anxiety makes you feel unprepared even when you've studied well. Kya tum mock tests de rahe ho?"},
-    {"role": "user", "content": "Haan, but scores inconsistent hai. Sometimes 180/300, sometimes 220/300."},
-    {"role": "assistant",
-     "content": "That actually shows you have the knowledge. Consistency will come with better rest and less panic."},
-    {"role": "user", "content": "My parents are also pressuring me for 250+ score. Unka kuch nahi ho sakta."},
-    {"role": "assistant",
-     "content": "Parent pressure is real. But remember, they want your success, not your suffering. Talk to them once?"},
-    {"role": "user",
-     "content": "Nahi yaar, they won't understand. Papa engineer hai, unhone first attempt mein crack kiya tha."},
-    {"role": "assistant", "content": "Their journey was different. Your effort is equally valid. Don't compare beta."},
-    {"role": "user", "content": "Sometimes I feel like giving up. Engineering ke alawa kuch nahi dikhta future mein."},
-    {"role": "assistant",
-     "content": "Feeling hopeless is a sign you're burned out. Take a day off - guilt free. Your mind needs it."},
-    {"role": "user", "content": "Break? Exam toh next month hai! How can I take break?"},
-    {"role": "assistant",
-     "content": "One day won't ruin your prep, but burnout will ruin your exam performance. Trust me on this."},
-    {"role": "user",
-     "content": "Okay maybe... Also, meri girlfriend hai, vo bhi upset hai because I don't give her time."},
-    {"role": "assistant",
-     "content": "Relationships during prep phase are tough. Have you explained your situation to her?"},
-    {"role": "user",
-     "content": "Haan but she thinks I'm avoiding her. We used to talk daily, ab 2-3 days mein ek baar."},
-    {"role": "assistant",
-     "content": "That's a valid concern from her side. Maybe schedule one fixed call per day? 15 minutes bhi enough hai."},
-    {"role": "user", "content": "Good idea. I'll try that. Thanks yaar."},
-    {"role": "assistant", "content": "Good! Small steps matter. Now tell me, what subjects are you weakest in?"},
-    {"role": "user", "content": "Physics is okay, Chemistry bhi manage ho jaati hai, but Maths... specially calculus."},
-    {"role": "assistant",
-     "content": "Calculus needs practice, not cramming. Do 10 problems daily instead of 50 weekly. Consistency > Intensity."},
-    {"role": "user", "content": "Hmm makes sense. I usually avoid it and then do marathon sessions on weekends."},
-    {"role": "assistant", "content": "Exactly! That's why it feels hard. Daily touch keeps concepts fresh."},
-    {"role": "user", "content": "Okay I'll try this new approach. Feeling slightly better after talking."},
-    {"role": "assistant", "content": "I'm glad! Remember - you're more prepared than you think. Believe in yourself."},
-    {"role": "user", "content": "Thanks didi. One last thing - kya meditation actually helps ya time waste hai?"},
-    {"role": "assistant",
-     "content": "Meditation = brain training. Even 5 minutes daily can reduce anxiety significantly. Try it!"},
-    {"role": "user", "content": "Okay will give it a shot. You've been really helpful today."},
-    {"role": "assistant", "content": "Always here for you beta. Now go, ace that prep! All the best! 💪"}
-]
-
-
-class MemoryExtractor:
-    """Extracts meaningful patterns from user conversations"""
-
-    def __init__(self, client, deployment_name):
-        self.client = client
-        self.deployment = deployment_name
-
-    def extract_memories(self, conversations: List[Dict]) -> Dict:
-        """Extract preferences, emotions, and facts from conversations"""
-
-        # Prepare conversation text
-        conv_text = "\n".join(
-            [f"{'User' if msg['role'] == 'user' else 'Bot'}: {msg['content']}" for msg in conversations])
-
-        extraction_prompt = f"""Analyze the following conversation and extract:
-        1. USER PREFERENCES (likes, dislikes, interests, habits)
-        2. EMOTIONAL PATTERNS (stress triggers, anxiety sources, coping mechanisms)
-        3. IMPORTANT FACTS (relationships, goals, deadlines, challenges)
-
-        Conversation:
-        {conv_text}
-
-        Provide output in valid JSON format:
-        {{
-            "preferences": ["preference1", "preference2", ...],
-            "emotional_patterns": ["pattern1", "pattern2", ...],
-            "facts": ["fact1", "fact2", ...]
-        }}
-        """
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system",
-                     "content": "You are an expert at analyzing conversations and extracting psychological insights. Output valid JSON only."},
-                    {"role": "user", "content": extraction_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=800,
-                response_format={"type": "json_object"}
-            )
-
-            result_text = response.choices[0].message.content
-            return json.loads(result_text)
-
-        except Exception as e:
-            # Fallback if API fails
-            st.warning(f"Live extraction failed ({str(e)}). Using fallback data.")
-            return self._fallback_extraction()
-
-    def _fallback_extraction(self):
-        """Simple rule-based extraction as fallback"""
-        return {
-            "preferences": [
-                "Prefers studying late at night",
-                "Values relationship with girlfriend",
-                "Struggles with mathematics particularly calculus"
-            ],
-            "emotional_patterns": [
-                "High exam-related anxiety",
-                "Parent pressure causing stress",
-                "Fear of failure and comparison",
-                "Burnout from overwork"
-            ],
-            "facts": [
-                "Preparing for JEE Mains exam next month",
-                "Father is an engineer who cleared exam in first attempt",
-                "Currently sleeping only 3-4 hours per night",
-                "Mock test scores range from 180-220 out of 300",
-                "Has girlfriend who feels neglected due to exam prep"
-            ]
-        }
-
-
-class PersonalityEngine:
-    """Generates responses with different personality styles"""
-
-    PERSONALITIES = {
-        "Calm Mentor": {
-            "system_prompt": """You are a wise, experienced mentor who speaks with calm authority and patience.
-            Your responses are:
-            - Measured and thoughtful
-            - Use analogies and wisdom from experience
-            - Speak in complete, well-structured sentences
-            - Professional yet warm tone
-            - Focus on long-term growth and perspective
-            Keep responses concise (2-3 sentences max).""",
-            "color": "#10b981",
-            "icon": "🧘"
-        },
-        "Witty Friend": {
-            "system_prompt": """You are a fun, witty best friend who uses humor to lighten heavy situations.
-            Your responses are:
-            - Casual and conversational (use slang like 'Bro', 'Scene', 'Chill')
-            - Include light jokes or playful teasing
-            - Use modern slang and informal language
-            - Add emoji occasionally
-            - Keep it real and relatable
-            Keep responses concise (2-3 sentences max).""",
-            "color": "#f59e0b",
-            "icon": "😄"
-        },
-        "Therapist": {
-            "system_prompt": """You are a professional therapist trained in CBT and active listening.
-            Your responses are:
-            - Empathetic and validating
-            - Ask reflective questions
-            - Use therapeutic language ("I hear that...", "It sounds like...")
-            - Focus on feelings and underlying emotions
-            - Non-judgmental and supportive
-            Keep responses concise (2-3 sentences max).""",
-            "color": "#8b5cf6",
-            "icon": "🤝"
-        }
-    }
-
-    def __init__(self, client, deployment_name):
-        self.client = client
-        self.deployment = deployment_name
-
-    def generate_response(self, user_message: str, personality: str, context: str = "") -> str:
-        """Generate response with specified personality"""
-
-        if personality not in self.PERSONALITIES:
-            return "Invalid personality selected."
-
-        personality_config = self.PERSONALITIES[personality]
-
-        messages = [
-            {"role": "system", "content": personality_config["system_prompt"]}
-        ]
-
-        if context:
-            messages.append({"role": "system", "content": f"Context about user: {context}"})
-
-        messages.append({"role": "user", "content": user_message})
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=200
-            )
-            return response.choices[0].message.content
-
-        except Exception as e:
-            return f"Error generating response: {str(e)}"
+def get_services() -> CompanionServices:
+    """Engines and shared resources, built once per process and reused across reruns and sessions"""
+    # Reads .env, so this runs once per process rather than on every rerun
+    services = CompanionServices()
+    STARTUP.mark("services_built")
+    return services
 
 
 def display_memory_insights(memories: Dict):
@@ -370,39 +163,83 @@ def display_personality_comparison(engine: PersonalityEngine, test_message: str,
 
     st.markdown("---")
 
-    cols = st.columns(3)
+    personalities = list(PersonalityEngine.PERSONALITIES.keys())
+    columns_per_row = 3
+
+    # One placeholder per persona, laid out in rows of three
+    placeholders = {}
+    for row_start in range(0, len(personalities), columns_per_row):
+        row = personalities[row_start:row_start + columns_per_row]
+        cols = st.columns(columns_per_row)
+        for idx, personality_name in enumerate(row):
+            placeholders[personality_name] = cols[idx].empty()
+            placeholders[personality_name].info(f"Generating {personality_name} response...")
+
+    # Stream into each column as tokens arrive
+    responses = {personality_name: "" for personality_name in personalities}
+    for personality_name, delta in engine.stream_many(test_message, personalities, context):
+        if delta is None:
+            continue
+        responses[personality_name] += delta
+        render_persona_card(placeholders[personality_name], personality_name, responses[personality_name])
+
+
+def render_persona_card(placeholder, personality_name: str, response: str):
+    """Render a persona's (possibly partial) response as a bordered card"""
+
+    config = PersonalityEngine.PERSONALITIES[personality_name]
+    placeholder.markdown(f"""
+    <div style="border: 3px solid {config.color}; border-radius: 12px; padding: 1.5rem; background: white; min-height: 200px;">
+        <h3 style="color: {config.color};">{config.icon} {personality_name}</h3>
+        <p style="line-height: 1.8; margin-top: 1rem; color: #374151; font-size: 1.05rem;">
+            {response}
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
 
-    for idx, (personality_name, config) in enumerate(PersonalityEngine.PERSONALITIES.items()):
-        with cols[idx]:
-            with st.spinner(f"Generating {personality_name} response..."):
-                response = engine.generate_response(test_message, personality_name, context)
 
-            st.markdown(f"""
-            <div style="border: 3px solid {config['color']}; border-radius: 12px; padding: 1.5rem; background: white; min-height: 200px;">
-                <h3 style="color: {config['color']};">{config['icon']} {personality_name}</h3>
-                <p style="line-height: 1.8; margin-top: 1rem; color: #374151; font-size: 1.05rem;">
-                    {response}
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
+def display_metrics_panel(registry: MetricsRegistry):
+    """Sidebar table of p50/p95 latency and token usage per operation and persona"""
+
+    summary = registry.summary()
+    if not summary:
+        st.caption("No LLM calls recorded yet.")
+    for series, stats in sorted(summary.items()):
+        st.markdown(f"**{series}** · {stats['calls']} calls · {stats['cache_hits']} cached")
+        st.caption(f"p50 {stats['p50_ms']} ms · p95 {stats['p95_ms']} ms"
+                   + (f" · TTFT p50 {stats['ttft_p50_ms']} ms" if stats['ttft_p50_ms'] is not None else "")
+                   + f" · tokens {stats['prompt_tokens']} in / {stats['completion_tokens']} out")
+
+    fallbacks = registry.counters.get("fallback_extractions_total", 0)
+    retries = registry.counters.get("client_retries_total", 0)
+    st.caption(f"Fallback extractions: {int(fallbacks)} · Retries: {int(retries)}")
+    st.download_button("Export Prometheus metrics", registry.render_prometheus(), file_name="metrics.prom")
 
 
 def main():
+    rerun_started = time.perf_counter()
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
     # Header
     st.markdown("<h1 class='main-header'>🧠 AI Companion: Memory & Personality Engine</h1>", unsafe_allow_html=True)
     st.markdown("<p class='sub-header'>Extract user insights and transform conversation styles with AI</p>",
                 unsafe_allow_html=True)
 
     # Initialize clients
-    client = get_azure_client()
-    if not client:
+    services = get_services()
+    if not services.client:
+        if services.client_error:
+            st.error(f"Error initializing Azure Client: {services.client_error}")
         st.warning("Azure Client not initialized. Please check API keys in .env file.")
         st.stop()
 
-    deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4")
+    deployment = services.deployment
 
-    memory_extractor = MemoryExtractor(client, deployment)
-    personality_engine = PersonalityEngine(client, deployment)
+    # Shared across reruns and sessions; memories persist across restarts, so only new turns are extracted
+    memory_store = services.store
+    response_cache = services.cache
+    extraction_worker = services.worker
+    personality_engine = services.engine
 
     # Sidebar
     with st.sidebar:
@@ -419,6 +256,16 @@ def main():
 
         show_raw_data = st.checkbox("Show Raw Conversation Data", value=False)
 
+        if st.checkbox("Show Response Cache Stats", value=False):
+            st.json(response_cache.stats())
+
+        if st.checkbox("Show Latency Metrics", value=False):
+            display_metrics_panel(services.metrics)
+
+        if st.checkbox("Show Startup Timing", value=False):
+            # Milliseconds since the app was first imported in this process, and the previous rerun's duration
+            st.json(dict(STARTUP.report(), last_rerun_ms=st.session_state.get("last_rerun_ms")))
+
         st.markdown("---")
         st.markdown(f"""
         <div style='text-align: center; color: #6b7280; font-size: 0.9rem;'>
@@ -467,12 +314,22 @@ def main():
 
         if st.button("🚀 Run Memory Extraction"):
             with st.spinner("Extracting memories from 30 messages..."):
-                memories = memory_extractor.extract_memories(SAMPLE_CONVERSATIONS)
-                st.session_state['memories'] = memories  # Store for other tabs
-                display_memory_insights(memories)
-
-        elif 'memories' in st.session_state:
-            display_memory_insights(st.session_state['memories'])
+                # Items show up as the model writes them; the cards below render the final result
+                live = st.empty()
+                found = []
+                for category, item in extraction_worker.stream(DEMO_USER_ID, SAMPLE_CONVERSATIONS):
+                    found.append(f"- **{category.replace('_', ' ').title()}:** {item}")
+                    live.markdown("\n".join(found[-8:]))
+                live.empty()
+            # The last run may have fallen back to canned data if the API failed
+            memories = extraction_worker.last_result(DEMO_USER_ID) or memory_store.get(DEMO_USER_ID)
+            display_memory_insights(memories)
+
+        elif memory_store.has_memories(DEMO_USER_ID):
+            # Previously extracted memories are read from the store
+            display_memory_insights(memory_store.get(DEMO_USER_ID))
+        elif extraction_worker.status(DEMO_USER_ID) != "idle":
+            st.info("Memory extraction is running in the background. Refresh in a moment to see the results.")
         else:
             st.info("Click the button above to analyze the conversation.")
 
@@ -507,30 +364,43 @@ def main():
             )
 
         use_context = st.checkbox("Use extracted memories as context", value=True)
+        use_history = st.checkbox("Include conversation history (summarized)", value=True)
 
         if st.button("🎯 Generate Response", use_container_width=True):
             context = ""
             if use_context:
-                if 'memories' not in st.session_state:
-                    # Auto run extraction if not done yet
-                    st.session_state['memories'] = memory_extractor.extract_memories(SAMPLE_CONVERSATIONS)
+                # Extraction of unseen turns runs in the background; reply with what is stored now
+                if not memory_store.has_memories(DEMO_USER_ID):
+                    st.caption("Memories are still being extracted in the background.")
 
-                # Create a summary string from the memory dict
-                mem = st.session_state['memories']
-                context = f"User Facts: {', '.join(mem.get('facts', []))}. Emotions: {', '.join(mem.get('emotional_patterns', []))}."
+                # Inject only the memories relevant to this message
+                context = services.memory_context(DEMO_USER_ID, test_input, SAMPLE_CONVERSATIONS)
 
-            with st.spinner(f"Generating {selected_personality} response..."):
-                response = personality_engine.generate_response(test_input, selected_personality, context)
+            # Fixed-size block: rolling summaries plus the latest turns
+            history = services.history_block(DEMO_USER_ID, SAMPLE_CONVERSATIONS) if use_history else ""
+
+            # Token counts are known before the call, so cost can be predicted up front
+            prompt_plan = personality_engine.plan_prompt(test_input, selected_personality, context, history)
+            st.caption(f"Prompt: {prompt_plan.prompt_tokens} tokens "
+                       f"(at most {prompt_plan.max_total_tokens} including the reply)")
 
             config = PersonalityEngine.PERSONALITIES[selected_personality]
 
             st.markdown("---")
-            st.markdown(f"### {config['icon']} {selected_personality} Response:")
-            st.markdown(f"""
-            <div style="border-left: 5px solid {config['color']}; padding: 1.5rem; background: #f9fafb; border-radius: 8px; font-size: 1.1rem; line-height: 1.8;">
-                {response}
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(f"### {config.icon} {selected_personality} Response:")
+
+            # Render progressively as tokens stream in
+            response_placeholder = st.empty()
+            response_placeholder.info(f"Generating {selected_personality} response...")
+            response = ""
+            for delta in personality_engine.generate_response_stream(test_input, selected_personality, context,
+                                                                     history):
+                response += delta
+                response_placeholder.markdown(f"""
+                <div style="border-left: 5px solid {config.color}; padding: 1.5rem; background: #f9fafb; border-radius: 8px; font-size: 1.1rem; line-height: 1.8;">
+                    {response}
+                </div>
+                """, unsafe_allow_html=True)
 
     with tab4:
         st.markdown("### Compare All Personalities Side-by-Side")
@@ -546,10 +416,9 @@ def main():
         if st.button("🔄 Generate All Responses", use_container_width=True):
             context = ""
             if use_memory_context:
-                if 'memories' not in st.session_state:
-                    st.session_state['memories'] = memory_extractor.extract_memories(SAMPLE_CONVERSATIONS)
-                mem = st.session_state['memories']
-                context = f"User Facts: {', '.join(mem.get('facts', []))}. Emotions: {', '.join(mem.get('emotional_patterns', []))}."
+                if not memory_store.has_memories(DEMO_USER_ID):
+                    st.caption("Memories are still being extracted in the background.")
+                context = services.memory_context(DEMO_USER_ID, comparison_message, SAMPLE_CONVERSATIONS)
 
             display_personality_comparison(personality_engine, comparison_message, context)
 
@@ -562,6 +431,9 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
+    STARTUP.mark("first_render")
+    st.session_state["last_rerun_ms"] = round((time.perf_counter() - rerun_started) * 1000, 1)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
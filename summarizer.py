@@ -0,0 +1,132 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+from llm_cache import ResponseCache, make_cache_key
+from memory_store import InMemoryMemoryStore, MemoryStore
+from metrics import MetricsRegistry, get_metrics, usage_tokens
+from prompt_budget import count_tokens, truncate_to_tokens
+from routing import ModelRouter
+
+logger = logging.getLogger(__name__)
+
+
+def format_turns(conversations: List[Dict], assistant_label: str = "Bot") -> str:
+    return "\n".join(f"{'User' if msg['role'] == 'user' else assistant_label}: {msg['content']}"
+                     for msg in conversations)
+
+
+def empty_summary() -> Dict:
+    # cursor: messages already folded into chunk summaries
+    return {"cursor": 0, "chunks": [], "session": ""}
+
+
+class ConversationSummarizer:
+    """Hierarchical rolling summary of a user's conversation.
+
+    The latest turns stay verbatim. Older turns are summarized ``CHUNK_TURNS`` at a time into chunk
+    summaries, and once more than ``MAX_CHUNKS`` pile up the oldest are folded into a single session
+    summary. State is persisted in the memory store and only new turns are processed, so each
+    update costs at most a couple of small LLM calls and the history block stays a fixed size.
+    """
+
+    RECENT_TURNS = 6
+    CHUNK_TURNS = 12
+    MAX_CHUNKS = 4
+    CHUNK_TOKENS = 80
+    SESSION_TOKENS = 250
+
+    def __init__(self, client, deployment_name, store: Optional[MemoryStore] = None,
+                 cache: Optional[ResponseCache] = None, metrics: Optional[MetricsRegistry] = None,
+                 router: Optional[ModelRouter] = None):
+        self.client = client
+        self.deployment = deployment_name
+        self.store = store if store is not None else InMemoryMemoryStore()
+        self.cache = cache
+        self.metrics = metrics or get_metrics()
+        self.router = router or ModelRouter(deployment_name, metrics=self.metrics)
+
+    def update(self, user_id: str, conversations: List[Dict]) -> Dict:
+        """Summarize turns that have aged out of the verbatim window and persist the new state"""
+        state = self.store.get_summary(user_id) or empty_summary()
+        if state["cursor"] > len(conversations):
+            # History was replaced or truncated - start over
+            state = empty_summary()
+
+        changed = False
+        while len(conversations) - self.RECENT_TURNS - state["cursor"] >= self.CHUNK_TURNS:
+            chunk = conversations[state["cursor"]:state["cursor"] + self.CHUNK_TURNS]
+            state["chunks"].append(self._summarize(format_turns(chunk), self.CHUNK_TOKENS, "chunk"))
+            state["cursor"] += len(chunk)
+            changed = True
+
+        if len(state["chunks"]) > self.MAX_CHUNKS:
+            # Fold the older half in one call rather than one call per chunk
+            fold = len(state["chunks"]) - self.MAX_CHUNKS // 2
+            parts = ([state["session"]] if state["session"] else []) + state["chunks"][:fold]
+            state["session"] = self._summarize("\n".join(parts), self.SESSION_TOKENS, "session")
+            state["chunks"] = state["chunks"][fold:]
+
+        if changed:
+            self.store.set_summary(user_id, state)
+        return state
+
+    def history_block(self, user_id: str, conversations: List[Dict]) -> str:
+        """Session summary, chunk summaries and recent verbatim turns as one text block (no LLM calls)"""
+        state = self.store.get_summary(user_id) or empty_summary()
+        if state["cursor"] > len(conversations):
+            state = empty_summary()
+
+        # Turns the background update has not summarized yet stay verbatim, up to one extra chunk
+        start = max(state["cursor"], len(conversations) - self.RECENT_TURNS - self.CHUNK_TURNS)
+        parts = []
+        if state["session"]:
+            parts.append(f"Summary of earlier conversation: {state['session']}")
+        if state["chunks"]:
+            parts.append("More recently:\n" + "\n".join(f"- {chunk}" for chunk in state["chunks"]))
+        if conversations[start:]:
+            parts.append("Latest turns:\n" + format_turns(conversations[start:], assistant_label="You"))
+        return "\n\n".join(parts)
+
+    def _summarize(self, text: str, max_tokens: int, kind: str) -> str:
+        """Compress text with the LLM; falls back to the user's own lines, truncated, if the call fails"""
+        route = self.router.select("summarize", count_tokens(text, self.deployment))
+        request = dict(
+            model=route.deployment,
+            messages=[
+                {"role": "system",
+                 "content": "You compress conversations into short factual notes for a companion's memory."},
+                {"role": "user",
+                 "content": f"Summarize this {'conversation excerpt' if kind == 'chunk' else 'set of notes'} "
+                            f"in at most {max_tokens * 3 // 4} words. Keep events, feelings, decisions, names and "
+                            f"open questions; drop small talk.\n\n{text}"}
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens
+        )
+
+        start = time.perf_counter()
+        cache_key = make_cache_key(task="summarize", **request)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics.record_call("summarize", time.perf_counter() - start, label=kind, cache_hit=True)
+                return cached
+
+        try:
+            response = self.client.chat.completions.create(**request)
+            summary = response.choices[0].message.content.strip()
+        except Exception as e:
+            self.metrics.record_call("summarize", time.perf_counter() - start, label=kind, error=True)
+            self.router.record("summarize", route, time.perf_counter() - start, error=True)
+            logger.warning("Summarization failed (%s). Keeping a truncated excerpt.", e)
+            user_lines = [line for line in text.splitlines() if line.startswith("User: ")] or text.splitlines()
+            return truncate_to_tokens(" / ".join(user_lines), max_tokens, self.deployment)
+
+        prompt_tokens, completion_tokens = usage_tokens(response)
+        self.metrics.record_call("summarize", time.perf_counter() - start, label=kind,
+                                 prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        self.router.record("summarize", route, time.perf_counter() - start)
+        if self.cache is not None and summary:
+            self.cache.set(cache_key, summary)
+        return summary
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import FakeChatBackend, FakeChatClient  # noqa: E402
+
+
+@pytest.fixture
+def fake_client():
+    """Offline chat client answering instantly; extraction memories are derived from the user turns"""
+    return FakeChatClient(FakeChatBackend(latency_ms=0, sleep=False))
+
+
+def conversation(turns: int, prefix: str = "message"):
+    """Alternating user/assistant turns with distinct user content"""
+    return [{"role": "user" if index % 2 == 0 else "assistant", "content": f"{prefix} number {index} of the chat"}
+            for index in range(turns)]
+
+
+@pytest.fixture
+def make_conversation():
+    return conversation
@@ -0,0 +1,132 @@
+import json
+
+from batch_extract import BatchExtractionPipeline, Checkpoint
+from engines import MemoryExtractor
+from memory_store import InMemoryMemoryStore
+
+
+class PoisonClient:
+    """Passes calls to a client, raising for any request whose prompt mentions ``marker``"""
+
+    def __init__(self, client, marker: str):
+        self.client = client
+        self.marker = marker
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        if any(self.marker in message["content"] for message in kwargs["messages"]):
+            raise RuntimeError("backend rejected the request")
+        return self.client.chat.completions.create(**kwargs)
+
+
+def collector(records):
+    """Writer that keeps the records sent to it"""
+    while True:
+        record = yield
+        if record is not None:
+            records.append(record)
+
+
+def source(make_conversation, users=4, turns=6):
+    return [(f"user{index}", make_conversation(turns, prefix=f"user{index} says")) for index in range(users)]
+
+
+def counts(store, user_id):
+    return {item.text: item.occurrences for items in store.get_items(user_id).values() for item in items}
+
+
+def pipeline(client, tmp_path=None, store=None, **kwargs):
+    extractor = MemoryExtractor(client, "gpt-4")
+    path = str(tmp_path / "backfill.ckpt") if tmp_path is not None else None
+    return BatchExtractionPipeline(extractor, store, concurrency=2, checkpoint_path=path, **kwargs)
+
+
+def test_packed_results_go_to_their_own_unit(fake_client, make_conversation):
+    records = []
+    stats = pipeline(fake_client).run(source(make_conversation, users=6), collector(records))
+
+    assert stats["units"] == 6 and stats["failed"] == 0
+    assert stats["packed_requests"] > 0 and stats["requests"] < 6
+    assert sorted(record["seq"] for record in records) == list(range(6))
+    for record in records:
+        items = [item for items in record["memories"].values() for item in items]
+        assert items and all(item.startswith(f"{record['user_id']} says") for item in items)
+
+
+def test_long_histories_are_split_in_order(fake_client, make_conversation):
+    records = []
+    stats = pipeline(fake_client, max_batch_tokens=40).run(source(make_conversation, users=2, turns=12),
+                                                           collector(records))
+
+    assert stats["units"] > 2
+    by_seq = sorted(records, key=lambda record: record["seq"])
+    assert [record["user_id"] for record in by_seq] == sorted(record["user_id"] for record in by_seq)
+
+
+def test_rerun_with_checkpoint_skips_finished_units(fake_client, make_conversation, tmp_path):
+    pipeline(fake_client, tmp_path).run(source(make_conversation), collector([]))
+    calls = fake_client.backend.calls
+
+    records = []
+    stats = pipeline(fake_client, tmp_path).run(source(make_conversation), collector(records))
+
+    assert stats["skipped"] == stats["units"] == 4
+    assert records == [] and fake_client.backend.calls == calls
+
+
+def test_failed_units_do_not_hold_back_the_watermark_and_are_retried(fake_client, make_conversation, tmp_path):
+    records = []
+    stats = pipeline(PoisonClient(fake_client, "user1 says"), tmp_path).run(source(make_conversation),
+                                                                           collector(records))
+
+    assert stats["failed"] == 1
+    with open(tmp_path / "backfill.ckpt", encoding="utf-8") as handle:
+        state = json.load(handle)
+    assert state == {"watermark": 3, "done": [], "failed": [1]}
+
+    records = []
+    stats = pipeline(fake_client, tmp_path).run(source(make_conversation), collector(records))
+
+    assert stats["skipped"] == 3 and stats["failed"] == 0
+    assert [record["user_id"] for record in records] == ["user1"]
+    checkpoint = Checkpoint(str(tmp_path / "backfill.ckpt"))
+    assert checkpoint.watermark == 3 and not checkpoint.done and not checkpoint.failed
+
+
+def test_store_memories_are_replaced_not_merged(fake_client, make_conversation, tmp_path):
+    store = InMemoryMemoryStore()
+    store.upsert("user0", {"facts": ["Extracted with the old prompt"]})
+
+    pipeline(fake_client, store=store, max_batch_tokens=40).run(source(make_conversation, users=2), collector([]))
+    first = counts(store, "user0")
+    # A run that starts over without the checkpoint replaces again instead of counting repeats
+    pipeline(fake_client, store=store, max_batch_tokens=40).run(source(make_conversation, users=2), collector([]))
+
+    assert counts(store, "user0") == first
+    assert first and "Extracted with the old prompt" not in first
+    assert set(first.values()) == {1}
+    assert sum(len(items) for items in store.get("user1").values()) > 0
+
+
+def test_a_failed_unit_keeps_the_users_old_memories(fake_client, make_conversation, tmp_path):
+    store = InMemoryMemoryStore()
+    store.upsert("user1", {"facts": ["Extracted with the old prompt"]})
+    conversations = source(make_conversation, users=2, turns=12)
+    # Only the last window of user1 fails
+    conversations[1][1][-2]["content"] = "poisoned turn"
+
+    stats = pipeline(PoisonClient(fake_client, "poisoned"), tmp_path, store, max_batch_tokens=40).run(
+        conversations, collector([]))
+
+    assert stats["failed"] == 1 and stats["stored_users"] == 1
+    assert store.get("user1")["facts"] == ["Extracted with the old prompt"]
+    checkpoint = Checkpoint(str(tmp_path / "backfill.ckpt"))
+    assert checkpoint.watermark == stats["units"] - 1
+    # Every unit of user1 is retried, so its memories are replaced in one go
+    assert checkpoint.failed == set(range(stats["units"] // 2, stats["units"]))
+
+    stats = pipeline(fake_client, tmp_path, store, max_batch_tokens=40).run(conversations, collector([]))
+
+    assert stats["failed"] == 0 and stats["stored_users"] == 1
+    assert "Extracted with the old prompt" not in store.get("user1")["facts"]
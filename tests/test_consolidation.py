@@ -0,0 +1,17 @@
+import pytest
+
+from consolidation import _stem, content_tokens
+
+
+@pytest.mark.parametrize("word, stem", [
+    ("exams", "exam"), ("dogs", "dog"), ("studying", "study"),
+    ("stress", "stress"), ("stresses", "stress"), ("class", "class"), ("classes", "class"),
+    ("focus", "focus"), ("status", "status"), ("bus", "bus"),
+])
+def test_stem(word, stem):
+    assert _stem(word) == stem
+
+
+def test_singular_and_plural_share_tokens():
+    assert content_tokens("Exam stress before classes") == content_tokens("exam stresses before a class")
+    assert content_tokens("Has a focus on calculus") == {"focus", "calculus"}
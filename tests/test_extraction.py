@@ -0,0 +1,155 @@
+import pytest
+
+from engines import DEMO_USER_ID, SAMPLE_CONVERSATIONS, MemoryExtractor
+from memory_store import InMemoryMemoryStore
+
+
+class FlakyClient:
+    """Passes calls to a client until ``fail_after`` calls have been made, then raises"""
+
+    def __init__(self, client, fail_after: int):
+        self.client = client
+        self.fail_after = fail_after
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.calls > self.fail_after:
+            raise RuntimeError("backend down")
+        return self.client.chat.completions.create(**kwargs)
+
+
+def total(memories):
+    return sum(len(items) for items in memories.values())
+
+
+def test_only_unseen_turns_are_extracted(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+    conversation = make_conversation(30)
+
+    memories = extractor.extract_incremental("u", conversation)
+    calls = fake_client.backend.calls
+    assert store.get_cursor("u") == 30
+    assert calls == 3  # windows of 12, 12 and 6 turns
+    assert total(memories) > 0
+
+    extractor.extract_incremental("u", conversation)
+    assert fake_client.backend.calls == calls
+
+    extractor.extract_incremental("u", conversation + make_conversation(4, prefix="later"))
+    assert fake_client.backend.calls == calls + 1
+    assert store.get_cursor("u") == 34
+
+
+def test_replaced_history_starts_over(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+    extractor.extract_incremental("u", make_conversation(24))
+
+    memories = extractor.extract_incremental("u", make_conversation(4, prefix="fresh"))
+
+    assert store.get_cursor("u") == 4
+    assert all("fresh" in item for items in memories.values() for item in items)
+
+
+def test_edits_before_the_cursor_start_over(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+    conversation = make_conversation(12)
+    extractor.extract_incremental("u", conversation)
+
+    # Same length and more, but an earlier user turn was edited
+    edited = [dict(turn) for turn in conversation] + make_conversation(2, prefix="later")
+    edited[0]["content"] = "edited first turn"
+    memories = extractor.extract_incremental("u", edited)
+
+    assert store.get_cursor("u") == 14
+    items = [item for values in memories.values() for item in values]
+    assert "edited first turn" in items and conversation[0]["content"] not in items
+
+
+def test_cursors_without_a_digest_are_trusted(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+    store.upsert("u", {"facts": ["Extracted before digests"]})
+    store.set_cursor("u", 12)
+
+    extractor.extract_incremental("u", make_conversation(14))
+
+    assert "Extracted before digests" in store.get("u")["facts"]
+    assert store.get_cursor("u") == 14 and store.get_cursor_digest("u")
+
+
+def test_failure_keeps_progress_of_completed_windows(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(FlakyClient(fake_client, fail_after=1), "gpt-4", store)
+    conversation = make_conversation(30)
+
+    with pytest.raises(RuntimeError):
+        extractor.extract_incremental("u", conversation)
+    assert store.get_cursor("u") == 12
+    assert store.has_memories("u")
+
+    # The remaining windows are retried on the next call
+    extractor.client = fake_client
+    extractor.extract_incremental("u", conversation)
+    assert store.get_cursor("u") == 30
+
+
+def test_append_only_history_never_clears_memories(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+    before = extractor.extract_incremental("u", make_conversation(32))
+
+    # e.g. a server-side session that holds fewer turns than the explicit history extracted before
+    session = make_conversation(2, prefix="session")
+    memories = extractor.extract_incremental("u", session, append_only=True)
+
+    assert memories == before
+    assert store.get_cursor("u") == 2
+
+    memories = extractor.extract_incremental("u", session + make_conversation(2, prefix="next"), append_only=True)
+    assert total(memories) > total(before)
+    assert store.get_cursor("u") == 4
+
+
+def test_append_only_history_with_earlier_changes_keeps_memories(fake_client, make_conversation):
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+    before = extractor.extract_incremental("u", make_conversation(12))
+
+    session = make_conversation(12, prefix="session") + make_conversation(2, prefix="next")
+    memories = extractor.extract_incremental("u", session, append_only=True)
+
+    assert all(item in memories[category] for category, items in before.items() for item in items)
+    assert any("next" in item for items in memories.values() for item in items)
+    assert store.get_cursor("u") == 14
+
+
+def test_failures_raise_and_only_the_demo_user_gets_sample_data(fake_client, make_conversation):
+    fake_client.backend.error_rate = 1.0
+    store = InMemoryMemoryStore()
+    extractor = MemoryExtractor(fake_client, "gpt-4", store)
+
+    with pytest.raises(Exception):
+        extractor.extract_incremental("u", make_conversation(6))
+    assert not store.has_memories("u") and store.get_cursor("u") == 0
+
+    assert total(extractor.extract_incremental(DEMO_USER_ID, SAMPLE_CONVERSATIONS)) > 0
+
+
+def test_stream_yields_items_as_they_are_extracted(fake_client, make_conversation):
+    extractor = MemoryExtractor(fake_client, "gpt-4", InMemoryMemoryStore())
+    items = []
+    stream = extractor.stream_incremental("u", make_conversation(6))
+    try:
+        while True:
+            items.append(next(stream))
+    except StopIteration as done:
+        memories = done.value
+
+    assert items
+    assert all(item in memories[category] for category, item in items)
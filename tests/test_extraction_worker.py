@@ -0,0 +1,139 @@
+import threading
+
+from extraction_worker import ExtractionWorker
+
+
+class BlockingExtractor:
+    """Extractor double whose runs wait for ``release``; records the snapshots it was given"""
+
+    def __init__(self, fail: bool = False):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.fail = fail
+        self.runs = []
+
+    def stream_incremental(self, user_id, conversations, append_only=False):
+        self.runs.append((user_id, len(conversations), append_only))
+        self.started.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("extraction failed")
+        yield "facts", f"{len(conversations)} turns"
+        return {"facts": [f"{len(conversations)} turns"]}
+
+
+def test_submissions_during_a_run_coalesce_into_one_follow_up(make_conversation):
+    extractor = BlockingExtractor()
+    worker = ExtractionWorker(extractor, max_workers=1)
+    try:
+        assert worker.submit("u", make_conversation(2))
+        assert extractor.started.wait(5)
+        assert not worker.submit("u", make_conversation(4))
+        assert not worker.submit("u", make_conversation(6), append_only=True)
+        assert worker.status("u") == "queued"
+
+        extractor.release.set()
+        assert worker.wait("u", 5)
+    finally:
+        worker.shutdown()
+
+    # The follow-up run used the latest snapshot only
+    assert extractor.runs == [("u", 2, False), ("u", 6, True)]
+    assert worker.status("u") == "idle"
+    assert worker.last_result("u") == {"facts": ["6 turns"]}
+    assert worker.counters["coalesced"] == 2
+
+def test_users_do_not_wait_for_each_other(make_conversation):
+    blocked = BlockingExtractor()
+    worker = ExtractionWorker(blocked, max_workers=2)
+    try:
+        worker.submit("slow", make_conversation(2))
+        assert blocked.started.wait(5)
+        # The first user's job holds one thread; another user's job runs on the other
+        blocked.started.clear()
+        worker.submit("other", make_conversation(4))
+        assert blocked.started.wait(5)
+        assert worker.status("slow") == worker.status("other") == "running"
+        blocked.release.set()
+        assert worker.wait("slow", 5) and worker.wait("other", 5)
+    finally:
+        worker.shutdown()
+
+    assert worker.counters["runs"] == 2 and worker.counters["failures"] == 0
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, user_id, conversations):
+        self.updates.append((user_id, len(conversations)))
+
+
+def test_summarizer_runs_in_the_same_job(make_conversation):
+    extractor = BlockingExtractor()
+    extractor.release.set()
+    summarizer = RecordingSummarizer()
+    worker = ExtractionWorker(extractor, summarizer=summarizer)
+    try:
+        worker.submit("u", make_conversation(6))
+        assert worker.wait("u", 5)
+    finally:
+        worker.shutdown()
+
+    assert summarizer.updates == [("u", 6)]
+
+
+def test_a_failing_on_result_does_not_wedge_the_user(make_conversation):
+    published = []
+
+    def on_result(user_id, memories):
+        published.append(memories)
+        raise RuntimeError("publish failed")
+
+    extractor = BlockingExtractor()
+    extractor.release.set()
+    worker = ExtractionWorker(extractor, on_result=on_result)
+    try:
+        worker.submit("u", make_conversation(2))
+        assert worker.wait("u", 5)
+        assert worker.status("u") == "idle"
+
+        assert worker.submit("u", make_conversation(4))
+        assert worker.wait("u", 5)
+    finally:
+        worker.shutdown()
+
+    assert len(published) == 2
+
+
+def test_failed_runs_are_reported_until_one_succeeds(make_conversation):
+    extractor = BlockingExtractor(fail=True)
+    extractor.release.set()
+    worker = ExtractionWorker(extractor)
+    try:
+        worker.submit("u", make_conversation(2))
+        assert worker.wait("u", 5)
+        assert worker.last_error("u") == "extraction failed"
+        assert worker.last_result("u") is None
+
+        extractor.fail = False
+        worker.submit("u", make_conversation(2))
+        assert worker.wait("u", 5)
+    finally:
+        worker.shutdown()
+
+    assert worker.last_error("u") is None
+    assert worker.last_result("u") == {"facts": ["2 turns"]}
+
+
+def test_stream_ends_when_the_job_finishes(make_conversation):
+    extractor = BlockingExtractor()
+    extractor.release.set()
+    worker = ExtractionWorker(extractor)
+    try:
+        items = list(worker.stream("u", make_conversation(4), timeout=5))
+    finally:
+        worker.shutdown()
+
+    assert items == [("facts", "4 turns")]
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import benchmark
+from engines import SAMPLE_CONVERSATIONS
+from fake_llm import FakeAPIError, FakeChatBackend, FakeChatClient, synthetic_conversations
+
+REQUEST = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 20}
+
+
+def draws(backend, count):
+    return [backend._draw() for _ in range(count)]
+
+
+def test_same_seed_gives_the_same_latencies_and_errors():
+    first = draws(FakeChatBackend(error_rate=0.5, seed=7), 20)
+
+    assert first == draws(FakeChatBackend(error_rate=0.5, seed=7), 20)
+    assert first != draws(FakeChatBackend(error_rate=0.5, seed=8), 20)
+    assert any(failed for _, failed in first) and not all(failed for _, failed in first)
+
+
+def test_injected_errors_carry_status_and_retry_after():
+    client = FakeChatClient(FakeChatBackend(sleep=False, error_rate=1.0, error_status=503))
+
+    with pytest.raises(FakeAPIError) as error:
+        client.chat.completions.create(**REQUEST)
+    assert error.value.status_code == 503
+    assert error.value.response.headers == {"retry-after": "0.05"}
+
+    with pytest.raises(FakeAPIError):
+        client.chat.completions.create(stream=True, **REQUEST)
+    assert client.backend.calls == 2
+
+
+def test_replies_respect_max_tokens_and_stream_the_same_text(fake_client):
+    response = fake_client.chat.completions.create(**dict(REQUEST, max_tokens=5))
+    streamed = "".join(chunk.choices[0].delta.content
+                       for chunk in fake_client.chat.completions.create(stream=True, **dict(REQUEST, max_tokens=5)))
+
+    assert len(response.choices[0].message.content.split()) == 5
+    assert streamed == response.choices[0].message.content
+    assert response.usage.total_tokens == response.usage.prompt_tokens + response.usage.completion_tokens
+
+
+def test_extraction_replies_follow_the_prompt(fake_client):
+    prompt = "Conversation:\nUser: Likes chess\nAssistant: ok\nUser: Feels anxious\nUser: Has a dog"
+    response = fake_client.chat.completions.create(model="gpt-4", response_format={"type": "json_object"},
+                                                   messages=[{"role": "user", "content": prompt}])
+
+    assert json.loads(response.choices[0].message.content) == {
+        "preferences": ["Likes chess"], "emotional_patterns": ["Feels anxious"], "facts": ["Has a dog"]}
+
+    packed = "Transcript [a]:\nUser: Likes chess\nTranscript [b]:\nUser: Likes tea"
+    response = fake_client.chat.completions.create(model="gpt-4", response_format={"type": "json_object"},
+                                                   messages=[{"role": "user", "content": packed}])
+    transcripts = json.loads(response.choices[0].message.content)["transcripts"]
+    assert transcripts["a"]["preferences"] == ["Likes chess"] and transcripts["b"]["preferences"] == ["Likes tea"]
+
+
+def test_synthetic_conversations_tag_repeats():
+    messages = synthetic_conversations(SAMPLE_CONVERSATIONS, len(SAMPLE_CONVERSATIONS) + 2, variant=1)
+
+    assert [message["role"] for message in messages[:2]] == [message["role"] for message in SAMPLE_CONVERSATIONS[:2]]
+    assert messages[0]["content"].endswith("(u1 c0)") and messages[-1]["content"].endswith("(u1 c1)")
+    assert synthetic_conversations(SAMPLE_CONVERSATIONS, 2) == SAMPLE_CONVERSATIONS[:2]
+
+
+def test_benchmark_writes_a_report(tmp_path):
+    output = tmp_path / "report.json"
+    report = benchmark.main(["--users", "2", "--turns", "12", "--step", "6", "--requests", "3",
+                             "--latency-ms", "1", "--tokens-per-second", "100000", "--output", str(output)])
+
+    assert json.loads(output.read_text()) == json.loads(json.dumps(report))
+    assert report["extraction"]["latency"]["count"] == 4 and report["extraction"]["failed_steps"] == 0
+    assert report["generation"]["latency"]["count"] == 6
+    assert report["backend_calls"] > 0 and report["tokens"]["completion_tokens"] > 0
+    assert report["cache"]["hits"] + report["cache"]["misses"] > 0 and report["hedging"] is None
@@ -0,0 +1,145 @@
+import time
+
+import pytest
+
+from fake_llm import FakeAPIError, FakeChatBackend, FakeChatClient, FakeChatServer
+from llm_client import DeadlineExceeded, HedgedClient
+
+REQUEST = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 20}
+
+
+def backend(latency_ms: float, **options):
+    """Fake backend answering after exactly ``latency_ms``"""
+    return FakeChatBackend(latency_ms=latency_ms, latency_sigma=0.0, tokens_per_second=1000, **options)
+
+
+class RecordingClient(FakeChatClient):
+    """Fake client that keeps the streams and models it was asked for"""
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.streams = []
+        self.models = []
+
+    def _create(self, **kwargs):
+        self.models.append(kwargs["model"])
+        result = super()._create(**kwargs)
+        if kwargs.get("stream"):
+            self.streams.append(result)
+        return result
+
+
+def text(stream) -> str:
+    return "".join(chunk.choices[0].delta.content for chunk in stream)
+
+
+@pytest.fixture
+def hedged():
+    clients = []
+
+    def build(primary, secondary=None, **options):
+        options.setdefault("initial_delay", 0.05)
+        client = HedgedClient(primary, secondary, **options)
+        clients.append(client)
+        return client
+
+    yield build
+    for client in clients:
+        client._pool.shutdown(wait=True)
+
+
+def test_fast_primary_is_not_hedged(hedged):
+    secondary = RecordingClient(backend(10))
+    client = hedged(FakeChatClient(backend(10)), secondary, initial_delay=0.5)
+
+    assert client.chat.completions.create(**REQUEST).choices[0].message.content
+    assert client.counters["hedges_fired"] == 0 and secondary.models == []
+
+
+def test_slow_primary_is_hedged_and_the_first_answer_wins(hedged):
+    secondary = RecordingClient(backend(10))
+    client = hedged(FakeChatClient(backend(500)), secondary, secondary_deployment="gpt-4-secondary")
+
+    started = time.monotonic()
+    assert client.chat.completions.create(**REQUEST).choices[0].message.content
+    assert time.monotonic() - started < 0.3
+    assert client.counters["hedges_fired"] == client.counters["hedges_won"] == 1
+    assert secondary.models == ["gpt-4-secondary"]
+
+
+def test_losing_stream_is_closed(hedged):
+    primary = RecordingClient(backend(200))
+    client = hedged(primary, FakeChatClient(backend(10)))
+
+    assert text(client.chat.completions.create(stream=True, **REQUEST))
+    assert client.counters["hedges_won"] == 1
+
+    # The primary answers after the hedge won; its stream is closed rather than left open
+    time.sleep(0.3)
+    assert len(primary.streams) == 1 and primary.streams[0].gi_frame is None
+
+
+def test_winning_stream_is_replayed_from_the_first_token(hedged):
+    client = hedged(FakeChatClient(backend(10)), initial_delay=0.5)
+    expected = text(FakeChatClient(backend(0)).chat.completions.create(stream=True, **REQUEST))
+
+    assert text(client.chat.completions.create(stream=True, **REQUEST)) == expected
+
+
+def test_failed_primary_hedges_at_once(hedged):
+    client = hedged(FakeChatClient(backend(0, error_rate=1.0)), FakeChatClient(backend(10)), initial_delay=5.0)
+
+    started = time.monotonic()
+    assert client.chat.completions.create(**REQUEST).choices[0].message.content
+    assert time.monotonic() - started < 1.0
+    assert client.counters["hedges_won"] == 1
+
+
+def test_both_failures_raise(hedged):
+    failing = FakeChatClient(backend(0, error_rate=1.0, error_status=503))
+    client = hedged(failing)
+
+    with pytest.raises(FakeAPIError):
+        client.chat.completions.create(**REQUEST)
+
+
+def test_deadline_exceeded(hedged):
+    client = hedged(FakeChatClient(backend(500)), deadline=0.15)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        client.chat.completions.create(**REQUEST)
+    assert time.monotonic() - started < 0.4
+    assert client.counters["deadline_exceeded"] == 1
+
+    # A per-call deadline overrides the client's
+    with pytest.raises(DeadlineExceeded):
+        client.chat.completions.create(deadline=0.05, stream=True, **REQUEST)
+    assert client.counters["deadline_exceeded"] == 2
+
+
+def test_hedge_delay_follows_observed_latency(hedged):
+    client = hedged(FakeChatClient(backend(5)), initial_delay=2.0)
+    assert client.hedge_delay(stream=False) == 2.0
+
+    for _ in range(HedgedClient.MIN_SAMPLES):
+        client.chat.completions.create(**REQUEST)
+
+    assert client.hedge_delay(stream=False) == 0.05  # min_delay
+    assert client.hedge_delay(stream=True) == 2.0
+
+
+def test_hedging_over_http(hedged):
+    pytest.importorskip("openai")
+    pytest.importorskip("httpx")
+    from llm_client import build_azure_client
+
+    with FakeChatServer(backend(500)) as slow, FakeChatServer(backend(10)) as fast:
+        primary = build_azure_client("fake-key", slow.endpoint, "2024-02-15-preview", max_retries=0)
+        secondary = build_azure_client("fake-key", fast.endpoint, "2024-02-15-preview", max_retries=0)
+        client = hedged(primary, secondary)
+
+        started = time.monotonic()
+        assert text(client.chat.completions.create(stream=True, **REQUEST))
+        assert time.monotonic() - started < 0.4
+        assert client.counters["hedges_won"] == 1
@@ -0,0 +1,58 @@
+import json
+
+from json_stream import IncrementalJSONParser
+
+DOCUMENT = json.dumps({"preferences": ["Likes chess", "Hates \"early\" mornings"],
+                       "emotional_patterns": [], "facts": ["Lives in Pune", "Café owner\nin training"]})
+
+
+def feed_all(chunks):
+    parser = IncrementalJSONParser()
+    items = [item for chunk in chunks for item in parser.feed(chunk)]
+    return items, parser
+
+
+def test_items_arrive_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"preferences": ["Likes chess", "Plays') == [(("preferences",), "Likes chess")]
+    assert parser.feed(' guitar"], "facts": ["Has a dog"') == [(("preferences",), "Plays guitar"),
+                                                                 (("facts",), "Has a dog")]
+    assert not parser.complete
+    assert parser.feed("]}") == [] and parser.complete
+
+
+def test_any_chunking_gives_the_same_items():
+    expected = [(("preferences",), "Likes chess"), (("preferences",), 'Hates "early" mornings'),
+                (("facts",), "Lives in Pune"), (("facts",), "Café owner\nin training")]
+    for size in (1, 2, 3, 7, len(DOCUMENT)):
+        items, parser = feed_all(DOCUMENT[index:index + size] for index in range(0, len(DOCUMENT), size))
+        assert items == expected and parser.complete
+
+
+def test_escapes_split_across_chunks():
+    items, _ = feed_all(['{"facts": ["say \\', '"hi\\"", "caf\\u00', 'e9", "back\\', '\\slash"]}'])
+    assert [item for _, item in items] == ['say "hi"', "café", "back\\slash"]
+
+
+def test_truncated_input_keeps_closed_items():
+    items, parser = feed_all(['{"facts": ["Has a dog", "Lives in Pu'])
+    assert items == [(("facts",), "Has a dog")]
+    assert not parser.complete
+
+
+def test_code_fences_and_trailing_text_are_ignored():
+    items, parser = feed_all(['```json\n{"facts": ["Has a dog"]}\n```', '\nNote: "not an item"'])
+    assert items == [(("facts",), "Has a dog")]
+    assert parser.complete
+
+
+def test_nested_values_report_their_key_path():
+    items, parser = feed_all(['{"facts": ["a", {"detail": "not listed", "tags": ["b"]}], "meta": {"notes": ["c"]}}'])
+    assert items == [(("facts",), "a"), (("facts", "tags"), "b"), (("meta", "notes"), "c")]
+    assert parser.complete
+
+
+def test_non_string_items_and_values_are_skipped():
+    items, parser = feed_all(['{"count": 3, "facts": [1, "a", true, null, 2.5, "b"], "source": "chat"}'])
+    assert items == [(("facts",), "a"), (("facts",), "b")]
+    assert parser.complete
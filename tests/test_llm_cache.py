@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from engines import PersonalityEngine
+from llm_cache import ResponseCache, make_cache_key
+from metrics import MetricsRegistry
+
+
+def test_cache_key_is_stable_and_covers_every_part():
+    key = make_cache_key(model="gpt-4", messages=[{"role": "user", "content": "hi"}], temperature=0.7)
+
+    assert key == make_cache_key(temperature=0.7, messages=[{"role": "user", "content": "hi"}], model="gpt-4")
+    assert key != make_cache_key(model="gpt-4", messages=[{"role": "user", "content": "hi"}], temperature=0.2)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 2
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(ttl_seconds=0.05)
+    cache.set("a", {"facts": ["Has a dog"]})
+    assert cache.get("a") == {"facts": ["Has a dog"]}
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5 and stats["size"] == 0
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(disk_path=path).set("a", {"facts": ["Has a dog"]})
+
+    cache = ResponseCache(disk_path=path)
+    assert cache.get("a") == {"facts": ["Has a dog"]}
+    assert cache.stats()["disk_hits"] == 1
+
+    # Promoted to memory, so the next lookup does not touch disk
+    assert cache.get("a") == {"facts": ["Has a dog"]}
+    assert cache.stats()["disk_hits"] == 1
+
+    cache.clear()
+    assert ResponseCache(disk_path=path).get("a") is None
+
+
+def test_near_duplicate_text_hits_within_its_namespace():
+    pytest.importorskip("numpy")
+    from retrieval import HashingEmbedder
+
+    cache = ResponseCache(embedder=HashingEmbedder(), similarity_threshold=0.9)
+    cache.set("k1", "Take a short walk.", namespace="calm", text="How do I stop procrastinating?")
+
+    assert cache.get("k2", namespace="calm", text="how do I stop procrastinating") == "Take a short walk."
+    assert cache.get("k3", namespace="other", text="How do I stop procrastinating?") is None
+    assert cache.get("k4", namespace="calm", text="What should I cook tonight?") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_repeated_persona_request_is_served_from_the_cache(fake_client):
+    cache = ResponseCache()
+    engine = PersonalityEngine(fake_client, "gpt-4", cache=cache, metrics=MetricsRegistry())
+
+    first = engine.generate_response("hi", "Calm Mentor")
+    calls = fake_client.backend.calls
+
+    assert engine.generate_response("hi", "Calm Mentor") == first
+    assert fake_client.backend.calls == calls
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from fake_llm import FakeAPIError
+from llm_client import CircuitBreaker, CircuitOpenError, ResilientClient
+
+
+class ScriptedClient:
+    """Raises the scripted errors one call at a time, then passes calls to a client"""
+
+    def __init__(self, client, errors):
+        self.client = client
+        self.errors = list(errors)
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.client.chat.completions.create(**kwargs)
+
+
+REQUEST = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 20}
+
+
+def resilient(client, errors, **options):
+    sleeps = []
+    scripted = ScriptedClient(client, errors)
+    return ResilientClient(scripted, sleep=sleeps.append, **options), scripted, sleeps
+
+
+def test_transient_errors_are_retried(fake_client):
+    client, scripted, sleeps = resilient(fake_client, [FakeAPIError(503), FakeAPIError(500)])
+
+    assert client.chat.completions.create(**REQUEST).choices[0].message.content
+    assert scripted.calls == 3 and len(sleeps) == 2
+    assert client.counters == {"calls": 1, "retries": 2, "failures": 0, "rejected": 0}
+
+
+def test_client_errors_are_not_retried(fake_client):
+    client, scripted, sleeps = resilient(fake_client, [FakeAPIError(400)])
+
+    with pytest.raises(FakeAPIError):
+        client.chat.completions.create(**REQUEST)
+    assert scripted.calls == 1 and sleeps == []
+    assert client.breaker.state == "closed"
+
+
+def test_retries_give_up_after_max_retries(fake_client):
+    client, scripted, sleeps = resilient(fake_client, [FakeAPIError(502)] * 5, max_retries=2)
+
+    with pytest.raises(FakeAPIError):
+        client.chat.completions.create(**REQUEST)
+    assert scripted.calls == 3 and len(sleeps) == 2
+    assert client.counters["failures"] == 1
+
+
+def test_backoff_is_capped_but_retry_after_is_honored_in_full(fake_client):
+    client, _, sleeps = resilient(fake_client, [FakeAPIError(503)] * 3 + [FakeAPIError(429, retry_after=45)],
+                                  backoff_base=10.0, backoff_cap=20.0)
+
+    client.chat.completions.create(**REQUEST)
+
+    assert all(delay <= 20.0 for delay in sleeps[:3])
+    assert sleeps[3] == 45.0
+
+
+def test_throttling_does_not_open_the_breaker(fake_client):
+    breaker = CircuitBreaker(failure_threshold=2)
+    client, _, _ = resilient(fake_client, [FakeAPIError(429, retry_after=0)] * 4, breaker=breaker)
+
+    client.chat.completions.create(**REQUEST)
+
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_one_probe(fake_client):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    client, scripted, _ = resilient(fake_client, [FakeAPIError(503)] * 3, breaker=breaker, max_retries=1)
+
+    with pytest.raises(FakeAPIError):
+        client.chat.completions.create(**REQUEST)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.chat.completions.create(**REQUEST)
+    assert scripted.calls == 2 and client.counters["rejected"] == 1
+
+    # A failed probe reopens the circuit, so its retry fails fast; a successful probe closes it
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    with pytest.raises(CircuitOpenError):
+        client.chat.completions.create(**REQUEST)
+    assert breaker.state == "open" and scripted.calls == 3
+
+    time.sleep(0.06)
+    client.chat.completions.create(**REQUEST)
+    assert breaker.state == "closed" and scripted.calls == 4
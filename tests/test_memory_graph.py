@@ -0,0 +1,71 @@
+from memory_graph import MemoryGraph, MemoryGraphIndex, item_entities
+
+MEMORIES = {
+    "emotional_patterns": ["Feels anxious about the mock test"],
+    "facts": ["Failed the physics mock test", "Lives in Pune"],
+    "preferences": ["Likes playing chess"],
+}
+
+
+def graph_of(memories):
+    graph = MemoryGraph()
+    graph.sync(memories)
+    return graph
+
+
+def test_relations_come_from_the_item_wording():
+    assert item_entities("Feels anxious about calculus exams", "emotional_patterns") == {
+        "calculus": "caused_by", "exam": "caused_by", "anxious": "mentions"}
+    assert item_entities("Likes playing chess", "preferences") == {"chess": "likes", "play": "likes"}
+    # "about" only names a cause for emotions
+    assert item_entities("Talked about calculus", "facts") == {"talk": "mentions", "calculus": "mentions"}
+
+
+def test_generic_words_and_numbers_are_not_entities():
+    entities = item_entities("Feels like they always struggle with 300 pages", "emotional_patterns")
+    assert entities == {"pag": "struggles_with"}
+
+    # Rule-extracted items refer to the user in the third person; that must not link them all
+    graph = graph_of({"facts": ["Thinks they sing well"], "emotional_patterns": ["Feels they are failing"]})
+    assert [item for _, item, _ in graph.related("failing")] == ["Feels they are failing"]
+
+
+def test_related_follows_several_hops():
+    graph = graph_of(MEMORIES)
+
+    related = graph.related("physics is so hard")
+    assert [item for _, item, _ in related] == ["Failed the physics mock test", "Feels anxious about the mock test"]
+    assert related[0][2] > related[1][2]
+
+    assert graph.related("physics", max_depth=1) == [("facts", "Failed the physics mock test", 0.6)]
+    assert graph.related("nothing relevant here") == []
+
+
+def test_relation_filter_limits_the_edges_followed():
+    graph = graph_of(MEMORIES)
+    assert [item for _, item, _ in graph.related("mock test", relations={"caused_by"})] == [
+        "Feels anxious about the mock test"]
+
+
+def test_sync_applies_only_the_difference():
+    graph = graph_of(MEMORIES)
+    assert graph.sync(MEMORIES) == (0, 0)
+
+    changed = dict(MEMORIES, facts=["Lives in Pune", "Plays the guitar"])
+    assert graph.sync(changed) == (1, 1)
+    assert "physic" not in graph.entities() and "physics" not in graph.entities()
+    assert graph.related("physics") == []
+    assert len(graph) == 4
+
+
+def test_index_keeps_one_graph_per_user():
+    index = MemoryGraphIndex(k=1)
+    assert index.related("u", "physics") == []
+
+    assert [item for _, item, _ in index.related("u", "physics", MEMORIES)] == ["Failed the physics mock test"]
+    index.sync("other", {"preferences": ["Likes playing chess"]})
+    assert index.related("other", "physics") == []
+    assert index.counters["items_added"] == 5 and index.counters["queries"] == 2
+
+    index.forget("u")
+    assert index.graph("u") is None and index.graph("other") is not None
@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+
+import pytest
+
+from consolidation import MemoryConsolidator
+from memory_store import InMemoryMemoryStore, SQLiteMemoryStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    """Builds a store of the parametrized backend with the given consolidator"""
+    def build(consolidator=None):
+        if request.param == "memory":
+            return InMemoryMemoryStore(consolidator)
+        return SQLiteMemoryStore(str(tmp_path / "memory.db"), consolidator)
+    return build
+
+
+def occurrences(store, user_id, category):
+    return {item.text: item.occurrences for item in store.get_items(user_id)[category]}
+
+
+def test_upsert_dedups_and_keeps_insertion_order(make_store):
+    store = make_store()
+    store.upsert("u", {"facts": ["Has a dog", "Lives in Pune"], "preferences": ["Likes chess"]})
+    memories = store.upsert("u", {"facts": ["has a dog.", "Plays guitar"]})
+
+    assert memories["facts"] == ["Has a dog", "Lives in Pune", "Plays guitar"]
+    assert memories["preferences"] == ["Likes chess"]
+    assert memories["emotional_patterns"] == []
+    assert store.contains("u", "facts", "HAS A DOG!")
+
+
+def test_repeats_within_one_batch_are_counted(make_store):
+    store = make_store()
+    store.upsert("u", {"facts": ["Exam stress", "exam stress.", "Exam  Stress!"]})
+    assert occurrences(store, "u", "facts") == {"Exam stress": 3}
+
+    store.upsert("u", {"facts": ["exam stress", "Has a dog", "has a dog"]})
+    assert occurrences(store, "u", "facts") == {"Exam stress": 4, "Has a dog": 2}
+
+
+def test_near_duplicates_merge_into_the_existing_item(make_store):
+    store = make_store(MemoryConsolidator())
+    store.upsert("u", {"emotional_patterns": ["Feels stressed about calculus exams"]})
+    store.upsert("u", {"emotional_patterns": ["Feels stressed about the calculus exam",
+                                              "Feels stressed about calculus exams!"]})
+
+    assert occurrences(store, "u", "emotional_patterns") == {"Feels stressed about calculus exams": 3}
+
+
+def test_embeddings_are_computed_before_taking_locks(make_store):
+    np = pytest.importorskip("numpy")
+    calls = []
+
+    def embedder(texts):
+        # Stands in for a network call: neither the store nor the consolidator may be locked
+        calls.append((list(texts), store._lock.locked() or consolidator._lock.locked()))
+        return np.array([[len(text), 1.0] for text in texts])
+
+    consolidator = MemoryConsolidator(embedder=embedder, embedding_threshold=2.0)
+    store = make_store(consolidator)
+    store.upsert("u", {"facts": ["Has a dog", "Plays guitar"]})
+    store.upsert("u", {"facts": ["Plays the violin"]})
+    store.replace("u", {"facts": ["Has a cat"]})
+
+    assert [texts for texts, _ in calls] == [["Has a dog", "Plays guitar"], ["Plays the violin"], ["Has a cat"]]
+    assert not any(locked for _, locked in calls)
+
+
+def test_backends_agree(tmp_path):
+    batches = [
+        {"facts": ["Exam stress", "exam stress.", "Has a dog"], "preferences": ["Likes chess", "likes chess"]},
+        {"facts": ["Has a dog", "Has a cat", "Exam stress"], "emotional_patterns": ["Feels anxious at night"]},
+        {"facts": ["has a cat!"], "preferences": ["Enjoys long walks"]},
+    ]
+    stores = [InMemoryMemoryStore(MemoryConsolidator()),
+              SQLiteMemoryStore(str(tmp_path / "memory.db"), MemoryConsolidator())]
+    for batch in batches:
+        results = [store.upsert("u", batch) for store in stores]
+        assert results[0] == results[1]
+    for category in ("facts", "preferences", "emotional_patterns"):
+        assert occurrences(stores[0], "u", category) == occurrences(stores[1], "u", category)
+
+
+def test_max_items_evicts_the_least_weighted(make_store):
+    store = make_store(MemoryConsolidator(max_items=2))
+    store.upsert("u", {"facts": ["Has a dog", "Has a dog", "Lives in Pune"]})
+    memories = store.upsert("u", {"facts": ["Plays the guitar"]})
+
+    assert len(memories["facts"]) == 2
+    assert "Has a dog" in memories["facts"]
+
+
+def test_clear_removes_memories_cursor_and_summary(make_store):
+    store = make_store()
+    store.upsert("u", {"facts": ["Has a dog"]})
+    store.upsert("other", {"facts": ["Has a cat"]})
+    store.set_cursor("u", 12)
+    store.set_summary("u", {"cursor": 4, "chunks": [], "session": "x"})
+
+    store.clear("u")
+
+    assert not store.has_memories("u")
+    assert store.get_cursor("u") == 0
+    assert store.get_summary("u") is None
+    assert store.get("other")["facts"] == ["Has a cat"]
+
+
+def test_replace_drops_old_memories_but_keeps_the_cursor(make_store):
+    store = make_store()
+    store.upsert("u", {"facts": ["Has a dog", "Has a dog"], "preferences": ["Likes chess"]})
+    store.upsert("other", {"facts": ["Has a cat"]})
+    store.set_cursor("u", 12)
+
+    memories = store.replace("u", {"facts": ["Has a dog", "Plays guitar"]})
+
+    assert memories["facts"] == ["Has a dog", "Plays guitar"]
+    assert memories["preferences"] == []
+    assert occurrences(store, "u", "facts") == {"Has a dog": 1, "Plays guitar": 1}
+    assert store.get_cursor("u") == 12
+    assert store.get("other")["facts"] == ["Has a cat"]
+
+
+def test_append_conversation_replaces_from_start(make_store):
+    store = make_store()
+    messages = [{"role": "user", "content": str(index)} for index in range(4)]
+    store.append_conversation("u", 0, messages)
+    store.append_conversation("u", 2, [{"role": "assistant", "content": "x"}])
+
+    assert store.get_conversation("u") == messages[:2] + [{"role": "assistant", "content": "x"}]
+
+
+def test_sqlite_store_persists_across_connections(tmp_path):
+    path = str(tmp_path / "memory.db")
+    SQLiteMemoryStore(path).upsert("u", {"facts": ["Has a dog", "has a dog"]})
+    reopened = SQLiteMemoryStore(path)
+
+    assert reopened.get("u")["facts"] == ["Has a dog"]
+    assert occurrences(reopened, "u", "facts") == {"Has a dog": 2}
+
+
+def test_cursor_keeps_its_digest(make_store):
+    store = make_store()
+    assert store.get_cursor("u") == 0 and store.get_cursor_digest("u") is None
+
+    store.set_cursor("u", 12, "abc")
+    assert (store.get_cursor("u"), store.get_cursor_digest("u")) == (12, "abc")
+    store.set_cursor("u", 14)
+    assert (store.get_cursor("u"), store.get_cursor_digest("u")) == (14, None)
+
+
+def test_sqlite_cursors_from_before_digests_are_migrated(tmp_path):
+    path = str(tmp_path / "memory.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE extraction_cursors (user_id TEXT PRIMARY KEY, cursor INTEGER NOT NULL)")
+    conn.execute("INSERT INTO extraction_cursors VALUES ('u', 12)")
+    conn.commit()
+    conn.close()
+
+    store = SQLiteMemoryStore(path)
+    assert (store.get_cursor("u"), store.get_cursor_digest("u")) == (12, None)
+    store.set_cursor("u", 14, "abc")
+    assert SQLiteMemoryStore(path).get_cursor_digest("u") == "abc"
+
+
+def test_categories_and_lookups(make_store):
+    store = make_store()
+    assert not store.has_memories("u")
+    assert store.get("u") == {"preferences": [], "emotional_patterns": [], "facts": []}
+
+    store.upsert("u", {"facts": ["Has a dog", "  ", 42], "moods": ["ignored"], "preferences": None})
+
+    assert store.has_memories("u")
+    assert store.get_category("u", "facts") == ["Has a dog"]
+    assert store.get_category("u", "preferences") == []
+    assert not store.contains("u", "preferences", "Has a dog")
+    assert not store.contains("other", "facts", "Has a dog")
+
+
+def test_concurrent_writers_lose_nothing(make_store):
+    store = make_store()
+
+    def write(worker):
+        for index in range(20):
+            store.upsert("u", {"facts": [f"Fact {worker}-{index}", "Shared fact"]})
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts = occurrences(store, "u", "facts")
+    assert len(counts) == 81 and counts["Shared fact"] == 80
+
+
+def test_sqlite_lookups_use_the_unique_index(tmp_path):
+    store = SQLiteMemoryStore(str(tmp_path / "memory.db"))
+    plan = store.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT 1 FROM memories WHERE user_id = ? AND category = ? AND item_key = ?",
+        ("u", "facts", "has a dog")).fetchall()
+    assert any(row[-1].startswith("SEARCH") and "sqlite_autoindex_memories" in row[-1] for row in plan)
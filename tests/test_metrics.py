@@ -0,0 +1,88 @@
+import json
+import threading
+
+from metrics import InMemoryHistogramExporter, JsonLinesExporter, MetricsRegistry, percentile, usage_tokens
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 51.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(list(reversed(values)), 0) == 1.0
+    assert percentile([], 95) == 0.0
+
+
+def test_summary_per_operation_and_label():
+    registry = MetricsRegistry()
+    for wall_time in (0.1, 0.2, 0.3):
+        registry.record_call("generate", wall_time, label="Calm Mentor", ttft=wall_time / 2,
+                             prompt_tokens=10, completion_tokens=5)
+    registry.record_call("generate", 0.0, label="Calm Mentor", cache_hit=True)
+    registry.record_call("extract", 1.0, error=True)
+
+    summary = registry.summary()
+    mentor = summary["generate:Calm Mentor"]
+    assert (mentor["calls"], mentor["prompt_tokens"], mentor["completion_tokens"], mentor["cache_hits"]) == (4, 30, 15, 1)
+    assert mentor["p50_ms"] == 200.0 and mentor["ttft_p50_ms"] == 100.0
+    assert summary["extract"]["errors"] == 1 and summary["extract"]["ttft_p50_ms"] is None
+
+
+def test_histogram_keeps_only_recent_samples():
+    exporter = InMemoryHistogramExporter(max_samples=2)
+    for wall_time in (10.0, 0.1, 0.1):
+        exporter.export({"operation": "generate", "wall_time": wall_time})
+
+    summary = exporter.summary()["generate"]
+    assert summary["calls"] == 3 and summary["p95_ms"] == 100.0
+
+
+def test_prometheus_text_includes_histograms_tokens_and_counters():
+    registry = MetricsRegistry()
+    registry.record_call("generate", 0.2, label="Therapist", prompt_tokens=12, completion_tokens=3, cache_hit=True)
+    registry.increment("hedges_fired", 2)
+
+    text = registry.render_prometheus()
+
+    assert 'companion_llm_call_duration_seconds_bucket{operation="generate",label="Therapist",le="0.1"} 0' in text
+    assert 'companion_llm_call_duration_seconds_bucket{operation="generate",label="Therapist",le="0.25"} 1' in text
+    assert 'companion_llm_call_duration_seconds_count{operation="generate",label="Therapist"} 1' in text
+    assert 'companion_llm_tokens_total{operation="generate",label="Therapist",kind="prompt"} 12' in text
+    assert 'companion_llm_cache_hits_total{operation="generate",label="Therapist"} 1' in text
+    assert "companion_llm_hedges_fired 2.0" in text
+
+
+def test_json_lines_exporter_writes_one_record_per_call(tmp_path):
+    path = tmp_path / "calls.jsonl"
+    registry = MetricsRegistry([JsonLinesExporter(str(path))])
+    registry.record_call("generate", 0.5, label="Therapist")
+    registry.record_call("extract", 1.5)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(record["operation"], record["label"]) for record in records] == [("generate", "Therapist"),
+                                                                              ("extract", None)]
+
+
+def test_concurrent_recording_loses_nothing():
+    registry = MetricsRegistry()
+
+    def record():
+        for _ in range(200):
+            registry.record_call("generate", 0.01, prompt_tokens=1)
+            registry.increment("calls")
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert registry.summary()["generate"]["prompt_tokens"] == 800
+    assert registry.counters["calls"] == 800
+
+
+def test_usage_tokens_from_a_response(fake_client):
+    response = fake_client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "hi"}])
+    prompt_tokens, completion_tokens = usage_tokens(response)
+
+    assert prompt_tokens > 0 and completion_tokens > 0
+    assert usage_tokens(object()) == (None, None)
@@ -0,0 +1,114 @@
+import time
+
+from engines import FailedReply, PersonalityEngine
+from fake_llm import FakeChatBackend, FakeChatClient
+from metrics import MetricsRegistry
+
+
+def engine_for(client, **options):
+    return PersonalityEngine(client, "gpt-4", metrics=MetricsRegistry(), **options)
+
+
+def slow_client(latency_ms: float = 150, **options) -> FakeChatClient:
+    return FakeChatClient(FakeChatBackend(latency_ms=latency_ms, latency_sigma=0.0, tokens_per_second=5000, **options))
+
+
+def test_generate_many_runs_personalities_concurrently():
+    engine = engine_for(slow_client())
+    personalities = list(PersonalityEngine.PERSONALITIES)
+
+    started = time.perf_counter()
+    responses = dict(engine.generate_many("How do I stop procrastinating?", personalities))
+    elapsed = time.perf_counter() - started
+
+    assert set(responses) == set(personalities) and all(responses.values())
+    # About one request's latency (150 ms), not one per personality
+    assert elapsed < 0.3
+
+
+def test_generate_many_yields_each_reply_as_it_completes(fake_client):
+    engine = engine_for(fake_client)
+    personalities = list(PersonalityEngine.PERSONALITIES)[:2]
+
+    results = list(engine.generate_many("hi", personalities + ["Pirate"], max_workers=1))
+
+    assert sorted(name for name, _ in results) == sorted(personalities + ["Pirate"])
+    assert dict(results)["Pirate"] == "Invalid personality selected."
+    assert list(engine.generate_many("hi", [])) == []
+
+
+def test_stream_many_interleaves_deltas_and_marks_completion():
+    engine = engine_for(slow_client())
+    personalities = list(PersonalityEngine.PERSONALITIES)
+
+    texts = {personality: "" for personality in personalities}
+    done = []
+    for personality, delta in engine.stream_many("hi", personalities):
+        if delta is None:
+            done.append(personality)
+        else:
+            assert personality not in done
+            texts[personality] += delta
+
+    assert sorted(done) == sorted(personalities)
+    assert all(texts.values())
+
+
+class BrokenStreamClient:
+    """Streams a few chunks from a client, then fails mid-stream"""
+
+    def __init__(self, client, chunks: int):
+        self.client = client
+        self.chunks = chunks
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        stream = self.client.chat.completions.create(**kwargs)
+        if not kwargs.get("stream"):
+            return stream
+        return self._broken(stream)
+
+    def _broken(self, stream):
+        for index, chunk in enumerate(stream):
+            if index == self.chunks:
+                raise ConnectionError("connection reset")
+            yield chunk
+
+
+def test_stream_yields_deltas_before_the_reply_is_complete(fake_client):
+    registry = MetricsRegistry()
+    client = FakeChatClient(FakeChatBackend(latency_ms=0, sleep=True, tokens_per_second=200))
+    engine = PersonalityEngine(client, "gpt-4", metrics=registry)
+
+    started = time.perf_counter()
+    stream = engine.generate_response_stream("hi", "Calm Mentor")
+    first = next(stream)
+    first_at = time.perf_counter() - started
+    rest = list(stream)
+    total = time.perf_counter() - started
+
+    assert rest and first_at < total / 4
+    assert first + "".join(rest) == engine_for(fake_client).generate_response("hi", "Calm Mentor")
+    assert registry.summary()["generate_stream:Calm Mentor"]["ttft_p50_ms"] is not None
+
+
+def test_stream_failure_mid_reply_ends_with_a_failed_marker(fake_client):
+    engine = engine_for(BrokenStreamClient(fake_client, chunks=3))
+
+    deltas = list(engine.generate_response_stream("hi", "Calm Mentor"))
+
+    assert len(deltas) == 4
+    assert not any(isinstance(delta, FailedReply) for delta in deltas[:3])
+    assert isinstance(deltas[-1], FailedReply) and "connection reset" in deltas[-1]
+
+
+def test_stream_failure_before_the_first_token_falls_back_to_a_blocking_request(fake_client):
+    engine = engine_for(BrokenStreamClient(fake_client, chunks=0))
+    assert list(engine.generate_response_stream("hi", "Calm Mentor")) == [engine.generate_response("hi", "Calm Mentor")]
+
+    fake_client.backend.error_rate = 1.0
+    deltas = list(engine.generate_response_stream("hi", "Calm Mentor"))
+    assert len(deltas) == 1 and isinstance(deltas[0], FailedReply)
+
+    assert list(engine.generate_response_stream("hi", "Pirate")) == ["Invalid personality selected."]
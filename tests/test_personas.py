@@ -0,0 +1,69 @@
+import json
+import os
+
+from engines import PersonalityEngine
+from metrics import MetricsRegistry
+from personas import PersonaRegistry, normalize_prompt
+
+
+def write_persona(directory, filename, name, prompt, order=0):
+    path = directory / filename
+    path.write_text(json.dumps({"name": name, "system_prompt": prompt, "order": order}), encoding="utf-8")
+    return path
+
+
+def test_prompts_are_normalized():
+    assert normalize_prompt("  You are   kind.\n\n\t- Be brief  \n") == "You are kind.\n- Be brief"
+
+
+def test_bundled_personas_load_in_display_order():
+    registry = PersonaRegistry()
+
+    assert list(registry) == ["Calm Mentor", "Witty Friend", "Therapist"]
+    persona = registry["Calm Mentor"]
+    assert persona.message == {"role": "system", "content": persona.system_prompt}
+    assert persona.token_count > 0
+
+
+def test_registry_orders_by_order_then_name(tmp_path):
+    write_persona(tmp_path, "b.json", "Zen", "Be calm.", order=1)
+    write_persona(tmp_path, "a.json", "Alpha", "Be bold.", order=2)
+    write_persona(tmp_path, "c.json", "Beta", "Be brief.", order=1)
+    (tmp_path / "notes.txt").write_text("ignored")
+
+    assert list(PersonaRegistry(str(tmp_path))) == ["Beta", "Zen", "Alpha"]
+    assert len(PersonaRegistry(str(tmp_path / "missing"))) == 0
+
+
+def test_edits_are_picked_up_on_reload(tmp_path):
+    path = write_persona(tmp_path, "zen.json", "Zen", "Be calm.")
+    registry = PersonaRegistry(str(tmp_path), reload_interval=None)
+    assert registry["Zen"].system_prompt == "Be calm."
+    assert not registry.reload()
+
+    write_persona(tmp_path, "zen.json", "Zen", "Be very calm.")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    write_persona(tmp_path, "pal.json", "Pal", "Be fun.")
+
+    assert registry.reload()
+    assert registry["Zen"].system_prompt == "Be very calm." and "Pal" in registry
+
+
+def test_invalid_file_keeps_the_last_good_version(tmp_path):
+    path = write_persona(tmp_path, "zen.json", "Zen", "Be calm.")
+    registry = PersonaRegistry(str(tmp_path), reload_interval=None)
+    assert "Zen" in registry
+
+    path.write_text('{"name": "Zen", "system_pro', encoding="utf-8")
+    assert registry.reload()
+    assert registry["Zen"].system_prompt == "Be calm."
+
+
+def test_requests_for_a_persona_share_a_byte_identical_prefix(fake_client):
+    engine = PersonalityEngine(fake_client, "gpt-4", metrics=MetricsRegistry())
+
+    first = engine.plan_prompt("hi", "Therapist").messages
+    second = engine.plan_prompt("something else", "Therapist", context="Has a dog", history="User: hello").messages
+
+    assert first[0] == second[0] == engine.personas["Therapist"].message
+    assert second[1]["content"].startswith("Conversation so far:") and first[-1] == {"role": "user", "content": "hi"}
@@ -0,0 +1,71 @@
+from prompt_budget import (TOKENS_PER_MESSAGE, TOKENS_PER_REPLY, PromptAssembler, PromptSection, count_message_tokens,
+                           count_tokens, truncate_to_tokens)
+
+LONG = " ".join(f"word{index}" for index in range(400))
+
+
+def test_message_tokens_include_the_chat_overhead():
+    messages = [{"role": "system", "content": "Be kind."}, {"role": "user", "content": "hi"}]
+    expected = count_tokens("Be kind.") + count_tokens("hi") + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+
+    assert count_message_tokens(messages) == expected
+    assert count_tokens("") == 0
+
+
+def test_truncation_keeps_the_head_or_the_tail():
+    head = truncate_to_tokens(LONG, 20)
+    tail = truncate_to_tokens(LONG, 20, keep="tail")
+
+    assert count_tokens(head) <= 20 and LONG.startswith(head)
+    assert count_tokens(tail) <= 20 and LONG.endswith(tail)
+    assert truncate_to_tokens("short", 20) == "short"
+    assert truncate_to_tokens(LONG, 0) == ""
+
+
+def test_sections_are_cut_to_their_own_budgets():
+    plan = PromptAssembler().assemble([
+        PromptSection("persona", "Be kind.", 50, role="system"),
+        PromptSection("history", LONG, 30, role="system", keep="tail", template="Conversation so far:\n{}"),
+        PromptSection("user", "hi", 10, role="user", optional=False),
+    ], max_completion_tokens=200)
+
+    assert plan.truncated == ["history"]
+    assert count_tokens(plan.texts["history"]) <= 30 and LONG.endswith(plan.texts["history"])
+    assert plan.messages[1]["content"].startswith("Conversation so far:\n")
+    assert plan.prompt_tokens == count_message_tokens(plan.messages)
+    assert plan.report()["max_total_tokens"] == plan.prompt_tokens + 200
+
+
+def test_overall_budget_shrinks_the_lowest_priority_first():
+    assembler = PromptAssembler(max_prompt_tokens=120)
+    plan = assembler.assemble([
+        PromptSection("persona", LONG[:200], priority=2, role="system"),
+        PromptSection("history", LONG, priority=0, role="system"),
+        PromptSection("user", "hi", priority=3, role="user", optional=False),
+    ])
+
+    assert plan.prompt_tokens <= 120
+    assert plan.texts["persona"] == LONG[:200] and plan.texts["user"] == "hi"
+    assert plan.truncated == ["history"]
+
+
+def test_empty_optional_sections_are_dropped():
+    plan = PromptAssembler().assemble([
+        PromptSection("memory", "", role="system", template="Context about user: {}"),
+        PromptSection("user", "", role="user", optional=False),
+    ])
+
+    assert plan.messages == [{"role": "user", "content": ""}]
+    assert plan.section_tokens["memory"] == 0
+
+
+def test_summarizer_is_used_before_truncation():
+    calls = []
+
+    def summarizer(text, max_tokens):
+        calls.append(max_tokens)
+        return "A long list of words."
+
+    plan = PromptAssembler(summarizer=summarizer).assemble([PromptSection("history", LONG, 25, role="system")])
+
+    assert calls == [25] and plan.texts["history"] == "A long list of words."
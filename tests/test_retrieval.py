@@ -0,0 +1,105 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from retrieval import HashingEmbedder, MemoryRetriever, VectorIndex, estimate_tokens  # noqa: E402
+
+MEMORIES = {
+    "facts": ["Has a golden retriever named Max", "Lives in Pune", "Works as a nurse"],
+    "preferences": ["Likes playing chess", "Enjoys hiking in the mountains"],
+    "emotional_patterns": ["Feels anxious before calculus exams"],
+}
+
+
+class CountingEmbedder(HashingEmbedder):
+    """Hashing embedder that records every batch it is asked to embed"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return super().__call__(texts)
+
+
+def test_most_relevant_memory_ranks_first():
+    retriever = MemoryRetriever(token_budget=1000)
+    results = retriever.retrieve("u", MEMORIES, "my calculus exams make me anxious", k=3)
+
+    assert results[0][:2] == ("emotional_patterns", "Feels anxious before calculus exams")
+    assert [score for _, _, score in results] == sorted((score for _, _, score in results), reverse=True)
+
+
+def test_token_budget_limits_the_selection():
+    retriever = MemoryRetriever(top_k=6, token_budget=12)
+    results = retriever.retrieve("u", MEMORIES, "tell me about my dog")
+
+    assert results and sum(estimate_tokens(item) for _, item, _ in results) <= 12
+    assert retriever.retrieve("u", {}, "anything") == []
+
+
+def test_item_vectors_are_cached_between_calls():
+    embedder = CountingEmbedder()
+    retriever = MemoryRetriever(embedder)
+    retriever.retrieve("u", MEMORIES, "first message")
+    retriever.retrieve("u", MEMORIES, "second message")
+
+    grown = dict(MEMORIES, facts=MEMORIES["facts"] + ["Has a cat"])
+    retriever.retrieve("u", grown, "third message")
+
+    assert len(embedder.batches[0]) == 7
+    assert embedder.batches[1:] == [["second message"], ["Has a cat", "third message"]]
+
+
+def test_removed_items_are_never_returned():
+    retriever = MemoryRetriever(token_budget=1000)
+    retriever.retrieve("u", MEMORIES, "dog")
+
+    trimmed = dict(MEMORIES, facts=["Lives in Pune"])
+    items = [item for _, item, _ in retriever.retrieve("u", trimmed, "golden retriever Max", k=10)]
+
+    assert "Has a golden retriever named Max" not in items
+    assert set(retriever._vectors["u"]) == {item for values in trimmed.values() for item in values}
+
+
+def test_related_items_come_first_without_duplicates():
+    retriever = MemoryRetriever(token_budget=1000)
+    related = [("preferences", "Likes playing chess", 1.0)]
+    results = retriever.retrieve("u", MEMORIES, "Likes playing chess", related=related)
+
+    assert results[0] == related[0]
+    assert [item for _, item, _ in results].count("Likes playing chess") == 1
+
+
+def test_build_context_groups_by_category():
+    retriever = MemoryRetriever(token_budget=1000)
+    context = retriever.build_context("u", MEMORIES, "anxious about calculus exams and chess", k=2)
+
+    assert "Emotions: Feels anxious before calculus exams." in context
+    assert retriever.build_context("u", {}, "hi") == ""
+
+
+def test_forget_drops_the_users_index():
+    embedder = CountingEmbedder()
+    retriever = MemoryRetriever(embedder)
+    retriever.retrieve("u", MEMORIES, "hi")
+    retriever.forget("u")
+    retriever.retrieve("u", MEMORIES, "hi")
+
+    assert len(embedder.batches[1]) == 7
+
+
+@pytest.mark.parametrize("options", [{}, {"quantize": True}, {"nlist": 4, "nprobe": 4}])
+def test_vector_index_finds_the_nearest_vector(options):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(64, 16)).astype(np.float32)
+    index = VectorIndex(16, **options)
+    index.add(vectors)
+
+    hits = index.search(vectors[10] + 0.01, k=3)
+
+    assert len(index) == 64
+    assert hits[0][0] == 10 and hits[0][1] > 0.95
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+    assert VectorIndex(16).search(vectors[0], k=3) == []
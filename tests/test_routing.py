@@ -0,0 +1,57 @@
+from engines import MemoryExtractor, PersonalityEngine
+from metrics import MetricsRegistry
+from routing import ModelRouter, Route
+
+
+def test_first_route_that_fits_wins():
+    registry = MetricsRegistry()
+    router = ModelRouter("gpt-4", {"extract": [Route("small", "gpt-35", 1000), Route("large", "gpt-4-32k")]},
+                         metrics=registry)
+
+    assert router.deployment_for("extract", 800) == "gpt-35"
+    assert router.deployment_for("extract", 5000) == "gpt-4-32k"
+    assert router.deployment_for("generate", 5000) == "gpt-4"
+    assert registry.counters["route_extract_small_calls_total"] == 1
+    assert registry.counters["route_generate_default_calls_total"] == 1
+
+
+def test_routes_from_the_environment():
+    router = ModelRouter.from_env({"AZURE_OPENAI_EXTRACT_DEPLOYMENT": "gpt-35",
+                                   "AZURE_OPENAI_LARGE_DEPLOYMENT": "gpt-4-32k",
+                                   "ROUTER_LARGE_INPUT_TOKENS": "2000"}, "gpt-4", MetricsRegistry())
+
+    assert router.deployment_for("extract", 100) == "gpt-35"
+    assert router.deployment_for("extract", 3000) == "gpt-4-32k"
+    assert router.deployment_for("generate", 100) == "gpt-4"
+    assert router.deployment_for("summarize", 3000) == "gpt-4-32k"
+
+    assert ModelRouter.from_env({}, "gpt-4").routes == {}
+
+
+def test_record_tracks_latency_errors_and_items():
+    registry = MetricsRegistry()
+    router = ModelRouter("gpt-4", metrics=registry)
+    router.record("extract", router.default, 0.2, items=3)
+    router.record("extract", router.default, 0.4, error=True)
+
+    assert registry.summary()["route_extract:default"]["errors"] == 1
+    assert registry.counters["route_extract_default_items_total"] == 3
+    assert registry.counters["route_extract_default_errors_total"] == 1
+
+
+def test_engines_send_each_task_to_its_route(fake_client, make_conversation):
+    models = []
+    create = fake_client.chat.completions.create
+
+    def recording_create(**kwargs):
+        models.append(kwargs["model"])
+        return create(**kwargs)
+
+    fake_client.chat.completions.create = recording_create
+    registry = MetricsRegistry()
+    router = ModelRouter("gpt-4", {"extract": [Route("small", "gpt-35")]}, metrics=registry)
+
+    MemoryExtractor(fake_client, "gpt-4", metrics=registry, router=router).extract_memories(make_conversation(4))
+    PersonalityEngine(fake_client, "gpt-4", metrics=registry, router=router).generate_response("hi", "Therapist")
+
+    assert models == ["gpt-35", "gpt-4"]
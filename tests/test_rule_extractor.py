@@ -0,0 +1,49 @@
+from engines import MemoryExtractor
+from metrics import MetricsRegistry
+from rule_extractor import RuleBasedExtractor
+
+
+def user(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+def test_items_are_rephrased_in_the_third_person():
+    memories, confidence = RuleBasedExtractor().extract(
+        user("I love playing chess with my brother.", "I am so stressed about my exams.",
+             "I am a software engineer at Infosys"))
+
+    assert memories == {"preferences": ["Likes playing chess with their brother"],
+                        "emotional_patterns": ["Feels stressed about their exams"],
+                        "facts": ["Is a software engineer"]}
+    assert confidence == 1.0
+
+
+def test_confidence_is_the_share_of_clauses_understood():
+    extractor = RuleBasedExtractor()
+    _, confidence = extractor.extract(user("The weather in the hills was lovely today. I live in Pune."))
+
+    assert confidence == 0.5 and not extractor.is_confident(confidence)
+    assert extractor.is_confident(extractor.extract(user("ok thanks", "Yeah got it"))[1])
+
+
+def test_assistant_turns_are_ignored():
+    memories, _ = RuleBasedExtractor().extract([{"role": "assistant", "content": "I love chess with my friends"}])
+    assert memories == {"preferences": [], "emotional_patterns": [], "facts": []}
+
+
+def test_local_tier_is_opt_in_and_escalates_when_unsure(fake_client):
+    registry = MetricsRegistry()
+    confident = user("I love playing chess with my brother.")
+    unsure = user("The weather in the hills was lovely today.")
+
+    MemoryExtractor(fake_client, "gpt-4", metrics=registry).extract_memories(confident)
+    assert fake_client.backend.calls == 1
+
+    extractor = MemoryExtractor(fake_client, "gpt-4", metrics=registry, local_extractor=RuleBasedExtractor())
+    assert extractor.extract_memories(confident)["preferences"] == ["Likes playing chess with their brother"]
+    assert fake_client.backend.calls == 1
+
+    extractor.extract_memories(unsure)
+    assert fake_client.backend.calls == 2
+    assert registry.counters["route_extract_local_calls_total"] == 1
+    assert registry.counters["route_extract_local_escalations_total"] == 1
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import service  # noqa: E402
+from companion import CompanionServices  # noqa: E402
+from engines import SAMPLE_CONVERSATIONS, PersonalityEngine  # noqa: E402
+
+
+@pytest.fixture
+def services(tmp_path, fake_client, monkeypatch):
+    env = {"MEMORY_DB_PATH": str(tmp_path / "memory.db")}
+    instance = CompanionServices(env, client=fake_client)
+    monkeypatch.setattr(service, "services", instance)
+    yield instance
+    instance.worker.shutdown()
+
+
+@pytest.fixture
+def client(services):
+    return TestClient(service.app)
+
+
+def items(memories):
+    return [item for values in memories.values() for item in values]
+
+
+def test_healthz(client):
+    assert client.get("/healthz").json() == {"status": "ok", "error": None}
+
+
+def test_requests_need_a_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "services", CompanionServices({"MEMORY_DB_PATH": str(tmp_path / "memory.db")}))
+    client = TestClient(service.app)
+
+    assert client.get("/healthz").json()["status"] == "degraded"
+    assert client.post("/generate", json={"message": "hi"}).status_code == 503
+
+
+def test_unknown_personality_is_not_found(client):
+    response = client.post("/generate", json={"message": "hi", "personality": "Pirate"})
+    assert response.status_code == 404
+
+
+def test_generate_and_compare(client):
+    response = client.post("/generate", json={"message": "hi", "personality": "Calm Mentor"}).json()
+    assert response["personality"] == "Calm Mentor" and response["response"]
+
+    responses = client.post("/compare", json={"message": "hi"}).json()["responses"]
+    assert list(responses) == list(PersonalityEngine.PERSONALITIES)
+    assert all(responses.values())
+
+
+def test_memory_edits_are_read_back(client):
+    update = {"facts": ["Has a dog named Bruno"], "preferences": ["Likes chess"]}
+    assert client.put("/memories/u1", json=update).status_code == 200
+
+    memories = client.get("/memories/u1").json()
+    assert memories["facts"] == ["Has a dog named Bruno"]
+    assert memories["preferences"] == ["Likes chess"]
+
+
+def test_extract_waits_for_the_memories(client, services):
+    response = client.post("/extract", json={"user_id": "u1", "conversations": SAMPLE_CONVERSATIONS[:6],
+                                             "wait": True}).json()
+
+    assert response["status"] == "done"
+    assert items(response["memories"]) and response["memories"] == services.store.get("u1")
+
+
+def test_failed_extraction_returns_stored_memories_not_sample_data(client, services, fake_client):
+    fake_client.backend.error_rate = 1.0
+    request = {"user_id": "u1", "conversations": SAMPLE_CONVERSATIONS[:6], "wait": True}
+
+    response = client.post("/extract", json=request).json()
+
+    assert response["status"] == "failed" and response["error"]
+    assert items(response["memories"]) == []
+    assert services.graph.related("u1", "JEE exam stress") == []
+
+    services.store.upsert("u1", {"facts": ["Has a dog named Bruno"]})
+    response = client.post("/extract", json=request).json()
+    assert response["status"] == "failed"
+    assert items(response["memories"]) == ["Has a dog named Bruno"]
+
+    # Streams end with the error instead of sample items
+    response = client.post("/extract", json=dict(request, wait=False, stream=True))
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events and all("category" not in event for event in events)
+    assert "error" in events[-1]
+
+    fake_client.backend.error_rate = 0.0
+    response = client.post("/extract", json=request).json()
+    assert response["status"] == "done" and len(items(response["memories"])) > 1
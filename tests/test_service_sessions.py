@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import service  # noqa: E402
+from companion import CompanionServices  # noqa: E402
+from engines import SAMPLE_CONVERSATIONS  # noqa: E402
+
+
+@pytest.fixture
+def services(tmp_path, fake_client, monkeypatch):
+    env = {"MEMORY_DB_PATH": str(tmp_path / "memory.db")}
+    instance = CompanionServices(env, client=fake_client)
+    monkeypatch.setattr(service, "services", instance)
+    yield instance
+    instance.worker.shutdown()
+
+
+@pytest.fixture
+def client(services):
+    return TestClient(service.app)
+
+
+def count(memories):
+    return sum(len(items) for items in memories.values())
+
+
+def test_session_requests_keep_memories_from_explicit_extraction(client, services):
+    response = client.post("/extract", json={"user_id": "u1", "conversations": SAMPLE_CONVERSATIONS, "wait": True})
+    extracted = count(response.json()["memories"])
+    assert extracted > 0
+    assert services.store.get_cursor("u1") == len(SAMPLE_CONVERSATIONS)
+
+    for message in ("hello", "how do I revise calculus?"):
+        assert client.post("/generate", json={"user_id": "u1", "message": message}).status_code == 200
+        assert services.worker.wait("u1", 10)
+
+    assert count(services.store.get("u1")) >= extracted
+    assert len(services.sessions.conversations("u1")) == len(SAMPLE_CONVERSATIONS) + 4
+
+
+def test_failed_replies_are_not_added_to_the_session(client, services, fake_client):
+    fake_client.backend.error_rate = 1.0
+    response = client.post("/generate", json={"user_id": "u1", "message": "hi"})
+    assert response.json()["response"].startswith("Error generating response")
+    client.post("/generate", json={"user_id": "u1", "message": "hi", "stream": True})
+    assert services.sessions.conversations("u1") == []
+
+    fake_client.backend.error_rate = 0.0
+    client.post("/generate", json={"user_id": "u1", "message": "hi", "stream": True})
+    assert [turn["role"] for turn in services.sessions.conversations("u1")] == ["user", "assistant"]
+
+
+def test_memory_edits_reach_other_workers(tmp_path, fake_client, services):
+    # A second process over the same database, as with `uvicorn --workers`
+    other = CompanionServices({"MEMORY_DB_PATH": str(tmp_path / "memory.db")}, client=fake_client)
+    assert other.memory_context("u1", "how is my dog?") == ""
+
+    memories = services.store.upsert("u1", {"facts": ["Has a dog named Bruno"]})
+    services.publish_memories("u1", memories)
+
+    assert "Bruno" in other.memory_context("u1", "how is my dog?")
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from memory_store import SQLiteMemoryStore
+from metrics import MetricsRegistry
+from sessions import SessionManager
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteMemoryStore(str(tmp_path / "memory.db"))
+
+
+def test_evicted_sessions_spill_and_reload(store, make_conversation):
+    evicted = []
+    sessions = SessionManager(store, max_bytes=4096, metrics=MetricsRegistry(), on_evict=evicted.append)
+    for user in range(10):
+        sessions.extend(f"u{user}", make_conversation(6, prefix=f"user {user}"))
+
+    stats = sessions.stats()
+    assert stats["bytes"] <= 4096 or stats["sessions"] == 1
+    assert stats["evictions"] > 0
+    assert "u0" in evicted
+    assert store.get_conversation("u0") == make_conversation(6, prefix="user 0")
+
+    assert sessions.conversations("u0") == make_conversation(6, prefix="user 0")
+    assert sessions.stats()["loads"] >= 1
+
+
+def test_only_unsaved_turns_are_spilled(store, make_conversation):
+    sessions = SessionManager(store, metrics=MetricsRegistry())
+    sessions.extend("u", make_conversation(4))
+    sessions.flush()
+    sessions.append("u", "user", "one more")
+    sessions.flush()
+    sessions.flush()
+
+    assert sessions.stats()["spills"] == 2
+    assert store.get_conversation("u")[-1] == {"role": "user", "content": "one more"}
+    assert SessionManager(store).conversations("u") == make_conversation(4) + [{"role": "user", "content": "one more"}]
+
+
+def test_sync_replaces_the_differing_suffix(store, make_conversation):
+    sessions = SessionManager(store, metrics=MetricsRegistry())
+    history = make_conversation(6)
+    sessions.sync("u", history)
+    sessions.flush()
+
+    edited = history[:3] + [{"role": "assistant", "content": "edited"}]
+    sessions.sync("u", edited)
+    assert sessions.conversations("u") == edited
+    sessions.flush()
+    assert store.get_conversation("u") == edited
+
+    # A pure truncation is written through as well
+    sessions.sync("u", edited[:2])
+    sessions.flush()
+    assert store.get_conversation("u") == edited[:2]
+
+
+def test_idle_sessions_are_evicted(store, make_conversation):
+    sessions = SessionManager(store, idle_seconds=0.05, metrics=MetricsRegistry())
+    sessions.extend("u", make_conversation(2))
+    time.sleep(0.1)
+
+    assert sessions.evict_idle() == 1
+    assert sessions.stats()["sessions"] == 0
+    assert store.get_conversation("u") == make_conversation(2)
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+
+import startup
+from companion import CompanionServices
+from startup import APP_MODULES, StartupTimer
+
+HEAVY_MODULES = ("numpy", "openai", "httpx", "tiktoken", "retrieval", "yaml")
+
+
+def test_importing_the_app_leaves_heavy_modules_unloaded():
+    code = f"import sys, {', '.join(APP_MODULES)}; print([name for name in {HEAVY_MODULES!r} if name in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(startup.__file__))
+    assert result.stdout.strip() == "[]"
+
+
+def test_services_build_nothing_until_used(tmp_path, fake_client):
+    path = tmp_path / "memory.db"
+    services = CompanionServices({"MEMORY_DB_PATH": str(path)}, client=fake_client)
+    services.close()
+
+    assert set(services._resources) == {"client"} and not path.exists()
+
+    services.engine
+    assert "store" not in services._resources and "retriever" not in services._resources
+
+    services.extractor
+    assert "store" in services._resources and not path.exists()
+    assert services.extractor is services.extractor
+
+    # The SQLite file is opened on the first query
+    services.store.get("u")
+    assert path.exists()
+
+
+def test_timer_keeps_the_first_mark_of_each_name():
+    timer = StartupTimer(start=0.0)
+    first = timer.mark("ready")
+
+    assert timer.mark("ready") == first and list(timer.report()) == ["ready"]
+
+
+def test_import_times_report_the_requested_modules():
+    report = startup.import_times(["json"], top=3)
+
+    assert set(report["modules"]) == {"json"} and report["total_ms"] > 0
+    assert len(report["heaviest"]) <= 3
+
+
+def test_cold_start_probe_reaches_every_milestone():
+    result = subprocess.run([sys.executable, startup.__file__, "--probe"], capture_output=True, text=True, check=True)
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert list(marks) == ["import_app", "engines_built", "first_prompt", "first_context", "first_response"]
+    assert marks["first_response"] >= marks["import_app"]
@@ -0,0 +1,84 @@
+from llm_cache import ResponseCache
+from metrics import MetricsRegistry
+from summarizer import ConversationSummarizer
+
+S = ConversationSummarizer
+
+
+def summarizer_for(client, **options):
+    return ConversationSummarizer(client, "gpt-4", metrics=MetricsRegistry(), **options)
+
+
+def test_recent_turns_are_not_summarized(fake_client, make_conversation):
+    summarizer = summarizer_for(fake_client)
+    state = summarizer.update("u", make_conversation(S.RECENT_TURNS + S.CHUNK_TURNS - 1))
+
+    assert state == {"cursor": 0, "chunks": [], "session": ""}
+    assert fake_client.backend.calls == 0
+    assert summarizer.store.get_summary("u") is None
+
+
+def test_each_aged_out_chunk_costs_one_call(fake_client, make_conversation):
+    summarizer = summarizer_for(fake_client)
+    messages = make_conversation(S.RECENT_TURNS + 2 * S.CHUNK_TURNS)
+
+    state = summarizer.update("u", messages)
+    assert state["cursor"] == 2 * S.CHUNK_TURNS and len(state["chunks"]) == 2
+    assert fake_client.backend.calls == 2
+
+    # Nothing new aged out, so nothing is summarized again
+    summarizer.update("u", messages + make_conversation(2, "extra"))
+    assert fake_client.backend.calls == 2
+    assert summarizer.store.get_summary("u")["cursor"] == 2 * S.CHUNK_TURNS
+
+
+def test_old_chunks_fold_into_the_session_summary(fake_client, make_conversation):
+    summarizer = summarizer_for(fake_client)
+    state = summarizer.update("u", make_conversation(S.RECENT_TURNS + (S.MAX_CHUNKS + 1) * S.CHUNK_TURNS))
+
+    assert state["session"] and len(state["chunks"]) == S.MAX_CHUNKS // 2
+    assert fake_client.backend.calls == S.MAX_CHUNKS + 2
+
+
+def test_history_block_makes_no_calls_and_keeps_unsummarized_turns(fake_client, make_conversation):
+    summarizer = summarizer_for(fake_client)
+    messages = make_conversation(S.RECENT_TURNS + S.CHUNK_TURNS + 4)
+    summarizer.update("u", messages)
+    calls = fake_client.backend.calls
+
+    block = summarizer.history_block("u", messages)
+
+    assert fake_client.backend.calls == calls
+    assert block.startswith("More recently:\n- ")
+    assert f"User: message number {S.CHUNK_TURNS} of the chat" in block
+    assert f"You: message number {len(messages) - 1} of the chat" in block
+    assert "message number 0 of the chat" not in block
+
+
+def test_replaced_history_starts_over(fake_client, make_conversation):
+    summarizer = summarizer_for(fake_client)
+    summarizer.update("u", make_conversation(S.RECENT_TURNS + S.CHUNK_TURNS))
+
+    short = make_conversation(4, "fresh")
+    assert summarizer.history_block("u", short) == "Latest turns:\n" + "\n".join(
+        f"{'User' if index % 2 == 0 else 'You'}: fresh number {index} of the chat" for index in range(4))
+    assert summarizer.update("u", short)["chunks"] == []
+
+
+def test_failed_call_keeps_a_truncated_excerpt_of_the_user_lines(fake_client, make_conversation):
+    fake_client.backend.error_rate = 1.0
+    summarizer = summarizer_for(fake_client)
+
+    chunk = summarizer.update("u", make_conversation(S.RECENT_TURNS + S.CHUNK_TURNS))["chunks"][0]
+
+    assert chunk.startswith("User: message number 0 of the chat / User: message number 2")
+    assert "Bot:" not in chunk
+
+
+def test_summaries_are_cached(fake_client, make_conversation):
+    cache = ResponseCache()
+    messages = make_conversation(S.RECENT_TURNS + S.CHUNK_TURNS)
+    summarizer_for(fake_client, cache=cache).update("u", messages)
+    summarizer_for(fake_client, cache=cache).update("other", messages)
+
+    assert fake_client.backend.calls == 1 and cache.stats()["hits"] == 1